@@ -4,12 +4,21 @@
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
 import abc
-import glob
+import asyncio
+import contextlib
+import email
+import email.generator
+import fcntl
+import itertools
+import json
 import logging
 import mailbox
 import operator
 import os
 import re
+import socket
+import tempfile
+import time
 
 from .helper import call_cmd_async
 from .helper import split_commandstring
@@ -152,6 +161,44 @@ class Address:
                      self.case_sensitive))
 
 
+_maildir_counter = itertools.count()
+_hostname = socket.gethostname().replace('/', r'\057').replace(':', r'\072')
+
+
+def _add_to_maildir(mbx, mail):
+    """
+    add `mail` to the maildir `mbx`, flagged as seen. This does what
+    :meth:`mailbox.Maildir.add` does, but returns the path of the new file.
+
+    :param mbx: maildir to add the mail to
+    :type mbx: :class:`mailbox.Maildir`
+    :param mail: the mail to store
+    :type mail: :class:`email.message.Message` or str
+    :returns: absolute path of the new file
+    :rtype: str
+    """
+    if not isinstance(mail, email.message.Message):
+        mail = email.message_from_string(mail)
+    now = time.time()
+    name = '%d.M%dP%dQ%d.%s' % (now, now % 1 * 1e6, os.getpid(),
+                                next(_maildir_counter), _hostname)
+    tmp = os.path.join(mbx._path, 'tmp', name)
+    path = os.path.join(mbx._path, 'new', name + mbx.colon + '2,S')
+    try:
+        with open(tmp, 'xb') as f:
+            email.generator.BytesGenerator(f, False, 0).flatten(mail)
+        try:
+            os.link(tmp, path)
+            os.remove(tmp)
+        except (AttributeError, PermissionError):
+            os.rename(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    return path
+
+
 class SendingMailFailed(RuntimeError):
     pass
 
@@ -194,6 +241,8 @@ class Account:
     abook = None
     """addressbook (:class:`addressbook.AddressBook`)
        managing this accounts contacts"""
+    send_concurrency = 1
+    """number of mails the :class:`Outbox` sends at the same time"""
 
     def __init__(self, address=None, aliases=None, alias_regexp=None,
                  realname=None, gpg_key=None, signature=None,
@@ -202,7 +251,7 @@ class Account:
                  draft_tags=None, replied_tags=None, passed_tags=None,
                  abook=None, sign_by_default=False,
                  encrypt_by_default="none", encrypt_to_self=None,
-                 message_id_domain=None,
+                 message_id_domain=None, send_concurrency=1,
                  case_sensitive_username=False, **_):
         self.address = Address.from_string(
             address, case_sensitive=case_sensitive_username)
@@ -225,6 +274,7 @@ class Account:
         self.passed_tags = passed_tags
         self.abook = abook
         self.message_id_domain = message_id_domain
+        self.send_concurrency = send_concurrency
         # Handle encrypt_by_default in an backwards compatible way.  The
         # logging info call can later be upgraded to warning or error.
         encrypt_by_default = encrypt_by_default.lower()
@@ -276,34 +326,45 @@ class Account:
         if not isinstance(mbx, mailbox.Mailbox):
             logging.debug('Not a mailbox')
             return False
+        return Account.store_mails(mbx, [mail])[0]
 
-        mbx.lock()
-        if isinstance(mbx, mailbox.Maildir):
-            logging.debug('Maildir')
-            msg = mailbox.MaildirMessage(mail)
-            msg.set_flags('S')
-        else:
-            logging.debug('no Maildir')
-            msg = mailbox.Message(mail)
+    @staticmethod
+    def store_mails(mbx, mails):
+        """
+        stores given mails in mailbox, like :meth:`store_mail`.
+        Mails are written to a maildir directly, so that the paths of the new
+        files are known without listing the maildir. Other mailboxes are
+        locked and flushed only once for all mails.
+
+        :param mbx: mailbox to use
+        :type mbx: :class:`mailbox.Mailbox`
+        :param mails: the mails to store
+        :type mails: list of :class:`email.message.Message` or str
+        :returns: absolute paths of the mail-files for Maildir, a list of
+                  None otherwise
+        :rtype: list of str or None
+        :raises: StoreMailError
+        """
+        if not isinstance(mbx, mailbox.Mailbox):
+            logging.debug('Not a mailbox')
+            return [None] * len(mails)
 
         try:
-            message_id = mbx.add(msg)
-            mbx.flush()
-            mbx.unlock()
-            logging.debug('got mailbox msg id : %s', message_id)
+            if isinstance(mbx, mailbox.Maildir):
+                paths = [_add_to_maildir(mbx, mail) for mail in mails]
+                logging.debug('paths of saved msgs: %s', paths)
+                return paths
+            mbx.lock()
+            try:
+                for mail in mails:
+                    message_id = mbx.add(mailbox.Message(mail))
+                    logging.debug('got mailbox msg id : %s', message_id)
+                mbx.flush()
+            finally:
+                mbx.unlock()
         except Exception as e:
             raise StoreMailError(e)
-
-        path = None
-        # add new Maildir message to index and add tags
-        if isinstance(mbx, mailbox.Maildir):
-            # this is a dirty hack to get the path to the newly added file
-            # I wish the mailbox module were more helpful...
-            plist = glob.glob(os.path.join(mbx._path, 'new', message_id + '*'))
-            if plist:
-                path = plist[0]
-                logging.debug('path of saved msg: %s', path)
-        return path
+        return [None] * len(mails)
 
     def store_sent_mail(self, mail):
         """
@@ -313,6 +374,15 @@ class Account:
         if self.sent_box is not None:
             return self.store_mail(self.sent_box, mail)
 
+    def store_sent_mails(self, mails):
+        """
+        stores mails (:class:`email.message.Message` or str) in send-store if
+        :attr:`sent_box` is set, see :meth:`store_mails`.
+        """
+        if self.sent_box is not None:
+            return self.store_mails(self.sent_box, mails)
+        return [None] * len(mails)
+
     def store_draft_mail(self, mail):
         """
         stores mail (:class:`email.message.Message` or str) as draft if
@@ -366,3 +436,238 @@ class SendmailAccount(Account):
             raise SendingMailFailed(str(e))
         logging.info('sent mail successfully')
         logging.info(out)
+
+
+class Outbox:
+    """
+    Persistent queue of outgoing mails that are sent in the background.
+
+    Every mail is kept as a file in the queue directory until it has been
+    sent, so that mails that could not be sent before alot was closed are
+    sent in the next session. Each account sends at most
+    :attr:`Account.send_concurrency` mails at the same time, and sending a
+    mail is retried with exponentially growing delays.
+
+    A queued mail is locked while it is being sent, so that several alot
+    instances can share the queue directory without sending a mail twice.
+    """
+
+    def __init__(self, path, retries=5, retry_delay=30, sent=None,
+                 failed=None, changed=None):
+        """
+        :param path: directory to keep queued mails in
+        :type path: str
+        :param retries: how often sending a mail is retried before giving up
+        :type retries: int
+        :param retry_delay: seconds to wait before the first retry, doubled
+                            for every further retry
+        :type retry_delay: float
+        :param sent: coroutine function called with the account, the mail and
+                     the tags to index it with, once a mail has been sent
+        :type sent: callable
+        :param failed: called with the account and the error once sending a
+                       mail was given up on
+        :type failed: callable
+        :param changed: called whenever the state of the queue changed
+        :type changed: callable
+        """
+        self.path = path
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.sent = sent
+        self.failed = failed
+        self.changed = changed
+        # names of queued mails that are currently handed to their account
+        self.sending = set()
+        # error messages of the mails given up on, by name
+        self.given_up = {}
+        # tasks sending the queued mails, by name
+        self._tasks = {}
+        # locked files of the queued mails, by name
+        self._claims = {}
+        # limit of concurrently sent mails, per account
+        self._limits = {}
+
+    def __len__(self):
+        return len(self._tasks) + len(self.given_up)
+
+    def status(self):
+        """
+        returns a short description of the queue, for the statusbar,
+        or an empty string if the queue is empty.
+
+        :rtype: str
+        """
+        if not len(self):
+            return ''
+        status = 'outbox: %d queued' % len(self._tasks)
+        if self.sending:
+            status += ', %d sending' % len(self.sending)
+        if self.given_up:
+            status += ', %d failed' % len(self.given_up)
+        return status
+
+    def _filename(self, name):
+        return os.path.join(self.path, name + '.json')
+
+    def _claim(self, name):
+        """
+        lock the file of the queued mail `name`, so that no other alot
+        instance sends it.
+
+        :returns: the locked file, or None if the mail is being sent by
+                  another instance or has been sent already
+        :rtype: file
+        """
+        path = self._filename(name)
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # the mail may have been sent and its file removed in between
+            if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def enqueue(self, account, mail, tags=(), afterwards=None):
+        """
+        store `mail` in the queue and send it in the background.
+
+        :param account: the account to send the mail with
+        :type account: :class:`Account`
+        :param mail: the mail to send
+        :type mail: :class:`email.message.Message` or str
+        :param tags: tags to index the sent mail with, in addition to the
+                     :attr:`~Account.sent_tags` of the account
+        :type tags: list of str
+        :param afterwards: called once the mail has been sent
+        :type afterwards: callable
+        :returns: the task that sends the mail
+        :rtype: asyncio.Task
+        :raises: StoreMailError
+        """
+        mail = str(mail)
+        entry = {'account': str(account.address), 'mail': mail,
+                 'tags': list(tags)}
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+        except OSError as e:
+            raise StoreMailError(e)
+        claim = os.fdopen(fd, 'w')
+        try:
+            fcntl.flock(claim, fcntl.LOCK_EX)
+            json.dump(entry, claim)
+            claim.flush()
+            name = os.path.basename(tmp)[:-len('.tmp')]
+            os.replace(tmp, self._filename(name))
+        except OSError as e:
+            claim.close()
+            raise StoreMailError(e)
+        return self._start(name, claim, account, mail, entry['tags'],
+                           afterwards)
+
+    async def resume(self, lookup):
+        """
+        send all mails in the queue directory that are not being sent yet,
+        like those left over from the last session or those given up on.
+
+        :param lookup: returns the account to send with, given the address
+                       a mail was queued for, or None if it is not known
+        :type lookup: callable
+        """
+        self.given_up = {}
+        try:
+            filenames = sorted(os.listdir(self.path))
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            name, ext = os.path.splitext(filename)
+            if ext != '.json' or name in self._tasks:
+                continue
+            claim = self._claim(name)
+            if claim is None:
+                continue
+            try:
+                entry = json.load(claim)
+                address, mail, tags = \
+                    entry['account'], entry['mail'], entry['tags']
+            except (OSError, ValueError, KeyError):
+                logging.exception('cannot read queued mail %s', filename)
+                claim.close()
+                continue
+            account = lookup(address)
+            if account is None:
+                logging.error('no account to send queued mail %s from %s',
+                              filename, address)
+                self.given_up[name] = 'unknown account %s' % address
+                claim.close()
+                continue
+            self._start(name, claim, account, mail, tags)
+        self._changed()
+
+    def _start(self, name, claim, account, mail, tags, afterwards=None):
+        task = asyncio.ensure_future(
+            self._deliver(name, account, mail, tags, afterwards))
+        self._tasks[name] = task
+        self._claims[name] = claim
+        self._changed()
+        return task
+
+    def _changed(self):
+        if self.changed is not None:
+            self.changed()
+
+    async def _deliver(self, name, account, mail, tags, afterwards):
+        """send a queued mail, retrying until it is sent or given up on"""
+        limit = self._limits.get(account)
+        if limit is None:
+            limit = self._limits[account] = \
+                asyncio.Semaphore(account.send_concurrency)
+        error = None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                async with limit:
+                    self.sending.add(name)
+                    self._changed()
+                    try:
+                        await account.send_mail(mail)
+                        error = None
+                    except SendingMailFailed as e:
+                        error = e
+                        logging.warning('sending queued mail %s failed '
+                                        '(attempt %d)', name, attempt + 1)
+                        continue
+                    except Exception as e:
+                        # not worth retrying
+                        error = e
+                        logging.exception('cannot send queued mail %s', name)
+                    finally:
+                        self.sending.discard(name)
+                break
+            if error is not None:
+                self.given_up[name] = str(error)
+                if self.failed is not None:
+                    self.failed(account, error)
+                return
+            try:
+                os.remove(self._filename(name))
+            except OSError:
+                logging.exception('cannot remove sent mail %s from the '
+                                  'outbox', name)
+        finally:
+            # mails given up on are left to be claimed again by resume
+            self._claims.pop(name).close()
+            del self._tasks[name]
+            self._changed()
+        if afterwards is not None:
+            afterwards()
+        if self.sent is not None:
+            await self.sent(account, mail, tags)
@@ -1,6 +1,10 @@
 # Copyright (C) 2011-2018  Patrick Totzke <patricktotzke@gmail.com>
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
+import asyncio
+import concurrent.futures
+import logging
+
 import urwid
 from notmuch2 import NotmuchError
 
@@ -27,12 +31,35 @@ class SearchBuffer(Buffer):
         default_limit = settings.get('search_threads_limit')
         self.limit = limit if limit is not None else default_limit
         self.result_count = 0
+        # number of matching messages per thread id in the result list
+        self._matched = {}
+        # ids of threads in _matched that do not match the query any more.
+        # They cannot be deleted from _matched, which the threadlist may
+        # still be iterating over, so the threadlist skips them instead
+        self._removed = set()
+        # ids of modified threads that need to be reconciled
+        self._unreconciled = set()
+        # threadline theming queries matched, per thread id
+        self._theming_matches = {}
+        # thread ids of the result list in order, and their positions in it,
+        # built on first use by _lookup_theming_matches
+        self._order = None
+        self._positions = None
+        # ids of marked threads, that batch commands act upon
+        self.marked = set()
+        # thread marked or unmarked last, where ranges of marks start
+        self._mark_anchor = None
         self.search_threads_rebuild_limit = \
             settings.get('search_threads_rebuild_limit')
         self.search_threads_move_last_limit = \
             settings.get('search_threads_move_last_limit')
         self.isinitialized = False
         self.threadlist = None
+        # state of the search-as-you-type preview, see :meth:`preview`
+        self._preview_executor = None
+        self._preview_future = None
+        self._preview_generation = 0
+        self._redraw_pending = False
         self.rebuild()
         Buffer.__init__(self, ui, self.body)
 
@@ -62,7 +89,7 @@ class SearchBuffer(Buffer):
             selected_thread = self.get_selected_thread()
 
         try:
-            threads, self.result_count = self.dbman.get_threads(
+            self._matched = self.dbman.get_thread_match_counts(
                 self.querystring, order, self.limit)
         except NotmuchError:
             self.ui.notify('malformed query string: %s' % self.querystring,
@@ -70,9 +97,18 @@ class SearchBuffer(Buffer):
             self.listbox = urwid.ListBox([])
             self.body = self.listbox
             return
+        self.result_count = sum(self._matched.values())
+        self._removed = set()
+        self._unreconciled = set()
+        self._theming_matches = {}
+        self._order = None
+        self.marked.intersection_update(self._matched)
 
-        self.threadlist = IterableWalker(threads, ThreadlineWidget,
+        self.threadlist = IterableWalker(self._listed(), ThreadlineWidget,
                                          dbman=self.dbman,
+                                         matches=self._thread_matches,
+                                         redraw=self._redraw,
+                                         is_marked=self.is_marked,
                                          reverse=reverse)
 
         self.listbox = urwid.ListBox(self.threadlist)
@@ -81,6 +117,286 @@ class SearchBuffer(Buffer):
         if selected_thread:
             self.focus_thread(selected_thread)
 
+    async def preview(self, querystring, page_size):
+        """
+        show the first results for `querystring` without blocking the UI.
+
+        The notmuch queries run on a worker thread. Starting a new preview
+        cancels any preview that has not yet started and makes the results
+        of one that is still running obsolete, so that only the most recent
+        querystring ends up being displayed.
+
+        :param querystring: the query to preview
+        :type querystring: str
+        :param page_size: number of threads to look up
+        :type page_size: int
+        :returns: True if the results for `querystring` are now displayed
+        :rtype: bool
+        """
+        self._preview_generation += 1
+        generation = self._preview_generation
+        if self._preview_future is not None:
+            self._preview_future.cancel()
+        if self._preview_executor is None:
+            self._preview_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='alot-search-preview')
+
+        def lookup():
+            threads = self.dbman.get_thread_match_counts(
+                querystring, self.sort_order, page_size)
+            if generation != self._preview_generation:
+                return None
+            return threads, self.dbman.count_messages(querystring)
+
+        loop = asyncio.get_event_loop()
+        self._preview_future = loop.run_in_executor(self._preview_executor,
+                                                    lookup)
+        try:
+            result = await self._preview_future
+        except (asyncio.CancelledError, NotmuchError):
+            return False
+        if result is None or generation != self._preview_generation:
+            return False
+
+        self._matched, self.result_count = result
+        self._removed = set()
+        self._unreconciled = set()
+        self._theming_matches = {}
+        self._order = None
+        self.querystring = querystring
+        self.reversed = False
+        self.threadlist = IterableWalker(self._listed(), ThreadlineWidget,
+                                         dbman=self.dbman,
+                                         matches=self._thread_matches,
+                                         redraw=self._redraw,
+                                         is_marked=self.is_marked)
+        self.listbox = urwid.ListBox(self.threadlist)
+        self.body = self.listbox
+        return True
+
+    def _listed(self):
+        """yield the ids of the threads in the result list"""
+        for tid in self._matched:
+            if tid not in self._removed:
+                yield tid
+
+    def cancel_preview(self):
+        """discard the results of all pending or running previews"""
+        self._preview_generation += 1
+        if self._preview_future is not None:
+            self._preview_future.cancel()
+            self._preview_future = None
+
+    def cleanup(self):
+        self.cancel_preview()
+        if self._preview_executor is not None:
+            self._preview_executor.shutdown(wait=False)
+            self._preview_executor = None
+
+    def _redraw(self):
+        """
+        redraw the screen once control returns to the mainloop, after
+        threadlines have been updated in the background
+        """
+        if not self._redraw_pending:
+            self._redraw_pending = True
+
+            def redraw(*_):
+                self._redraw_pending = False
+                self.ui.update()
+            self.ui.mainloop.set_alarm_in(0, redraw)
+
+    def schedule_reconcile(self, tids):
+        """
+        remember that the threads with ids `tids` have been modified and
+        :meth:`reconcile` them once control returns to the mainloop.
+        Threads modified in the meantime are reconciled together.
+
+        :param tids: ids of modified threads
+        :type tids: iterable of str
+        """
+        if not self._unreconciled:
+            self.ui.mainloop.set_alarm_in(0, lambda *_: self.reconcile())
+        self._unreconciled.update(tids)
+
+    def reconcile(self, tids=()):
+        """
+        update the result list after threads have been modified.
+        Threads that do not match the query any more are removed, the lines
+        of all other modified threads are rebuilt and the result count is
+        adjusted accordingly. A single query is used for all threads.
+
+        :param tids: ids of modified threads, in addition to those passed to
+                     :meth:`schedule_reconcile`
+        :type tids: iterable of str
+        """
+        tids = self._unreconciled.union(tids)
+        self._unreconciled = set()
+        if not tids or self.threadlist is None:
+            return
+        query = '(%s) AND (%s)' % (self.querystring,
+                                   ' OR '.join('thread:' + t for t in tids))
+        try:
+            matched = self.dbman.get_thread_match_counts(query, 'unsorted')
+        except NotmuchError:
+            logging.exception('could not reconcile threads %s', tids)
+            return
+
+        for tid in tids:
+            self._theming_matches.pop(tid, None)
+        for threadline in list(self.threadlist.get_lines()):
+            if threadline.tid in tids:
+                if threadline.tid in matched:
+                    threadline.rebuild()
+                else:
+                    logging.debug('remove thread from result list: %s',
+                                  threadline.tid)
+                    self.threadlist.remove(threadline)
+        for tid in tids:
+            if tid in self._removed:
+                continue
+            self.result_count += matched.get(tid, 0) - self._matched.get(tid, 0)
+            if tid in matched:
+                if tid in self._matched:
+                    self._matched[tid] = matched[tid]
+            elif tid in self._matched:
+                self._matched[tid] = 0
+                self._removed.add(tid)
+                self.marked.discard(tid)
+        self.ui.update()
+
+    def is_marked(self, tid):
+        """returns True if the thread with id `tid` is marked"""
+        return tid in self.marked
+
+    def marked_query(self):
+        """
+        returns a query for all messages of the marked threads,
+        or None if no thread is marked.
+
+        :rtype: str
+        """
+        if not self.marked:
+            return None
+        return ' OR '.join('thread:' + t for t in sorted(self.marked))
+
+    def set_marks(self, tids, marked=True):
+        """
+        mark or unmark threads and redraw their lines.
+
+        :param tids: ids of the threads to (un)mark
+        :type tids: iterable of str
+        :param marked: mark the threads if True, unmark them otherwise
+        :type marked: bool
+        """
+        tids = set(tids)
+        changed = tids - self.marked if marked else tids & self.marked
+        if marked:
+            self.marked.update(changed)
+        else:
+            self.marked.difference_update(changed)
+        if changed and self.threadlist is not None:
+            for threadline in self.threadlist.get_lines():
+                if threadline.tid in changed:
+                    threadline.rebuild()
+
+    def toggle_mark(self, tid):
+        """
+        mark the thread with id `tid` if it is not marked and unmark it
+        otherwise. This thread is where the next range of marks starts.
+
+        :param tid: id of the thread
+        :type tid: str
+        """
+        self.set_marks([tid], not self.is_marked(tid))
+        self._mark_anchor = tid
+
+    def mark_range(self, marked=True):
+        """
+        mark or unmark all threads from the one marked or unmarked last up
+        to the selected one. Without such a thread, only the selected thread
+        is (un)marked.
+
+        :param marked: mark the threads if True, unmark them otherwise
+        :type marked: bool
+        """
+        selected = self.get_selected_threadline()
+        if selected is None:
+            return
+        tids = [t.tid for t in self.threadlist.get_lines()]
+        end = tids.index(selected.tid)
+        start = end
+        if self._mark_anchor in tids:
+            start = tids.index(self._mark_anchor)
+        if start > end:
+            start, end = end, start
+        self.set_marks(tids[start:end + 1], marked)
+        self._mark_anchor = selected.tid
+
+    def mark_matching(self, query, marked=True):
+        """
+        mark or unmark all threads in the result list that contain messages
+        matching `query`, using a single lookup.
+
+        :param query: notmuch query the threads are restricted to
+        :type query: str
+        :param marked: mark the threads if True, unmark them otherwise
+        :type marked: bool
+        :returns: the number of threads that matched
+        :rtype: int
+        """
+        try:
+            matching = self.dbman.get_thread_match_counts(
+                '(%s) AND (%s)' % (self.querystring, query), 'unsorted')
+        except NotmuchError:
+            self.ui.notify('malformed query string: %s' % query, 'error')
+            return 0
+        tids = [t for t in matching
+                if t in self._matched and t not in self._removed]
+        self.set_marks(tids, marked)
+        return len(tids)
+
+    def _thread_matches(self, thread, query):
+        """
+        decide if `thread` matches `query` of a threadline theming rule.
+        Instead of asking for each thread and rule individually, this looks
+        up the matching threads of the next page of results once per rule.
+        """
+        tid = thread.get_thread_id()
+        if tid not in self._theming_matches:
+            self._lookup_theming_matches(tid)
+        return query in self._theming_matches.get(tid, ())
+
+    def _lookup_theming_matches(self, tid):
+        # the threads following tid in the result list that are not known yet
+        page_size = max(self.ui.mainloop.screen.get_cols_rows()[1], 1)
+        page = [tid]
+        if self._order is None:
+            self._order = list(self._matched)
+            self._positions = {t: i for i, t in enumerate(self._order)}
+        start = self._positions.get(tid, len(self._order))
+        for pos in range(start + 1, len(self._order)):
+            if len(page) >= page_size:
+                break
+            other = self._order[pos]
+            if other not in self._theming_matches \
+                    and other not in self._removed:
+                page.append(other)
+        for t in page:
+            self._theming_matches[t] = set()
+
+        threads = ' OR '.join('thread:' + t for t in page)
+        for query in settings.get_threadline_queries():
+            try:
+                matching = self.dbman.get_thread_match_counts(
+                    '(%s) AND (%s)' % (query, threads), 'unsorted')
+            except NotmuchError:
+                logging.exception('malformed threadline query: %s', query)
+                continue
+            for t in matching:
+                if t in self._theming_matches:
+                    self._theming_matches[t].add(query)
+
     def get_selected_threadline(self):
         """
         returns curently focussed :class:`alot.widgets.ThreadlineWidget`
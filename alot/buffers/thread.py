@@ -3,6 +3,8 @@
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
 import asyncio
+import concurrent.futures
+import functools
 import urwid
 import logging
 from urwidtrees import ArrowTree, TreeBox, NestedTree
@@ -12,6 +14,7 @@ from ..settings.const import settings
 from ..widgets.thread import ThreadTree
 from .. import commands
 from ..db.errors import NonexistantObjectError
+from ..db.message import Message
 
 
 class ThreadBuffer(Buffer):
@@ -32,8 +35,21 @@ class ThreadBuffer(Buffer):
         # two semaphores for auto-removal of unread tag
         self._auto_unread_dont_touch_mids = set([])
         self._auto_unread_writing = False
+        # unread messages focussed since the last write, see flush_unread()
+        self._auto_unread_batch = []
+        self._auto_unread_alarm = None
+
+        # message trees to unfold once their message has been parsed
+        self._pending_unfold = set()
+        self._parse_executor = None
+        self._refresh_pending = False
 
         self._indent_width = settings.get('thread_indent_replies')
+        self._tree = None
+        # ids of matching messages by query, see get_matching_mids(), and
+        # the number of writes to the index they were looked up after
+        self._matching_mids = {}
+        self._matching_writes = None
         self.rebuild()
         Buffer.__init__(self, ui, self.body)
 
@@ -56,8 +72,11 @@ class ThreadBuffer(Buffer):
         info['message_count'] = self.message_count
         info['thread_tags'] = self.translated_tags_str()
         info['intersection_tags'] = self.translated_tags_str(intersection=True)
-        info['mimetype'] = (
-            self.get_selected_message().get_mime_part().get_content_type())
+        msg = self.get_selected_message()
+        # do not read the message just for the statusbar, it may still be
+        # parsed in the background
+        info['mimetype'] = (msg.get_mime_part().get_content_type()
+                            if msg.is_parsed() else '')
         return info
 
     def get_selected_thread(self):
@@ -65,6 +84,18 @@ class ThreadBuffer(Buffer):
         return self.thread
 
     def rebuild(self):
+        """
+        refresh the thread from the index and redisplay it. The
+        :class:`MessageTrees <MessageTree>` of messages that are still in the
+        thread are reused, keeping their parsed content and folding state.
+        """
+        messagetrees = None
+        focus = None
+        self._matching_mids = {}
+        if self._tree is not None:
+            messagetrees = self._tree.loaded_messagetrees()
+            if self.message_count:
+                focus = self.get_selected_mid()
         try:
             self.thread.refresh()
         except NonexistantObjectError:
@@ -72,7 +103,8 @@ class ThreadBuffer(Buffer):
             self.message_count = 0
             return
 
-        self._tree = ThreadTree(self.thread)
+        self._tree = ThreadTree(self.thread, messagetrees,
+                                self._signatures_verified)
 
         # define A to be the tree to be wrapped by a NestedTree and displayed.
         # We wrap the thread tree into an ArrowTree for decoration if
@@ -101,6 +133,9 @@ class ThreadBuffer(Buffer):
         self.body = TreeBox(self._nested_tree)
         self.message_count = self.thread.get_total_messages()
 
+        if focus is not None and self._tree[focus] is not None:
+            self.set_focus(self._sanitize_position((focus,)))
+
     def render(self, size, focus=False):
         if self.message_count == 0:
             return self.body.render(size, focus)
@@ -115,17 +150,11 @@ class ThreadBuffer(Buffer):
             if cursor_on_non_summary:
                 if mid not in self._auto_unread_dont_touch_mids:
                     if 'unread' in msg.get_tags():
-                        logging.debug('Tbuffer: removing unread')
-
-                        def clear():
-                            self._auto_unread_writing = False
-
+                        logging.debug('Tbuffer: queueing removal of unread')
                         self._auto_unread_dont_touch_mids.add(mid)
                         self._auto_unread_writing = True
-                        msg.remove_tags(['unread'], afterwards=clear)
-                        fcmd = commands.globals.FlushCommand(silent=True)
-                        asyncio.get_event_loop().create_task(
-                            self.ui.apply_command(fcmd))
+                        self._auto_unread_batch.append(msg)
+                        self._schedule_unread_flush()
                     else:
                         logging.debug('Tbuffer: No, msg not unread')
                 else:
@@ -137,6 +166,45 @@ class ThreadBuffer(Buffer):
                 logging.debug('Tbuffer: No, cursor on summary')
         return self.body.render(size, focus)
 
+    def cleanup(self):
+        self.flush_unread()
+        self._pending_unfold = set()
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(wait=False, cancel_futures=True)
+            self._parse_executor = None
+
+    def _schedule_unread_flush(self):
+        """
+        (re)start the timer after which the collected unread removals are
+        written, see :ref:`auto_remove_unread_delay <auto-remove-unread-delay>`
+        """
+        if self._auto_unread_alarm is not None:
+            self.ui.mainloop.remove_alarm(self._auto_unread_alarm)
+        self._auto_unread_alarm = self.ui.mainloop.set_alarm_in(
+            settings.get('auto_remove_unread_delay'),
+            lambda *_: self.flush_unread())
+
+    def flush_unread(self):
+        """
+        remove the 'unread' tag from all messages that have been focussed since
+        the last call, in a single write operation.
+        """
+        if self._auto_unread_alarm is not None:
+            self.ui.mainloop.remove_alarm(self._auto_unread_alarm)
+            self._auto_unread_alarm = None
+        batch, self._auto_unread_batch = self._auto_unread_batch, []
+        if not batch:
+            return
+
+        def clear():
+            self._matching_mids = {}
+            if not self._auto_unread_batch:
+                self._auto_unread_writing = False
+
+        Message.remove_tags_from_all(batch, ['unread'], afterwards=clear)
+        fcmd = commands.globals.FlushCommand(silent=True)
+        asyncio.get_event_loop().create_task(self.ui.apply_command(fcmd))
+
     def get_selected_mid(self):
         """Return Message ID of focussed message."""
         return self.body.get_focus()[1][0]
@@ -168,8 +236,19 @@ class ThreadBuffer(Buffer):
         for pos in self._tree.positions():
             yield self._tree[pos]
 
+    def loaded_messagetrees(self):
+        """
+        returns a Generator of the :class:`MessageTree` in the
+        :class:`ThreadTree` of this buffer that have been created so far,
+        e.g. because they have been displayed.
+        """
+        for pos in self._tree.positions():
+            if self._tree.is_loaded(pos):
+                yield self._tree[pos]
+
     def refresh(self):
         """Refresh and flush caches of Thread tree."""
+        self._matching_mids = {}
         self.body.refresh()
 
     # needed for ui.get_deep_focus..
@@ -279,15 +358,43 @@ class ThreadBuffer(Buffer):
                 break
             newpos = direction(newpos)
 
+    def get_matching_mids(self, querystring):
+        """
+        returns the ids of all messages in this thread that match
+        `querystring`. They are looked up with a single query and cached
+        until the thread is refreshed or anything is written to the index,
+        also from other buffers.
+
+        :param querystring: query to match
+        :type querystring: str
+        :rtype: set of str
+        """
+        writes = self.ui.dbman.writes
+        if writes != self._matching_writes:
+            self._matching_mids = {}
+            self._matching_writes = writes
+        if querystring not in self._matching_mids:
+            self._matching_mids[querystring] = \
+                self.thread.get_matching_message_ids(querystring)
+        return self._matching_mids[querystring]
+
+    def focus_matching(self, querystring, direction):
+        """walk in the given direction and focus the first matching message"""
+        matching = self.get_matching_mids(querystring)
+        newpos = direction(self.get_selected_mid())
+        while newpos is not None:
+            if newpos in matching:
+                self.set_focus(self._sanitize_position((newpos,)))
+                break
+            newpos = direction(newpos)
+
     def focus_next_matching(self, querystring):
         """focus next matching message in depth first order"""
-        self.focus_property(lambda x: x._message.matches(querystring),
-                            self._tree.next_position)
+        self.focus_matching(querystring, self._tree.next_position)
 
     def focus_prev_matching(self, querystring):
         """focus previous matching message in depth first order"""
-        self.focus_property(lambda x: x._message.matches(querystring),
-                            self._tree.prev_position)
+        self.focus_matching(querystring, self._tree.prev_position)
 
     def focus_next_unfolded(self):
         """focus next unfolded message in depth first order"""
@@ -316,12 +423,15 @@ class ThreadBuffer(Buffer):
     def collapse(self, msgpos):
         """collapse message at given position"""
         MT = self._tree[msgpos]
+        self._pending_unfold.discard(MT)
         MT.collapse(MT.root)
         self.focus_selected_message()
 
     def collapse_all(self):
         """collapse all messages in thread"""
-        for MT in self.messagetrees():
+        # messages that have not been loaded only show their summary anyway
+        self._pending_unfold = set()
+        for MT in self.loaded_messagetrees():
             MT.collapse(MT.root)
         self.focus_selected_message()
 
@@ -329,19 +439,66 @@ class ThreadBuffer(Buffer):
         """
         expand all messages that match a given querystring.
 
+        The matching messages are read and decoded by a pool of worker
+        threads, see :ref:`thread_parse_workers <thread-parse-workers>`, and
+        unfolded as soon as they are ready. Until then only their summaries
+        are shown. The first matching message gets focussed and is parsed
+        first.
+
         :param querystring: query to match
         :type querystring: str
         :param focus_first: set the focus to the first matching message
         :type focus_first: bool
         """
+        matching = self.get_matching_mids(querystring)
+        self._pending_unfold = set()
         first = None
-        for MT in self.messagetrees():
-            msg = MT._message
-            if msg.matches(querystring):
-                MT.expand(MT.root)
+        for pos in self._tree.positions():
+            if pos in matching:
+                MT = self._tree[pos]
+                self._unfold_when_parsed(MT)
                 if first is None:
-                    first = (self._tree.position_of_messagetree(MT), MT.root)
+                    first = (pos, MT.root)
                     self.set_focus(first)
-            else:
+            elif self._tree.is_loaded(pos):
+                MT = self._tree[pos]
                 MT.collapse(MT.root)
         self.body.refresh()
+
+    def _unfold_when_parsed(self, MT):
+        """parse the message of `MT` in the background, then expand it"""
+        if self._parse_executor is None:
+            self._parse_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.get('thread_parse_workers'),
+                thread_name_prefix='alot-thread-parse')
+        self._pending_unfold.add(MT)
+        future = asyncio.wrap_future(
+            self._parse_executor.submit(MT.get_message().parse))
+        future.add_done_callback(functools.partial(self._parsed, MT))
+
+    def _parsed(self, MT, future):
+        if future.cancelled() or MT not in self._pending_unfold:
+            # collapsed or rebuilt in the meantime
+            return
+        self._pending_unfold.discard(MT)
+        if future.exception() is not None:
+            logging.debug('cannot parse message in the background: %s',
+                          future.exception())
+        # expanding an unparsed message parses it (again) and reports errors
+        MT.expand(MT.root)
+        self._schedule_refresh()
+
+    def _signatures_verified(self, MT):
+        """redisplay `MT` once its signatures have been verified"""
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        """redisplay the thread from the main loop, once for many changes"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+
+            def refresh(*_):
+                self._refresh_pending = False
+                self.body.refresh()
+                self.ui.update()
+            self.ui.mainloop.set_alarm_in(0, refresh)
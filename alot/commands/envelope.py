@@ -3,10 +3,12 @@
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
 import argparse
+import asyncio
 import datetime
 import email
 import email.policy
 import fnmatch
+import functools
 import glob
 import logging
 import os
@@ -133,7 +135,7 @@ class SaveCommand(Command):
             ui.notify(msg.format(account.address), priority='error')
             return
 
-        mail = envelope.construct_mail()
+        mail = await envelope.construct_mail_async()
         # store mail locally
         path = account.store_draft_mail(
             mail.as_string(policy=email.policy.SMTP, maxheaderlen=sys.maxsize))
@@ -242,14 +244,21 @@ class SendCommand(Command):
             clearme = ui.notify('constructing mail (GPG, attachments)…',
                                 timeout=-1)
 
+            # the mail is constructed in the background, make sure it is not
+            # sent again in the meantime
+            self.envelope.sending = True
             try:
-                self.mail = self.envelope.construct_mail()
-                self.mail = self.mail.as_string(policy=email.policy.SMTP,
-                                                maxheaderlen=sys.maxsize)
+                mail = await self.envelope.construct_mail_async()
+                self.mail = await asyncio.get_event_loop().run_in_executor(
+                    None, functools.partial(mail.as_string,
+                                            policy=email.policy.SMTP,
+                                            maxheaderlen=sys.maxsize))
             except GPGProblem as e:
                 ui.clear_notify([clearme])
                 ui.notify(str(e), priority='error')
                 return
+            finally:
+                self.envelope.sending = False
 
             ui.clear_notify([clearme])
 
@@ -268,6 +277,10 @@ class SendCommand(Command):
             return
         logging.debug("ACCOUNT: \"%s\"" % account.address)
 
+        if settings.get('send_in_background'):
+            await self._enqueue(ui, account)
+            return
+
         # send out
         clearme = ui.notify('sending..', timeout=-1)
         if self.envelope is not None:
@@ -305,15 +318,61 @@ class SendCommand(Command):
                 if self.envelope.passed:
                     self.envelope.passed.add_tags(account.passed_tags)
 
-            # store mail locally
-            # This can raise StoreMailError
-            path = account.store_sent_mail(self.mail)
+            # store mail locally and add it to the index
+            await store_sent_mails(ui, account, [self.mail], initial_tags)
 
-            # add mail to index if maildir path available
-            if path is not None:
-                logging.debug('adding new mail to index')
-                ui.dbman.add_message(path, account.sent_tags + initial_tags)
-                await ui.apply_command(globals.FlushCommand())
+    async def _enqueue(self, ui, account):
+        """put the mail in the outbox, to be sent in the background"""
+        envelope = self.envelope
+        initial_tags = envelope.tags if envelope is not None else []
+
+        def sent():
+            if envelope is not None:
+                if envelope.replied:
+                    envelope.replied.add_tags(account.replied_tags)
+                if envelope.passed:
+                    envelope.passed.add_tags(account.passed_tags)
+
+        try:
+            ui.get_outbox().enqueue(account, self.mail, initial_tags,
+                                    afterwards=sent)
+        except StoreMailError as e:
+            logging.error(traceback.format_exc())
+            ui.notify('could not queue mail: {}'.format(e),
+                      priority='error', block=True)
+            return
+        if envelope is not None:
+            envelope.sent_time = datetime.datetime.now()
+        if self.envelope_buffer is not None:
+            cmd = commands.globals.BufferCloseCommand(self.envelope_buffer)
+            await ui.apply_command(cmd)
+        ui.notify('mail queued for sending')
+
+
+async def store_sent_mails(ui, account, mails, tags):
+    """
+    store sent mails in the sent box of `account` and add them to the index,
+    all in a single transaction.
+
+    :param ui: the main user interface
+    :type ui: :class:`~alot.ui.UI`
+    :param account: the account the mails were sent with
+    :type account: :class:`~alot.account.Account`
+    :param mails: the sent mails
+    :type mails: list of :class:`email.message.Message` or str
+    :param tags: tags to add in addition to the account's sent_tags
+    :type tags: list of str
+    :raises: :class:`~alot.account.StoreMailError`
+    """
+    loop = asyncio.get_event_loop()
+    paths = await loop.run_in_executor(None, account.store_sent_mails, mails)
+
+    # add mails to index if maildir paths are available
+    paths = [path for path in paths if path is not None]
+    if paths:
+        logging.debug('adding new mails to index')
+        ui.dbman.add_message(paths, account.sent_tags + tags)
+        await ui.apply_command(globals.FlushCommand())
 
 
 @registerCommand(MODE, 'edit', arguments=[
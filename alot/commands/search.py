@@ -2,8 +2,19 @@
 # Copyright © 2018 Dylan Baker
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
+import abc
 import argparse
+import asyncio
 import logging
+import mailbox
+import os
+import re
+import subprocess
+import tempfile
+import time
+
+import urwid
+from notmuch2 import NotmuchError
 
 from . import Command, registerCommand
 from .globals import PromptCommand
@@ -13,12 +24,22 @@ from .common import RetagPromptCommand
 from .. import commands
 
 from .. import buffers
+from ..completion.query import QueryCompleter
 from ..db.errors import DatabaseROError
+from ..db.utils import decrypted_message_from_bytes
+from ..db.utils import extract_body_part
+from ..db.utils import extract_headers
+from ..db.utils import get_body_part
+from ..errors import GPGProblem
+from ..helper import split_commandstring
 from ..settings.const import settings
 
 
 MODE = 'search'
 
+# lines in a message that need quoting in an mbox
+_MBOX_FROM = re.compile(rb'^From ', re.MULTILINE)
+
 
 @registerCommand(
     MODE, 'select',
@@ -108,16 +129,76 @@ class RefineCommand(Command):
             ui.notify('empty query string')
 
 
-@registerCommand(MODE, 'refineprompt')
+@registerCommand(MODE, 'refineprompt', arguments=[
+    (['--live'], {'action': 'store_true',
+                  'help': 'update the results while typing'})])
 class RefinePromptCommand(Command):
 
     """prompt to change this buffers querystring"""
     repeatable = True
 
+    def __init__(self, live=False, **kwargs):
+        """
+        :param live: show the first results of the query while it is typed
+        :type live: bool
+        """
+        self.live = live
+        Command.__init__(self, **kwargs)
+
     async def apply(self, ui):
         sbuffer = ui.current_buffer
         oldquery = sbuffer.querystring
-        return await ui.apply_command(PromptCommand('refine ' + oldquery))
+        if not self.live:
+            return await ui.apply_command(PromptCommand('refine ' + oldquery))
+
+        delay = settings.get('search_live_delay')
+        alarm = None
+        pending = oldquery
+        # set once a preview replaced the results of the original query
+        previewed = False
+        selected = sbuffer.get_selected_thread()
+
+        async def show_preview(querystring):
+            nonlocal previewed
+            # the first screenful of threads is all we need to show
+            page_size = max(ui.mainloop.screen.get_cols_rows()[1], 1)
+            if await sbuffer.preview(querystring, page_size):
+                previewed = True
+                ui.update()
+
+        def start_preview(*_):
+            nonlocal alarm
+            alarm = None
+            if pending.strip():
+                asyncio.get_event_loop().create_task(show_preview(pending))
+
+        def changed(querystring):
+            # debounce: only query once the user stopped typing for a while
+            nonlocal alarm, pending
+            pending = querystring
+            if alarm is not None:
+                ui.mainloop.remove_alarm(alarm)
+            alarm = ui.mainloop.set_alarm_in(delay, start_preview)
+
+        querystring = await ui.prompt('refine', text=oldquery,
+                                      completer=QueryCompleter(ui.dbman),
+                                      on_change=changed)
+        if alarm is not None:
+            ui.mainloop.remove_alarm(alarm)
+        sbuffer.cancel_preview()
+        if querystring is None or not querystring.strip() \
+                or querystring == oldquery:
+            if not previewed:
+                return
+            # restore the results of the original query
+            sbuffer.querystring = oldquery
+            sbuffer.rebuild(restore_focus=False)
+            if selected is not None:
+                sbuffer.focus_thread(selected)
+        else:
+            sbuffer.querystring = querystring
+            sbuffer.rebuild(restore_focus=False)
+        ui.update()
 
 
 RetagPromptCommand = registerCommand(MODE, 'retagprompt')(RetagPromptCommand)
@@ -133,7 +214,7 @@ RetagPromptCommand = registerCommand(MODE, 'retagprompt')(RetagPromptCommand)
             'default': False,
             'help': 'tag all messages that match the current search query'}),
         (['tags'], {'help': 'comma separated list of tags'})],
-    help='add tags to all messages in the selected thread',
+    help='add tags to all messages in the selected or marked threads',
 )
 @registerCommand(
     MODE, 'retag', forced={'action': 'set'},
@@ -145,7 +226,7 @@ RetagPromptCommand = registerCommand(MODE, 'retagprompt')(RetagPromptCommand)
             'default': False,
             'help': 'retag all messages that match the current query'}),
         (['tags'], {'help': 'comma separated list of tags'})],
-    help='set tags to all messages in the selected thread',
+    help='set tags to all messages in the selected or marked threads',
 )
 @registerCommand(
     MODE, 'untag', forced={'action': 'remove'},
@@ -157,7 +238,8 @@ RetagPromptCommand = registerCommand(MODE, 'retagprompt')(RetagPromptCommand)
             'default': False,
             'help': 'untag all messages that match the current query'}),
         (['tags'], {'help': 'comma separated list of tags'})],
-    help='remove tags from all messages in the selected thread',
+    help='remove tags from all messages in the selected or marked '
+         'threads',
 )
 @registerCommand(
     MODE, 'toggletags', forced={'action': 'toggle'},
@@ -166,9 +248,9 @@ RetagPromptCommand = registerCommand(MODE, 'retagprompt')(RetagPromptCommand)
                           'default': 'True',
                           'help': 'postpone a writeout to the index'}),
         (['tags'], {'help': 'comma separated list of tags'})],
-    help='flip presence of tags on the selected thread: a tag is considered present '
-         'and will be removed if at least one message in this thread is '
-         'tagged with it')
+    help='flip presence of tags on the selected or marked threads: a tag is '
+         'considered present and will be removed if at least one message in '
+         'these threads is tagged with it')
 class TagCommand(Command):
 
     """manipulate message tags"""
@@ -203,54 +285,119 @@ class TagCommand(Command):
             return
 
         testquery = searchbuffer.querystring
-        thread = threadline_widget.get_thread()
+        # marked threads are changed with a single query, so that they are
+        # written in one transaction and reconciled together afterwards
+        tids = set(searchbuffer.marked)
+        if not tids:
+            tids = {threadline_widget.get_thread().get_thread_id()}
         if not self.allm:
-            testquery = "thread:%s" % thread.get_thread_id()
+            testquery = ' OR '.join('thread:' + t for t in sorted(tids))
         logging.debug('all? %s', self.allm)
         logging.debug('q: %s', testquery)
 
         def refresh():
-            # update total result count
-            if not self.allm:
-                # remove thread from resultset if it doesn't match the search query
-                # any more and refresh selected threadline otherwise
-                countquery = "(%s) AND thread:%s" % (searchbuffer.querystring,
-                                                     thread.get_thread_id())
-                hitcount_after = ui.dbman.count_messages(countquery)
-                if hitcount_after == 0:
-                    logging.debug('remove thread from result list: %s', thread)
-                    if threadline_widget in searchbuffer.threadlist:
-                        # remove this thread from result list
-                        searchbuffer.threadlist.remove(threadline_widget)
-                else:
-                    threadline_widget.rebuild()
-                searchbuffer.result_count = searchbuffer.dbman.count_messages(
-                    searchbuffer.querystring)
-            else:
-                searchbuffer.rebuild()
-
+            searchbuffer.rebuild()
             ui.update()
 
+        def touched():
+            # only look at the threads again once all queued changes are
+            # written, so that consecutive changes are reconciled together
+            searchbuffer.schedule_reconcile(tids)
+
+        afterwards = None if self.allm else touched
         tags = [x for x in self.tagsstring.split(',') if x]
 
         try:
             if self.action == 'add':
-                ui.dbman.tag(testquery, tags, remove_rest=False)
+                ui.dbman.tag(testquery, tags, remove_rest=False,
+                             afterwards=afterwards)
             if self.action == 'set':
-                ui.dbman.tag(testquery, tags, remove_rest=True)
+                ui.dbman.tag(testquery, tags, remove_rest=True,
+                             afterwards=afterwards)
             elif self.action == 'remove':
-                ui.dbman.untag(testquery, tags)
+                ui.dbman.untag(testquery, tags, afterwards=afterwards)
             elif self.action == 'toggle':
                 if not self.allm:
-                    ui.dbman.toggle_tags(testquery, tags, afterwards=refresh)
+                    ui.dbman.toggle_tags(testquery, tags,
+                                         afterwards=afterwards)
         except DatabaseROError:
             ui.notify('index in read-only mode', priority='error')
             return
 
         # flush index
         if self.flush:
-            await ui.apply_command(
-                commands.globals.FlushCommand(callback=refresh))
+            await ui.apply_command(commands.globals.FlushCommand(
+                callback=refresh if self.allm else None))
+
+
+@registerCommand(
+    MODE, 'mark', forced={'action': 'mark'},
+    arguments=[
+        (['--range'], {'action': 'store_true', 'dest': 'markrange',
+                       'help': 'mark all threads from the one (un)marked '
+                               'last up to the selected one'}),
+        (['query'], {'nargs': argparse.REMAINDER,
+                     'help': 'mark all threads matching this query'})],
+    help='mark threads, for tag and pipeto to act upon them all at once')
+@registerCommand(
+    MODE, 'unmark', forced={'action': 'unmark'},
+    arguments=[
+        (['--all'], {'action': 'store_true', 'dest': 'allthreads',
+                     'help': 'unmark all threads'}),
+        (['--range'], {'action': 'store_true', 'dest': 'markrange',
+                       'help': 'unmark all threads from the one (un)marked '
+                               'last up to the selected one'}),
+        (['query'], {'nargs': argparse.REMAINDER,
+                     'help': 'unmark all threads matching this query'})],
+    help='unmark threads')
+@registerCommand(
+    MODE, 'togglemark', forced={'action': 'toggle'},
+    help='mark the selected thread or unmark it if it is marked')
+class MarkCommand(Command):
+
+    """mark threads to act upon"""
+    repeatable = True
+
+    def __init__(self, action='toggle', query=None, markrange=False,
+                 allthreads=False, **kwargs):
+        """
+        :param action: marks threads if 'mark', unmarks them if 'unmark' and
+                       flips the mark of the selected thread if 'toggle'
+        :type action: str
+        :param query: (un)mark all threads matching this query
+        :type query: list of str
+        :param markrange: (un)mark all threads from the one (un)marked last
+                          up to the selected thread
+        :type markrange: bool
+        :param allthreads: unmark all threads
+        :type allthreads: bool
+        """
+        self.action = action
+        self.query = ' '.join(query or [])
+        self.markrange = markrange
+        self.allthreads = allthreads
+        Command.__init__(self, **kwargs)
+
+    def apply(self, ui):
+        searchbuffer = ui.current_buffer
+        marked = self.action == 'mark'
+        if self.allthreads:
+            searchbuffer.set_marks(list(searchbuffer.marked), False)
+        elif self.query:
+            count = searchbuffer.mark_matching(self.query, marked)
+            ui.notify('%s %d thread%s' % ('marked' if marked else 'unmarked',
+                                          count, 's' if count != 1 else ''))
+        elif self.markrange:
+            searchbuffer.mark_range(marked)
+        else:
+            threadline_widget = searchbuffer.get_selected_threadline()
+            if threadline_widget is None:
+                return
+            tid = threadline_widget.tid
+            if self.action == 'toggle' or \
+                    searchbuffer.is_marked(tid) != marked:
+                searchbuffer.toggle_mark(tid)
+        ui.update()
 
 
 @registerCommand(
@@ -286,3 +433,207 @@ class SaveQueryCommand(GlobalSaveQueryCommand):
         if not self.query:
             self.query = searchbuffer.querystring
         GlobalSaveQueryCommand.apply(self, ui)
+
+
+class BulkCommand(Command, metaclass=abc.ABCMeta):
+
+    """
+    base class for commands that process all messages matching the query of
+    the current search buffer, restricted to the marked threads if any.
+
+    Messages are read one by one from the index and their files, on a worker
+    thread, so that memory use does not depend on the number of messages.
+    Progress is shown in a notification.
+    """
+    # shown in progress notifications
+    action = 'processing'
+
+    async def apply(self, ui):
+        searchbuffer = ui.current_buffer
+        querystring = searchbuffer.querystring
+        if searchbuffer.marked:
+            querystring = '(%s) AND (%s)' % (querystring,
+                                             searchbuffer.marked_query())
+        total = ui.dbman.count_messages(querystring)
+        if not total:
+            ui.notify('no messages match %s' % querystring)
+            return
+
+        loop = asyncio.get_event_loop()
+        progress = [ui.notify('%s %d messages' % (self.action, total),
+                              timeout=-1)]
+
+        def report(done):
+            ui.clear_notify([progress.pop()])
+            progress.append(ui.notify('%s message %d of %d' % (
+                self.action, done, total), timeout=-1))
+
+        def messages():
+            last_report = time.monotonic()
+            for done, message in enumerate(
+                    ui.dbman.get_message_files(querystring), 1):
+                yield message
+                if time.monotonic() - last_report > 0.5:
+                    last_report = time.monotonic()
+                    loop.call_soon_threadsafe(report, done)
+
+        try:
+            result = await loop.run_in_executor(None, self.process,
+                                                messages())
+        except (OSError, mailbox.Error, NotmuchError, GPGProblem,
+                UnicodeError) as e:
+            ui.notify(str(e), priority='error')
+            return
+        finally:
+            ui.clear_notify([progress.pop()])
+        if result:
+            ui.notify(result)
+
+    @abc.abstractmethod
+    def process(self, messages):
+        """
+        process `messages`. This runs on a worker thread.
+
+        :param messages: id and file name of all messages to process
+        :type messages: iterable of (str, str)
+        :returns: notification to show when done
+        :rtype: str
+        """
+
+
+@registerCommand(MODE, 'pipeto', arguments=[
+    (['cmd'], {'help': 'shellcommand to pipe to', 'nargs': '+'}),
+    (['--format'], {'help': 'output format', 'default': 'raw',
+                    'choices': ['raw', 'decoded', 'id', 'filepath']}),
+    (['--shell'], {'action': 'store_true',
+                   'help': 'let the shell interpret the command'}),
+    (['--notify_stdout'], {'action': 'store_true',
+                           'help': 'display cmd\'s stdout as notification'}),
+])
+class PipeCommand(BulkCommand):
+
+    """pipe all messages matching the query, in the marked threads if any,
+    to stdin of a shellcommand"""
+    action = 'piping'
+
+    def __init__(self, cmd, format='raw', shell=False, notify_stdout=False,
+                 **kwargs):
+        """
+        :param cmd: shellcommand to open
+        :type cmd: str or list of str
+        :param format: what to pipe to the processes stdin. one of:
+            'raw': message content as is,
+            'decoded': message content, decoded quoted printable,
+            'id': message ids, separated by newlines,
+            'filepath': paths to message files on disk
+        :type format: str
+        :param shell: let the shell interpret the command
+        :type shell: bool
+        :param notify_stdout: display command\'s stdout as notification message
+        :type notify_stdout: bool
+        """
+        Command.__init__(self, **kwargs)
+        if isinstance(cmd, str):
+            cmd = split_commandstring(cmd)
+        if shell:
+            cmd = [' '.join(cmd)]
+        self.cmd = cmd
+        self.output_format = format
+        self.notify_stdout = notify_stdout
+
+    def _sources(self, messages):
+        """yield what to pipe for each message, as bytes"""
+        encoding = urwid.util.detected_encoding
+        separator = b'\n' if self.output_format in ('id', 'filepath') \
+            else b'\n\n'
+        for i, (mid, path) in enumerate(messages):
+            if i:
+                yield separator
+            if self.output_format == 'id':
+                yield mid.encode(encoding)
+            elif self.output_format == 'filepath':
+                yield os.fsencode(path)
+            else:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                if self.output_format == 'raw':
+                    yield raw
+                else:
+                    mail = decrypted_message_from_bytes(raw)
+                    msgtext = '%s\n\n%s' % (
+                        extract_headers(mail),
+                        extract_body_part(get_body_part(mail)))
+                    yield msgtext.encode(encoding)
+
+    def process(self, messages):
+        with tempfile.TemporaryFile() as outfile, \
+                tempfile.TemporaryFile() as errfile:
+            proc = subprocess.Popen(self.cmd, shell=True,
+                                    stdin=subprocess.PIPE,
+                                    stdout=outfile, stderr=errfile)
+            try:
+                for chunk in self._sources(messages):
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # the command does not want to read everything
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                proc.wait()
+            errfile.seek(0)
+            err = errfile.read()
+            if err:
+                raise OSError(err.decode(errors='replace'))
+            outfile.seek(0)
+            out = outfile.read().decode(errors='replace')
+        if self.notify_stdout:
+            return out
+        return 'piped messages to %s' % ' '.join(self.cmd)
+
+
+@registerCommand(MODE, 'export', arguments=[
+    (['path'], {'help': 'mbox file or maildir directory to write to'}),
+    (['--format'], {'help': 'mailbox format', 'default': 'mbox',
+                    'choices': ['mbox', 'maildir']}),
+])
+class ExportCommand(BulkCommand):
+
+    """save all messages matching the query, in the marked threads if any,
+    to an mbox or a maildir"""
+    action = 'exporting'
+
+    def __init__(self, path, format='mbox', **kwargs):
+        """
+        :param path: mbox file or maildir directory to write to, created if
+                     it does not exist
+        :type path: str
+        :param format: 'mbox' or 'maildir'
+        :type format: str
+        """
+        Command.__init__(self, **kwargs)
+        self.path = os.path.expanduser(path)
+        self.mailbox_format = format
+
+    def process(self, messages):
+        count = 0
+        if self.mailbox_format == 'maildir':
+            box = mailbox.Maildir(self.path, factory=None, create=True)
+            for _, path in messages:
+                with open(path, 'rb') as f:
+                    box.add(f)
+                count += 1
+        else:
+            # append messages in the format of :class:`mailbox.mbox`, without
+            # reading the existing messages as that class would
+            with open(self.path, 'ab') as box:
+                for _, path in messages:
+                    with open(path, 'rb') as f:
+                        raw = f.read().replace(b'\r\n', b'\n')
+                    box.write(b'From MAILER-DAEMON %s\n' %
+                              time.asctime(time.gmtime()).encode())
+                    box.write(_MBOX_FROM.sub(b'>From ', raw))
+                    box.write(b'\n' if raw.endswith(b'\n') else b'\n\n')
+                    count += 1
+        return 'exported %d messages to %s' % (count, self.path)
@@ -3,6 +3,7 @@
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
 import argparse
+import asyncio
 import logging
 import mailcap
 import os
@@ -554,11 +555,11 @@ class ChangeDisplaymodeCommand(Command):
         self.mimepart = mimepart
         Command.__init__(self, **kwargs)
 
-    def _matches(self, msgt):
+    def _matches(self, msgt, tbuffer):
         if self.query is None or self.query == '*':
             return True
-        msg = msgt.get_message()
-        return msg.matches(self.query)
+        mid = msgt.get_message().get_message_id()
+        return mid in tbuffer.get_matching_mids(self.query)
 
     def apply(self, ui):
         tbuffer = ui.current_buffer
@@ -591,7 +592,7 @@ class ChangeDisplaymodeCommand(Command):
                 visible = mt.is_collapsed(mt.root)
             else:
                 visible = self.visible
-            if not self._matches(mt):
+            if not self._matches(mt, tbuffer):
                 visible = not visible
 
             if self.raw == 'toggle':
@@ -724,58 +725,30 @@ class PipeCommand(Command):
                                 cancel='no')) == 'no':
                 return
 
-        # prepare message sources
-        pipestrings = []
-        separator = '\n\n'
-        logging.debug('PIPETO format')
-        logging.debug(self.output_format)
-
-        if self.output_format == 'id':
-            pipestrings = [e.get_message_id() for e in to_print]
-            separator = '\n'
-        elif self.output_format == 'filepath':
-            pipestrings = [e.get_filename() for e in to_print]
-            separator = '\n'
-        else:
-            for msg in to_print:
-                mail = msg.get_email()
-                if self.add_tags:
-                    mail.add_header('Tags', ', '.join(msg.get_tags()))
-                if self.output_format == 'raw':
-                    pipestrings.append(mail.as_string())
-                elif self.output_format == 'decoded':
-                    headertext = extract_headers(mail)
-                    bodytext = msg.get_body_text()
-                    msgtext = '%s\n\n%s' % (headertext, bodytext)
-                    pipestrings.append(msgtext)
-
-        if not self.separately:
-            pipestrings = [separator.join(pipestrings)]
         if self.shell:
             self.cmd = [' '.join(self.cmd)]
 
+        # messages are read and piped one at a time
+        sources = self._sources(to_print)
+        if self.separately:
+            inputs = ([source] for source in sources)
+        else:
+            separator = '\n' if self.output_format in ('id', 'filepath') \
+                else '\n\n'
+            inputs = [self._separated(
+                sources, separator.encode(urwid.util.detected_encoding))]
+
         # do the monkey
-        for mail in pipestrings:
-            encoded_mail = mail.encode(urwid.util.detected_encoding)
+        for chunks in inputs:
             if self.background:
                 logging.debug('call in background: %s', self.cmd)
-                proc = subprocess.Popen(self.cmd,
-                                        shell=True, stdin=subprocess.PIPE,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-                out, err = proc.communicate(encoded_mail)
+                out, err = await self._pipe_in_background(chunks)
                 if self.notify_stdout:
                     ui.notify(out)
             else:
                 with ui.paused():
                     logging.debug('call: %s', self.cmd)
-                    # if proc.stdout is defined later calls to communicate
-                    # seem to be non-blocking!
-                    proc = subprocess.Popen(self.cmd, shell=True,
-                                            stdin=subprocess.PIPE,
-                                            # stdout=subprocess.PIPE,
-                                            stderr=subprocess.PIPE)
-                    out, err = proc.communicate(encoded_mail)
+                    err = self._pipe(chunks)
             if err:
                 ui.notify(err, priority='error')
                 return
@@ -784,6 +757,103 @@ class PipeCommand(Command):
         if self.done_msg:
             ui.notify(self.done_msg)
 
+    def _sources(self, messages):
+        """
+        yield what to pipe for each message in `messages`, as bytes.
+        Raw messages are read from disk as they are, unless they need to be
+        decrypted or get a 'Tags' header.
+        """
+        encoding = urwid.util.detected_encoding
+        for msg in messages:
+            if self.output_format == 'id':
+                yield msg.get_message_id().encode(encoding)
+            elif self.output_format == 'filepath':
+                yield msg.get_filename().encode(encoding)
+            elif self.output_format == 'raw' and not self.add_tags and \
+                    'encrypted' not in msg.get_tags():
+                try:
+                    with open(msg.get_filename(), 'rb') as f:
+                        yield f.read()
+                    continue
+                except OSError:
+                    pass
+                yield msg.get_email().as_string().encode(encoding)
+            else:
+                mail = msg.get_email()
+                if self.add_tags:
+                    mail.add_header('Tags', ', '.join(msg.get_tags()))
+                if self.output_format == 'raw':
+                    msgtext = mail.as_string()
+                else:
+                    headertext = extract_headers(mail)
+                    bodytext = msg.get_body_text()
+                    msgtext = '%s\n\n%s' % (headertext, bodytext)
+                yield msgtext.encode(encoding)
+
+    @staticmethod
+    def _separated(sources, separator):
+        """yield the chunks in `sources` with `separator` in between"""
+        for i, source in enumerate(sources):
+            if i:
+                yield separator
+            yield source
+
+    def _pipe(self, chunks):
+        """
+        write `chunks` to the command and wait for it to exit
+
+        :returns: what the command wrote to stderr
+        :rtype: bytes
+        """
+        # stderr goes to a file, so that the command can not block on it
+        # while we are still writing
+        with tempfile.TemporaryFile() as errfile:
+            proc = subprocess.Popen(self.cmd, shell=True,
+                                    stdin=subprocess.PIPE,
+                                    stderr=errfile)
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # the command does not want to read everything
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            proc.wait()
+            errfile.seek(0)
+            return errfile.read()
+
+    async def _pipe_in_background(self, chunks):
+        """
+        write `chunks` to the command without blocking the interface
+
+        :returns: what the command wrote to stdout and stderr
+        :rtype: (bytes, bytes)
+        """
+        # like subprocess.Popen(self.cmd, shell=True)
+        proc = await asyncio.create_subprocess_exec(
+            '/bin/sh', '-c', *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+
+        async def feed():
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the command does not want to read everything
+            finally:
+                proc.stdin.close()
+
+        _, out, err = await asyncio.gather(feed(), proc.stdout.read(),
+                                           proc.stderr.read())
+        await proc.wait()
+        return out, err
+
 
 @registerCommand(MODE, 'remove', arguments=[
     (['--all'], {'action': 'store_true', 'help': 'remove whole thread'})])
@@ -1154,7 +1224,8 @@ class TagCommand(Command):
     async def apply(self, ui):
         tbuffer = ui.current_buffer
         if self.all:
-            messagetrees = tbuffer.messagetrees()
+            # trees that are created later on start with a fresh summary
+            messagetrees = tbuffer.loaded_messagetrees()
             testquery = "thread:%s" % \
                         tbuffer.get_selected_thread().get_thread_id()
         else:
@@ -1176,6 +1247,10 @@ class TagCommand(Command):
 
         tags = [t for t in self.tagsstring.split(',') if t]
 
+        # write pending automatic removals of the unread tag first, so that
+        # they cannot undo an explicit 'tag unread' once they are written
+        tbuffer.flush_unread()
+
         try:
             if self.action == 'add':
                 ui.dbman.tag(testquery, tags, remove_rest=False,
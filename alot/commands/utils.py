@@ -1,6 +1,7 @@
 # Copyright (C) 2015  Patrick Totzke <patricktotzke@gmail.com>
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
+import asyncio
 import re
 import logging
 
@@ -80,12 +81,20 @@ async def _get_keys(ui, encrypt_keyids, block_error=False, signed_only=False):
     :returns: the available keys indexed by their OpenPGP fingerprint
     :rtype: dict(str->gpg key object)
     """
-    keys = {}
-    for keyid in encrypt_keyids:
+    def lookup(keyid):
         try:
-            key = crypto.get_key(keyid, validate=True, encrypt=True,
-                                 signed_only=signed_only)
+            return crypto.get_key(keyid, validate=True, encrypt=True,
+                                  signed_only=signed_only), None
         except GPGProblem as e:
+            return None, e
+
+    # the keys of all recipients are looked up concurrently
+    loop = asyncio.get_running_loop()
+    found = await asyncio.gather(*(loop.run_in_executor(None, lookup, keyid)
+                                   for keyid in encrypt_keyids))
+    keys = {}
+    for keyid, (key, e) in zip(encrypt_keyids, found):
+        if e is not None:
             if e.code == GPGCode.AMBIGUOUS_NAME:
                 tmp_choices = ['{} ({})'.format(k.uids[0].uid, k.fpr) for k in
                                crypto.list_keys(hint=keyid)]
@@ -98,9 +107,8 @@ async def _get_keys(ui, encrypt_keyids, block_error=False, signed_only=False):
                                               choices_to_return=keys_to_return)
                 if choosen_key:
                     keys[choosen_key.fpr] = choosen_key
-                continue
             else:
                 ui.notify(str(e), priority='error', block=block_error)
-                continue
+            continue
         keys[key.fpr] = key
     return keys
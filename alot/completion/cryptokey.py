@@ -14,11 +14,20 @@ class CryptoKeyCompleter(StringlistCompleter):
         :param private: return private keys
         :type private: bool
         """
-        keys = crypto.list_keys(private=private)
-        resultlist = []
-        for k in keys:
-            for s in k.subkeys:
-                resultlist.append(s.keyid)
-            for u in k.uids:
-                resultlist.append(u.email)
-        StringlistCompleter.__init__(self, resultlist, match_anywhere=True)
+        self.private = private
+        # keys the current resultlist was built from
+        self._keys = None
+        StringlistCompleter.__init__(self, [], match_anywhere=True)
+
+    def complete(self, original, pos):
+        # the keyring is only listed again after it changed
+        keys = crypto.keyring.keys(private=self.private)
+        if keys is not self._keys:
+            self._keys = keys
+            self.resultlist = []
+            for k in keys:
+                for s in k.subkeys:
+                    self.resultlist.append(s.keyid)
+                for u in k.uids:
+                    self.resultlist.append(u.email)
+        return StringlistCompleter.complete(self, original, pos)
@@ -5,6 +5,10 @@
 import gpg
 
 from .errors import GPGProblem, GPGCode
+from .keyring import Keyring, is_key_id
+
+keyring = Keyring()
+"""cached view of the keyring, shared by all lookups"""
 
 
 def RFC3156_micalg_from_algo(hash_algo):
@@ -60,9 +64,15 @@ def get_key(keyid, validate=False, encrypt=False, sign=False,
     :raises ~alot.errors.GPGProblem: if a key is found, but signed_only is true
         and the key is unused
     """
-    ctx = gpg.core.Context()
+    # keys that are known by their fingerprint or key id are taken from the
+    # cache. gpgme also matches other terms against parts of user ids, so
+    # that only it can tell whether they are ambiguous
     try:
-        key = ctx.get_key(keyid)
+        cached = keyring.lookup(keyid) if is_key_id(keyid) else []
+        if len(cached) == 1:
+            key = cached[0]
+        else:
+            key = keyring.context().get_key(keyid)
         if validate:
             validate_key(key, encrypt=encrypt, sign=sign)
     except gpg.errors.KeyNotFound:
@@ -131,8 +141,9 @@ def list_keys(hint=None, private=False):
     :returns: A generator that yields keys.
     :rtype: Generator[gpg.gpgme.gpgme_key_t, None, None]
     """
-    ctx = gpg.core.Context()
-    return ctx.keylist(hint, private)
+    if hint is None:
+        return iter(keyring.keys(private))
+    return keyring.context().keylist(hint, private)
 
 
 def detached_signature_for(plaintext_str, keys):
@@ -216,24 +227,44 @@ def decrypt_verify(encrypted, session_keys=None):
     :rtype: tuple[list[gpg.resuit.Signature], str]
     :raises alot.errors.GPGProblem: if the decryption fails
     """
-    if session_keys is not None:
+    sigs, plaintext, _ = decrypt_verify_session_key(encrypted, session_keys)
+    return sigs, plaintext
+
+
+def decrypt_verify_session_key(encrypted, session_keys=None):
+    """Decrypts the given ciphertext string and returns the signatures (if
+    any), the plaintext and the session key, if the private key had to be
+    used for decryption. The session key can be passed to later calls to
+    decrypt the same data without private key operations.
+
+    :param bytes encrypted: the mail to decrypt
+    :param list[str] session_keys: a list OpenPGP session keys
+    :returns: the signatures, decrypted plaintext data and the session key,
+        which is None if one of `session_keys` was used
+    :rtype: tuple[list[gpg.resuit.Signature], str, str or None]
+    :raises alot.errors.GPGProblem: if the decryption fails
+    """
+    if session_keys:
         try:
-            return _decrypt_verify_session_keys(encrypted, session_keys)
+            sigs, plaintext, _ = _decrypt_verify_session_keys(encrypted,
+                                                              session_keys)
+            return sigs, plaintext, None
         except GPGProblem:
             pass
 
     ctx = gpg.core.Context()
+    ctx.set_ctx_flag("export-session-key", "1")
     return _decrypt_verify_with_context(ctx, encrypted)
 
 
 def _decrypt_verify_session_keys(encrypted, session_keys):
     """Decrypts the given ciphertext string using the session_keys
-    and returns both the signatures (if any) and the plaintext.
+    and returns the signatures (if any), the plaintext and the session key.
 
     :param bytes encrypted: the mail to decrypt
     :param list[str] session_keys: a list OpenPGP session keys
-    :returns: the signatures and decrypted plaintext data
-    :rtype: tuple[list[gpg.resuit.Signature], str]
+    :returns: the signatures, decrypted plaintext data and session key
+    :rtype: tuple[list[gpg.resuit.Signature], str, str or None]
     :raises alot.errors.GPGProblem: if the decryption fails
     """
     for key in session_keys:
@@ -248,24 +279,25 @@ def _decrypt_verify_session_keys(encrypted, session_keys):
 
 def _decrypt_verify_with_context(ctx, encrypted):
     """Decrypts the given ciphertext string using the gpg context
-    and returns both the signatures (if any) and the plaintext.
+    and returns the signatures (if any), the plaintext and the session key.
 
     :param gpg.Context ctx: the gpg context
     :param bytes encrypted: the mail to decrypt
-    :returns: the signatures and decrypted plaintext data
-    :rtype: tuple[list[gpg.resuit.Signature], str]
+    :returns: the signatures, decrypted plaintext data and the session key,
+        which is only known if the context exports it
+    :rtype: tuple[list[gpg.resuit.Signature], str, str or None]
     :raises alot.errors.GPGProblem: if the decryption fails
     """
     try:
-        (plaintext, _, verify_result) = ctx.decrypt(
+        (plaintext, result, verify_result) = ctx.decrypt(
                 encrypted, verify=True)
         sigs = verify_result.signatures
     except gpg.errors.GPGMEError as e:
         raise GPGProblem(str(e), code=e.getcode())
     except gpg.errors.BadSignatures as e:
-        (plaintext, _, _) = ctx.decrypt(encrypted, verify=False)
+        (plaintext, result, _) = ctx.decrypt(encrypted, verify=False)
         sigs = e.result.signatures
-    return sigs, plaintext
+    return sigs, plaintext, getattr(result, 'session_key', None) or None
 
 
 def validate_key(key, sign=False, encrypt=False):
@@ -1,11 +1,14 @@
 # Copyright (C) 2011-2012  Patrick Totzke <patricktotzke@gmail.com>
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
+import asyncio
 import glob
+import io
 import logging
 import os
 import re
 import email
+import email.generator
 import email.policy
 from email.encoders import encode_7or8bit
 from email.mime.text import MIMEText
@@ -24,6 +27,45 @@ from ..errors import GPGProblem, GPGCode
 charset.add_charset('utf-8', charset.QP, charset.QP, 'utf-8')
 
 
+class _SerialisedPartsGenerator(email.generator.BytesGenerator):
+    """
+    BytesGenerator that writes out the known serialisations of some parts
+    instead of generating them again. This makes sure a signed part ends up
+    in the mail exactly as it was signed.
+    """
+    def __init__(self, outfp, mangle_from_=None, maxheaderlen=None, *,
+                 policy=None, serialised=None):
+        """
+        :param serialised: serialisations of parts, by id of the part
+        :type serialised: dict
+        """
+        super().__init__(outfp, mangle_from_, maxheaderlen, policy=policy)
+        self._serialised = serialised or {}
+
+    def clone(self, fp):
+        clone = super().clone(fp)
+        clone._serialised = self._serialised
+        return clone
+
+    def flatten(self, msg, unixfrom=False, linesep=None):
+        data = self._serialised.get(id(msg))
+        if data is None:
+            super().flatten(msg, unixfrom, linesep)
+        else:
+            self.write(data.decode('ascii', 'surrogateescape'))
+
+
+def _as_bytes(msg, serialised):
+    """
+    serialise `msg` like :meth:`email.message.Message.as_bytes` with the
+    SMTP policy, reusing the `serialised` parts
+    """
+    with io.BytesIO() as fp:
+        _SerialisedPartsGenerator(fp, False, policy=email.policy.SMTP,
+                                  serialised=serialised).flatten(msg)
+        return fp.getvalue()
+
+
 class Envelope:
     """
     a message that is not yet sent and still editable.
@@ -204,8 +246,12 @@ class Envelope:
                 msg.attach(a.get_mime_representation())
             inner_msg = msg
 
+        # serialisations of the parts that are already known
+        serialised = {}
+
         if self.sign:
             plaintext = inner_msg.as_bytes(policy=email.policy.SMTP)
+            serialised[id(inner_msg)] = plaintext
             logging.debug('signing plaintext: %s', plaintext)
 
             try:
@@ -250,7 +296,7 @@ class Envelope:
             unencrypted_msg = inner_msg
 
         if self.encrypt:
-            plaintext = unencrypted_msg.as_bytes(policy=email.policy.SMTP)
+            plaintext = _as_bytes(unencrypted_msg, serialised)
             logging.debug('encrypting plaintext: %s', plaintext)
 
             try:
@@ -307,6 +353,21 @@ class Envelope:
 
         return outer_msg
 
+    async def construct_mail_async(self):
+        """
+        Compiles the information contained in this envelope into a
+        :class:`email.Message`, like :meth:`construct_mail`, but on a worker
+        thread, so that reading attachments does not block the event loop.
+
+        Mails that are signed or encrypted are still constructed on the event
+        loop: GPGME may start a pinentry on the terminal, which must not
+        compete with urwid for the input.
+        """
+        if self.sign or self.encrypt:
+            return self.construct_mail()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.construct_mail)
+
     def parse_template(self, raw, reset=False, only_body=False,
                        target_body='plaintext'):
         """Parse a template or user edited string to fills this envelope.
@@ -6,6 +6,7 @@ from collections import deque
 import contextlib
 import itertools
 import logging
+import os
 
 from notmuch2 import Database, NotmuchError, XapianError
 import notmuch2
@@ -15,8 +16,10 @@ from .errors import DatabaseLockedError
 from .errors import DatabaseROError
 from .errors import NonexistantObjectError
 from .message import Message
+from .snippets import SnippetIndex
 from .thread import Thread
 from .utils import is_subdir_of
+from ..helper import get_xdg_env
 from ..settings.const import settings
 
 
@@ -47,7 +50,29 @@ class DBManager:
         self.path = path
         self.config = config
         self.writequeue = deque([])
+        # number of write-queue items written so far, which lets cached
+        # query results notice that the index changed
+        self.writes = 0
         self.processes = []
+        self._snippets = None
+
+    @property
+    def snippets(self):
+        """
+        the :class:`~alot.db.snippets.SnippetIndex` holding message previews,
+        which is only opened when first used
+        """
+        if self._snippets is None:
+            path = os.path.join(
+                get_xdg_env('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                'alot', 'snippets.sqlite')
+            self._snippets = SnippetIndex(path, self.get_message)
+        return self._snippets
+
+    def cleanup(self):
+        """release resources before shutting down"""
+        if self._snippets is not None:
+            self._snippets.close()
 
     @property
     def exclude_tags(self):
@@ -103,22 +128,33 @@ class DBManager:
 
                         if cmd == 'add':
                             logging.debug('add')
-                            path, tags = current_item[2:]
-                            msg, _ = db.add(path, sync_flags=sync)
-                            logging.debug('added msg')
-                            with msg.frozen():
-                                logging.debug('freeze')
-                                for tag in tags:
-                                    msg.tags.add(tag)
-                                if sync:
-                                    msg.tags.to_maildir_flags()
-                                logging.debug('added tags ')
-                            logging.debug('thaw')
+                            paths, tags = current_item[2:]
+                            for path in paths:
+                                msg, _ = db.add(path, sync_flags=sync)
+                                logging.debug('added msg')
+                                with msg.frozen():
+                                    logging.debug('freeze')
+                                    for tag in tags:
+                                        msg.tags.add(tag)
+                                    if sync:
+                                        msg.tags.to_maildir_flags()
+                                    logging.debug('added tags ')
+                                logging.debug('thaw')
 
                         elif cmd == 'remove':
                             path = current_item[2]
                             db.remove(path)
 
+                        elif cmd == 'properties':
+                            mid, key, values = current_item[2:]
+                            try:
+                                msg = db.find(mid)
+                            except LookupError:
+                                logging.debug('message %s is gone', mid)
+                            else:
+                                for value in values:
+                                    msg.properties.add(key, value)
+
                         elif cmd == 'setconfig':
                             key = current_item[2]
                             value = current_item[3]
@@ -160,6 +196,7 @@ class DBManager:
                     # close db
                     db.close()
                     logging.debug('closed db')
+                    self.writes += 1
 
                     # call post-callback
                     if callable(afterwards):
@@ -258,6 +295,40 @@ class DBManager:
                       config=self.config)
         return db.count_messages(querystring, exclude_tags=self.exclude_tags)
 
+    def get_message_ids(self, querystring, sort=None):
+        """
+        returns the ids of messages that match `querystring`, without
+        instantiating :class:`~alot.db.message.Message` objects.
+
+        :param querystring: notmuch search string
+        :type querystring: str
+        :param sort: Sort order. one of ['oldest_first', 'newest_first',
+                     'message_id', 'unsorted'], or None for a set of ids
+        :type sort: str
+        :rtype: set of str, or list of str if sorted
+        """
+        db = Database(path=self.path, mode=Database.MODE.READ_ONLY,
+                      config=self.config)
+        if sort is None:
+            return {msg.messageid for msg in
+                    db.messages(querystring, exclude_tags=self.exclude_tags)}
+        return [msg.messageid for msg in
+                db.messages(querystring, exclude_tags=self.exclude_tags,
+                            sort=self._sort_orders[sort])]
+
+    def get_message_files(self, querystring):
+        """
+        yields the id and file name of all messages that match `querystring`,
+        without instantiating :class:`~alot.db.message.Message` objects.
+
+        :rtype: generator of (str, str)
+        """
+        with Database(path=self.path, mode=Database.MODE.READ_ONLY,
+                      config=self.config) as db:
+            for msg in db.messages(querystring,
+                                   exclude_tags=self.exclude_tags):
+                yield msg.messageid, str(msg.path)
+
     def collect_tags(self, querystring):
         """returns tags of messages that match `querystring`"""
         db = Database(path=self.path, mode=Database.MODE.READ_ONLY,
@@ -343,41 +414,61 @@ class DBManager:
             messages are also influenced by this limit)
         :rtype: Tuple[Iterator[str], int]
         """
+        matched = self.get_thread_match_counts(querystring, sort, limit)
+        return iter(matched), sum(matched.values())
+
+    def get_thread_match_counts(self, querystring, sort='newest_first',
+                                limit=None):
+        """
+        look up the threads matching `querystring` together with the number
+        of their messages that match it.
+
+        :param querystring: The query string to use for the lookup
+        :type querystring: str.
+        :param sort: Sort order. one of ['oldest_first', 'newest_first',
+                     'message_id', 'unsorted']
+        :type sort: str
+        :param limit: Limit the number of threads returned.
+        :type limit: int
+        :returns: the number of matched messages per thread ID, in the
+            requested order
+        :rtype: dict[str, int]
+        """
         assert sort in self._sort_orders
         db = Database(path=self.path, mode=Database.MODE.READ_ONLY,
                       config=self.config)
         thread_iterator = db.threads(querystring,
                                      sort=self._sort_orders[sort],
                                      exclude_tags=self.exclude_tags)
-        threads = []
-        message_count = 0
+        matched = {}
         for thread in itertools.islice(thread_iterator, limit or None):
-            threads.append(thread.threadid)
-            message_count += thread.matched
-        return iter(threads), message_count
+            matched[thread.threadid] = thread.matched
+        return matched
 
     def add_message(self, path, tags=None, afterwards=None):
         """
         Adds a file to the notmuch index.
 
-        :param path: path to the file
-        :type path: str
+        :param path: path to the file, or a list of paths to add all at once,
+                     in a single transaction
+        :type path: str or list of str
         :param tags: tagstrings to add
         :type tags: list of str
         :param afterwards: callback to trigger after adding
         :type afterwards: callable or None
         """
         tags = tags or []
+        paths = [path] if isinstance(path, str) else list(path)
 
         if self.ro:
             raise DatabaseROError()
-        if not is_subdir_of(path, self.path):
-            msg = 'message path %s ' % path
-            msg += ' is not below notmuchs '
-            msg += 'root path (%s)' % self.path
-            raise DatabaseError(msg)
-        else:
-            self.writequeue.append(('add', afterwards, path, tags))
+        for path in paths:
+            if not is_subdir_of(path, self.path):
+                msg = 'message path %s ' % path
+                msg += ' is not below notmuchs '
+                msg += 'root path (%s)' % self.path
+                raise DatabaseError(msg)
+        self.writequeue.append(('add', afterwards, paths, tags))
 
     def remove_message(self, message, afterwards=None):
         """
@@ -392,6 +483,28 @@ class DBManager:
             raise DatabaseROError()
         path = message.get_filename()
         self.writequeue.append(('remove', afterwards, path))
+        if self._snippets is not None:
+            self._snippets.invalidate([message.get_message_id()])
+
+    def add_properties(self, mid, key, values, afterwards=None):
+        """
+        adds properties to the message with id `mid`.
+        This appends an operation to the write queue and raises
+        :exc:`~errors.DatabaseROError` if in read only mode.
+
+        :param mid: message id
+        :type mid: str
+        :param key: name of the properties
+        :type key: str
+        :param values: values of the properties
+        :type values: list of str
+        :param afterwards: callback to trigger after adding the properties
+        :type afterwards: callable or None
+        """
+        if self.ro:
+            raise DatabaseROError()
+        self.writequeue.append(('properties', afterwards, mid, key,
+                                list(values)))
 
     def save_named_query(self, alias, querystring, afterwards=None):
         """
@@ -1,10 +1,12 @@
 # Copyright (C) 2011-2012  Patrick Totzke <patricktotzke@gmail.com>
 # This file is released under the GNU GPL, version 3 or a later revision.
 # For further details see the COPYING file
+import asyncio
 import email
 import email.charset as charset
 import email.policy
 import functools
+import threading
 from datetime import datetime
 
 from notmuch2 import NullPointerError
@@ -47,7 +49,14 @@ class Message:
         self._email = None  # will be read upon first use
         self._attachments = None  # will be read upon first use
         self._mime_part = None  # will be read upon first use
+        self._body_text = None  # mime part and the text extracted from it
         self._mime_tree = None  # will be read upon first use
+        # signatures whose verification is deferred, see check_signatures()
+        self._pending_signatures = []
+        self._verification = None  # future of the running verification
+        # guards reading and parsing the message file, which may happen on
+        # a worker thread and the UI thread at once, see parse()
+        self._lock = threading.RLock()
         self._tags = msg.tags
 
         self._session_keys = [
@@ -69,6 +78,17 @@ class Message:
         else:
             self._from = '"Unknown" <>'
 
+    def refresh(self, msg):
+        """
+        update the metadata that may change in the index, i.e. tags and file
+        name, from `msg`. What has been parsed from the file is kept.
+
+        :param msg: the wrapped message, as currently found in the index
+        :type msg: notmuch2.Message
+        """
+        self._filename = str(msg.path)
+        self._tags = msg.tags
+
     def __str__(self):
         """prettyprint the message"""
         aname, aaddress = self.get_author()
@@ -97,18 +117,116 @@ class Message:
 
     def get_email(self):
         """returns :class:`email.email.EmailMessage` for this message"""
+        if self._email is None:
+            # the message may be read by the UI and a worker thread at once
+            with self._lock:
+                if self._email is None:
+                    self._email = self._read_email()
+        return self._email
+
+    def _read_email(self):
         path = self.get_filename()
         warning = "Subject: Caution!\n"\
                   "Message file is no longer accessible:\n%s" % path
-        if not self._email:
-            try:
-                with open(path, 'rb') as f:
-                    self._email = utils.decrypted_message_from_bytes(
-                            f.read(), self._session_keys)
-            except IOError:
-                self._email = email.message_from_string(
-                    warning, policy=email.policy.SMTP)
-        return self._email
+        new_session_keys = []
+        try:
+            with open(path, 'rb') as f:
+                mail = utils.decrypted_message_from_bytes(
+                    f.read(), self._session_keys, new_session_keys,
+                    self._pending_signatures)
+        except IOError:
+            mail = email.message_from_string(
+                warning, policy=email.policy.SMTP)
+        if new_session_keys:
+            self._stash_session_keys(new_session_keys)
+        return mail
+
+    def _stash_session_keys(self, session_keys):
+        """
+        remember the session keys this message was decrypted with, so that
+        it can be decrypted again without private key operations. They are
+        only stored in the index if notmuch's index.decrypt is set to true,
+        as notmuch does itself when indexing with decryption. Otherwise they
+        are kept for this session only, as cleartext equivalents of encrypted
+        mails are not to be stored without consent.
+        """
+        self._session_keys.extend(session_keys)
+        decrypt = settings.get_notmuch_setting('index', 'decrypt', 'auto')
+        if self._dbman.ro or decrypt.lower() != 'true':
+            return
+        self._dbman.add_properties(self._id, 'session-key', session_keys)
+
+    def signatures_pending(self):
+        """
+        returns True if this message has been read and contains OpenPGP
+        signatures that have not been verified yet
+        """
+        return bool(self._pending_signatures)
+
+    def verify_signatures(self):
+        """
+        verify the OpenPGP signatures of this message. Reading the message
+        only decrypts it, its signatures are shown as pending until the
+        results are applied with :meth:`apply_signatures`. This does not
+        touch the index or the pseudo headers and may be called from a
+        worker thread.
+
+        :returns: the verified signatures
+        :rtype: list of :class:`~alot.db.utils.PendingSignature`
+        """
+        self.get_email()
+        with self._lock:
+            pending = list(self._pending_signatures)
+        for signature in pending:
+            signature.verify()
+        return pending
+
+    def apply_signatures(self, signatures):
+        """
+        show the results of :meth:`verify_signatures` in the pseudo headers.
+        This is to be called from the event loop, which displays them.
+
+        :param signatures: the verified signatures
+        :type signatures: list of :class:`~alot.db.utils.PendingSignature`
+        """
+        with self._lock:
+            self._pending_signatures = [
+                s for s in self._pending_signatures if s not in signatures]
+        for signature in signatures:
+            signature.apply()
+
+    def check_signatures(self):
+        """
+        verify the pending OpenPGP signatures of this message on a worker
+        thread and apply the results once done. This is to be called from
+        the event loop.
+
+        :returns: a future that is done once the results are shown, or None
+                  if no signatures are pending
+        :rtype: asyncio.Future
+        """
+        if self._verification is None and self.signatures_pending():
+            self._verification = asyncio.get_event_loop().run_in_executor(
+                None, self.verify_signatures)
+            self._verification.add_done_callback(self._signatures_verified)
+        return self._verification
+
+    def _signatures_verified(self, future):
+        self._verification = None
+        if not future.cancelled() and future.exception() is None:
+            self.apply_signatures(future.result())
+
+    def _request_signatures(self):
+        """
+        start verifying the signatures once the body or attachments of this
+        message are used from the event loop. Worker threads, like those
+        extracting previews, leave them pending.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.check_signatures()
 
     def get_date(self):
         """returns Date header value as :class:`~datetime.datetime`"""
@@ -226,6 +344,38 @@ class Message:
 
         self._dbman.untag('id:' + self._id, tags, myafterwards)
 
+    @staticmethod
+    def remove_tags_from_all(messages, tags, afterwards=None):
+        """remove tags from several messages in a single write operation
+
+        .. note::
+
+            This only adds the requested operation to the
+            :class:`DBManager's <alot.db.DBManager>` write queue.
+            You need to call :meth:`~alot.db.DBManager.flush` to actually out.
+
+        :param messages: messages to remove the tags from
+        :type messages: list of :class:`Message`
+        :param tags: a list of tags to be removed
+        :type tags: list of str
+        :param afterwards: callback that gets called after successful
+                           application of this tagging operation
+        :type afterwards: callable
+        """
+        messages = list(messages)
+        if not messages:
+            return
+
+        def myafterwards():
+            for msg in messages:
+                msg._tags = msg._tags.difference(tags)
+            if callable(afterwards):
+                afterwards()
+
+        query = ' OR '.join('id:"%s"' % msg.get_message_id().replace('"', '""')
+                            for msg in messages)
+        messages[0]._dbman.untag(query, tags, myafterwards)
+
     def get_attachments(self):
         """
         returns messages attachments
@@ -238,23 +388,29 @@ class Message:
 
         :rtype: list of :class:`Attachment`
         """
-        if not self._attachments:
-            self._attachments = []
-            for part in self.get_message_parts():
-                ct = part.get_content_type()
-                # replace underspecified mime description by a better guess
-                if ct in ['octet/stream', 'application/octet-stream']:
-                    content = part.get_payload(decode=True)
-                    ct = helper.guess_mimetype(content)
-                    if (self._attachments and
-                            self._attachments[-1].get_content_type() ==
-                            'application/pgp-encrypted'):
-                        self._attachments.pop()
-
-                if self._is_attachment(part, ct):
-                    self._attachments.append(Attachment(part))
+        with self._lock:
+            if self._attachments is None:
+                self._attachments = self._find_attachments()
+        self._request_signatures()
         return self._attachments
 
+    def _find_attachments(self):
+        attachments = []
+        for part in self.get_message_parts():
+            ct = part.get_content_type()
+            # replace underspecified mime description by a better guess
+            if ct in ['octet/stream', 'application/octet-stream']:
+                content = part.get_payload(decode=True)
+                ct = helper.guess_mimetype(content)
+                if (attachments and
+                        attachments[-1].get_content_type() ==
+                        'application/pgp-encrypted'):
+                    attachments.pop()
+
+            if self._is_attachment(part, ct):
+                attachments.append(Attachment(part))
+        return attachments
+
     @staticmethod
     def _is_attachment(part, ct_override=None):
         """Takes a mimepart and returns a bool indicating if it's an attachment
@@ -275,16 +431,39 @@ class Message:
         return False
 
     def get_mime_part(self):
-        if not self._mime_part:
-            self._mime_part = get_body_part(self.get_email())
-        return self._mime_part
+        with self._lock:
+            if not self._mime_part:
+                self._mime_part = get_body_part(self.get_email())
+            return self._mime_part
 
     def set_mime_part(self, mime_part):
         self._mime_part = mime_part
 
     def get_body_text(self):
         """ returns bodystring extracted from this mail """
-        return extract_body_part(self.get_mime_part())
+        with self._lock:
+            mime_part = self.get_mime_part()
+            if self._body_text is None or self._body_text[0] is not mime_part:
+                self._body_text = (mime_part, extract_body_part(mime_part))
+            body_text = self._body_text[1]
+        self._request_signatures()
+        return body_text
+
+    def parse(self):
+        """
+        read, decrypt and decode this message and verify its signatures, so
+        that its headers, body text and attachments are readily available
+        afterwards. The results of the verifications are cached, but still
+        need to be applied with :meth:`check_signatures`. This does not touch
+        the index and may be called from a worker thread.
+        """
+        self.get_body_text()
+        self.get_attachments()
+        self.verify_signatures()
+
+    def is_parsed(self):
+        """returns True if the message file has been read already"""
+        return self._email is not None
 
     def matches(self, querystring):
         """tests if this messages is in the resultset for `querystring`"""
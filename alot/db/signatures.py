@@ -0,0 +1,149 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+"""
+Results of OpenPGP signature verifications
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+from .. import crypto
+from ..helper import get_xdg_env
+from ..settings.const import settings
+
+
+def digest(signed, signature):
+    """
+    returns a digest identifying a signature together with the data it signs
+
+    :param signed: the signed data
+    :type signed: bytes
+    :param signature: the detached signature
+    :type signature: bytes
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(len(signed).to_bytes(8, 'big'))
+    h.update(signed)
+    h.update(signature)
+    return h.hexdigest()
+
+
+class SignatureCache:
+    """
+    Cache of signature verification results, keyed by message id and the
+    digest of the signed data and signature.
+
+    A result is the pair of values of the pseudo headers describing the
+    signature. Whether a signature is valid and trusted depends on the keys
+    in the keyring, so results are only used as long as the keyring has not
+    changed since they were stored.
+    Results can optionally be kept in an sqlite database, so that they are
+    also used in later sessions.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: path of the database file, or None to only keep the
+                     results in memory
+        :type path: str
+        """
+        self.path = path
+        self._results = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with self._connection() as db:
+                    db.execute('CREATE TABLE IF NOT EXISTS signatures '
+                               '(id TEXT, digest TEXT, keyring TEXT, '
+                               'valid TEXT, message TEXT, '
+                               'PRIMARY KEY (id, digest))')
+            except (OSError, sqlite3.Error):
+                logging.exception('cannot use signature cache at %s', path)
+                self.path = None
+
+    def _connection(self):
+        """sqlite connection for the current thread"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=5)
+        return db
+
+    def get(self, mid, digest):
+        """
+        returns the result of a verification, or None if it is not known
+        for the current state of the keyring.
+
+        :param mid: message id
+        :type mid: str
+        :param digest: digest of the signed data and signature, as returned
+                       by :func:`digest`
+        :type digest: str
+        :returns: the values of the valid and message pseudo headers
+        :rtype: tuple of str or None
+        """
+        keyring = repr(crypto.keyring.stamp())
+        with self._lock:
+            entry = self._results.get((mid, digest))
+        if entry is None and self.path is not None:
+            try:
+                entry = self._connection().execute(
+                    'SELECT keyring, valid, message FROM signatures '
+                    'WHERE id = ? AND digest = ?', (mid, digest)).fetchone()
+            except sqlite3.Error:
+                logging.exception('cannot read from signature cache')
+        if entry is None or entry[0] != keyring:
+            return None
+        return entry[1:]
+
+    def put(self, mid, digest, valid, message):
+        """
+        store the result of a verification
+
+        :param mid: message id
+        :type mid: str
+        :param digest: digest of the signed data and signature
+        :type digest: str
+        :param valid: value of the valid pseudo header
+        :type valid: str
+        :param message: value of the message pseudo header
+        :type message: str
+        """
+        entry = (repr(crypto.keyring.stamp()), valid, message)
+        with self._lock:
+            self._results[(mid, digest)] = entry
+        if self.path is not None:
+            try:
+                with self._connection() as db:
+                    db.execute('INSERT OR REPLACE INTO signatures '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (mid, digest) + entry)
+            except sqlite3.Error:
+                logging.exception('cannot write to signature cache')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    returns the signature cache in use, which is created on first use and
+    persistent if the `persistent_signature_cache` setting is set.
+
+    :rtype: :class:`SignatureCache`
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = None
+            if settings.get('persistent_signature_cache'):
+                path = os.path.join(
+                    get_xdg_env('XDG_CACHE_HOME',
+                                os.path.expanduser('~/.cache')),
+                    'alot', 'signatures.sqlite')
+            _cache = SignatureCache(path)
+        return _cache
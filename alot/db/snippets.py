@@ -0,0 +1,250 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+"""
+Short previews of message bodies, as shown in the content part of threadlines
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import threading
+
+SNIPPET_LENGTH = 256
+"""maximal number of characters kept per message"""
+SNIPPET_INDEX_SIZE = 100000
+"""maximal number of previews kept by a :class:`SnippetIndex`"""
+
+
+def extract_snippet(message, length=SNIPPET_LENGTH):
+    """
+    extract a preview of the body of `message`: its first `length`
+    characters, ignoring quoted lines and collapsing whitespace.
+
+    :param message: the message to extract a preview for
+    :type message: :class:`~alot.db.message.Message`
+    :param length: maximal length of the preview
+    :type length: int
+    :rtype: str
+    """
+    lines = [line for line in message.get_body_text().splitlines()
+             if not line.lstrip().startswith('>')]
+    return ' '.join(' '.join(lines).split())[:length]
+
+
+class SnippetIndex:
+    """
+    Persistent index of message previews, keyed by message id.
+
+    Previews are extracted on a worker thread and stored in an sqlite
+    database, so that every message is only read and parsed once.
+    Encrypted messages are left to the event loop, as decrypting them may
+    ask for a passphrase on the terminal, and their previews are only kept
+    in memory, so that no decrypted content ends up on disk. The index keeps at most `limit`
+    previews and forgets the oldest ones first.
+    """
+    VERSION = 1
+    """format of the stored previews; older databases are emptied"""
+
+    def __init__(self, path, get_message, limit=SNIPPET_INDEX_SIZE):
+        """
+        :param path: path of the database file, or None to only keep the
+                     previews in memory
+        :type path: str
+        :param get_message: looks up a message by its id, called on the
+                            worker thread
+        :type get_message: callable
+        :param limit: maximal number of previews kept
+        :type limit: int
+        """
+        self.path = path
+        self.limit = limit
+        self._get_message = get_message
+        self._snippets = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='alot-snippets')
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with self._connection() as db:
+                    version = db.execute('PRAGMA user_version').fetchone()[0]
+                    if version != self.VERSION:
+                        db.execute('DROP TABLE IF EXISTS snippets')
+                        db.execute('PRAGMA user_version = %d' % self.VERSION)
+                    db.execute('CREATE TABLE IF NOT EXISTS snippets '
+                               '(id TEXT PRIMARY KEY, snippet TEXT)')
+            except (OSError, sqlite3.Error):
+                logging.exception('cannot use snippet index at %s', path)
+                self.path = None
+
+    def _connection(self):
+        """sqlite connection for the current thread"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=5)
+        return db
+
+    def _remember(self, mid, snippet):
+        """keep a preview in memory (holding the lock)"""
+        self._snippets.pop(mid, None)
+        self._snippets[mid] = snippet
+        while len(self._snippets) > self.limit:
+            del self._snippets[next(iter(self._snippets))]
+
+    def get(self, mid):
+        """
+        returns the preview of the message with id `mid`, or None if it has
+        not been extracted yet.
+
+        :param mid: message id
+        :type mid: str
+        :rtype: str or None
+        """
+        with self._lock:
+            snippet = self._snippets.get(mid)
+        if snippet is None and self.path is not None:
+            try:
+                row = self._connection().execute(
+                    'SELECT snippet FROM snippets WHERE id = ?',
+                    (mid,)).fetchone()
+            except sqlite3.Error:
+                logging.exception('cannot read from snippet index')
+                row = None
+            if row is not None:
+                snippet = row[0]
+                with self._lock:
+                    self._remember(mid, snippet)
+        return snippet
+
+    def request(self, mids):
+        """
+        extract the previews of the messages with ids `mids` in the
+        background.
+
+        :param mids: ids of the messages to get previews for
+        :type mids: list of str
+        :returns: a future that is done once all previews are available
+        :rtype: asyncio.Future
+        """
+        waiting = set()
+        todo = []
+        with self._lock:
+            for mid in mids:
+                if mid in self._snippets:
+                    continue
+                if mid in self._pending:
+                    # requested before, e.g. for another threadline
+                    waiting.add(self._pending[mid])
+                else:
+                    todo.append(mid)
+            if todo:
+                future = self._executor.submit(self._extract, todo)
+                for mid in todo:
+                    self._pending[mid] = future
+                waiting.add(future)
+        return asyncio.ensure_future(self._finish(waiting))
+
+    async def _finish(self, waiting):
+        """
+        wait for the worker, then extract the previews of the encrypted
+        messages it left to the event loop
+        """
+        skipped = await asyncio.gather(
+            *(asyncio.wrap_future(f) for f in waiting))
+        for mids in skipped:
+            for mid in mids:
+                self._extract_encrypted(mid)
+
+    def _extract_encrypted(self, mid):
+        """extract and remember the preview of an encrypted message"""
+        with self._lock:
+            if mid in self._snippets:
+                return
+        try:
+            snippet = extract_snippet(self._get_message(mid))
+        except Exception:
+            logging.exception('cannot extract preview of %s', mid)
+            snippet = ''
+        with self._lock:
+            self._remember(mid, snippet)
+            self._pending.pop(mid, None)
+
+    def _extract(self, mids):
+        """
+        extract and store the previews of messages (on the worker)
+
+        :returns: the ids of the encrypted messages, which were skipped
+        :rtype: list of str
+        """
+        extracted = []
+        skipped = []
+        for mid in mids:
+            try:
+                message = self._get_message(mid)
+                if 'encrypted' in message.get_tags():
+                    skipped.append(mid)
+                    continue
+                snippet = extract_snippet(message)
+            except Exception:  # unreadable mails should not stop the others
+                logging.exception('cannot extract preview of %s', mid)
+                snippet = ''
+            extracted.append((mid, snippet))
+        with self._lock:
+            for mid, snippet in extracted:
+                self._remember(mid, snippet)
+                self._pending.pop(mid, None)
+        if self.path is not None and extracted:
+            try:
+                with self._connection() as db:
+                    db.executemany('INSERT OR REPLACE INTO snippets '
+                                   'VALUES (?, ?)', extracted)
+                    # forget the previews stored longest ago
+                    db.execute('DELETE FROM snippets WHERE rowid IN '
+                               '(SELECT rowid FROM snippets '
+                               'ORDER BY rowid DESC LIMIT -1 OFFSET ?)',
+                               (self.limit,))
+            except sqlite3.Error:
+                logging.exception('cannot write to snippet index')
+        return skipped
+
+    def invalidate(self, mids=None):
+        """
+        forget previews, so that they are extracted again when requested
+
+        :param mids: ids of the messages whose previews to forget, or None
+                     to forget all previews
+        :type mids: list of str
+        """
+        with self._lock:
+            if mids is None:
+                self._snippets.clear()
+            else:
+                for mid in mids:
+                    self._snippets.pop(mid, None)
+        if self.path is not None:
+            try:
+                with self._connection() as db:
+                    if mids is None:
+                        db.execute('DELETE FROM snippets')
+                    else:
+                        db.executemany('DELETE FROM snippets WHERE id = ?',
+                                       [(mid,) for mid in mids])
+            except sqlite3.Error:
+                logging.exception('cannot write to snippet index')
+
+    def _close_connection(self):
+        """close the sqlite connection of the current thread"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def close(self):
+        """stop extracting previews and close the database"""
+        # sqlite connections can only be closed by the thread using them
+        self._executor.submit(self._close_connection)
+        self._executor.shutdown(wait=False)
+        self._close_connection()
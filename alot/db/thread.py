@@ -28,6 +28,10 @@ class Thread:
         self._authors = None
         self._id = thread.threadid
         self._messages = {}
+        self._message_cache = {}
+        self._stale_messages = {}
+        self._structure = None
+        self._message_tags = {}
         self._tags = set()
 
         self.refresh(thread)
@@ -71,6 +75,12 @@ class Thread:
         self._tags = {t for t in thread.tags}
         self._messages = {}  # this maps messages to its children
         self._toplevel_messages = []
+        # messages loaded before are reused and updated once they are read
+        # again from the index
+        self._stale_messages.update(self._message_cache)
+        self._message_cache = {}  # maps message ids to loaded messages
+        self._structure = None  # reply structure by message id
+        self._message_tags = {}  # tags by message id, as read with structure
 
     def __str__(self):
         return "thread:%s: %s" % (self._id, self.get_subject())
@@ -90,8 +100,11 @@ class Thread:
         """
         tags = set(list(self._tags))
         if intersection:
-            for m in self.get_messages().keys():
-                tags = tags.intersection(set(m.get_tags()))
+            self.get_structure()
+            for mid, mtags in self._message_tags.items():
+                if mid in self._message_cache:
+                    mtags = self._message_cache[mid].get_tags()
+                tags = tags.intersection(mtags)
         return tags
 
     def add_tags(self, tags, afterwards=None, remove_rest=False):
@@ -239,7 +252,7 @@ class Thread:
             with self._dbman._with_notmuch_thread(self._id) as thread:
 
                 def accumulate(acc, msg):
-                    M = Message(self._dbman, msg, thread=self)
+                    M = self._load_message(msg)
                     acc[M] = []
                     for m in msg.replies():
                         acc[M].append(accumulate(acc, m))
@@ -251,6 +264,84 @@ class Thread:
                                                               m))
         return self._messages
 
+    def get_structure(self):
+        """
+        returns the reply structure of this thread by message id. Unlike
+        :meth:`get_messages`, this does not instantiate any
+        :class:`~alot.db.message.Message` and is cheap even for huge threads.
+
+        :returns: the ids of all toplevel messages and a dict mapping the id
+                  of every message in this thread to the ids of its replies
+        :rtype: (list of str, dict of str to list of str)
+        """
+        if self._structure is None:
+            replies = {}
+            tags = {}
+            with self._dbman._with_notmuch_thread(self._id) as thread:
+
+                def accumulate(msg):
+                    mid = msg.messageid
+                    tags[mid] = frozenset(msg.tags)
+                    if mid in self._stale_messages:
+                        self._load_message(msg)
+                    replies[mid] = [accumulate(m) for m in msg.replies()]
+                    return mid
+
+                toplevel = [accumulate(m) for m in thread.toplevel()]
+            self._structure = (toplevel, replies)
+            self._message_tags = tags
+            # messages that are no longer part of this thread
+            self._stale_messages = {}
+        return self._structure
+
+    def get_message(self, mid):
+        """
+        returns the message with id `mid` in this thread. Only this message
+        is read from the index, see :meth:`get_structure`.
+
+        :param mid: id of the message
+        :type mid: str
+        :rtype: :class:`~alot.db.message.Message`
+        """
+        message = self._message_cache.get(mid)
+        if message is None:
+            with self._dbman._with_notmuch_message(mid) as msg:
+                message = self._load_message(msg)
+        return message
+
+    def _load_message(self, msg):
+        """
+        returns the :class:`~alot.db.message.Message` for `msg`. Messages that
+        have been loaded before the last :meth:`refresh` are updated and
+        reused, so that they keep what has been parsed already.
+
+        :param msg: the message to wrap
+        :type msg: :class:`notmuch2.Message`
+        """
+        mid = msg.messageid
+        message = self._message_cache.get(mid)
+        if message is None:
+            message = self._stale_messages.pop(mid, None)
+            if message is None:
+                message = Message(self._dbman, msg, thread=self)
+            else:
+                message.refresh(msg)
+            self._message_cache[mid] = message
+        return message
+
+    def get_matching_message_ids(self, query):
+        """
+        returns the ids of all messages in this thread that match `query`,
+        using a single lookup in the index.
+
+        :param query: The query to check against
+        :type query: string
+        :rtype: set of str
+        """
+        return self._dbman.get_message_ids(
+            'thread:{tid} AND ({subquery})'.format(tid=self._id,
+                                                   subquery=query))
+
     def get_replies_to(self, msg):
         """
         returns all replies to the given message contained in this thread.
@@ -9,6 +9,7 @@ import email.charset as charset
 import email.policy
 import email.utils
 from email.errors import MessageError
+import functools
 import tempfile
 import re
 import logging
@@ -19,6 +20,7 @@ import quopri
 
 from .. import crypto
 from .. import helper
+from . import signatures
 from ..errors import GPGProblem
 from ..settings.const import settings
 from ..helper import string_sanitize
@@ -44,6 +46,20 @@ def add_signature_headers(mail, sigs, error_msg):
     :param error_msg: An error message if there is one, or None
     :type error_msg: :class:`str` or `None`
     '''
+    valid, msg = _signature_headers(sigs, error_msg)
+    mail.add_header(X_SIGNATURE_VALID_HEADER, valid)
+    mail.add_header(X_SIGNATURE_MESSAGE_HEADER, msg)
+
+
+def _signature_headers(sigs, error_msg):
+    '''Returns the values of the pseudo headers added by
+    :func:`add_signature_headers`.
+
+    :param sigs: list of :class:`gpg.results.Signature`
+    :param error_msg: An error message if there is one, or None
+    :type error_msg: :class:`str` or `None`
+    :rtype: tuple(str, str)
+    '''
     sig_from = ''
     sig_known = True
     uid_trusted = False
@@ -74,9 +90,7 @@ def add_signature_headers(mail, sigs, error_msg):
     else:
         msg = 'Untrusted: {}'.format(sig_from)
 
-    mail.add_header(X_SIGNATURE_VALID_HEADER,
-                    'False' if (error_msg or not sig_known) else 'True')
-    mail.add_header(X_SIGNATURE_MESSAGE_HEADER, msg)
+    return 'False' if (error_msg or not sig_known) else 'True', msg
 
 
 def get_params(mail, failobj=None, header='content-type', unquote=True):
@@ -95,7 +109,78 @@ def get_params(mail, failobj=None, header='content-type', unquote=True):
     return {k.lower(): v for k, v in mail.get_params(failobj, header, unquote)}
 
 
-def _handle_signatures(original_bytes, original, message, params):
+def _set_signature_headers(mail, valid, message):
+    '''Set the pseudo headers added by :func:`add_signature_headers`,
+    replacing earlier values.'''
+    for key, value in ((X_SIGNATURE_VALID_HEADER, valid),
+                       (X_SIGNATURE_MESSAGE_HEADER, message)):
+        del mail[key]
+        mail.add_header(key, value)
+
+
+class PendingSignature:
+    """
+    A detached signature that has not been verified yet, see the
+    `deferred_signatures` parameter of :func:`decrypted_message_from_bytes`.
+    The pseudo headers of the mails in :attr:`mails` show the verification
+    as pending until its result is applied to them with :meth:`apply`.
+    """
+    def __init__(self, mid, signed, signature):
+        """
+        :param mid: id of the message the signature is part of
+        :type mid: str
+        :param signed: the signed data, in canonical form
+        :type signed: bytes
+        :param signature: the detached signature
+        :type signature: bytes
+        """
+        self.mid = mid
+        self.signed = signed
+        self.signature = signature
+        self.digest = signatures.digest(signed, signature)
+        self.mails = []
+        """mails whose pseudo headers describe this signature"""
+        self.headers = None
+        """values of the valid and message pseudo headers once verified"""
+
+    def cached(self):
+        '''returns the cached pseudo header values, or None'''
+        return signatures.get_cache().get(self.mid, self.digest)
+
+    def verify(self):
+        '''verify the signature unless the result is cached. This leaves
+        :attr:`mails` untouched and may be called from a worker thread.
+
+        :returns: the values of the valid and message pseudo headers
+        :rtype: tuple(str, str)
+        '''
+        headers = self.cached()
+        if headers is None:
+            try:
+                sigs = crypto.verify_detached(self.signed, self.signature)
+            except GPGProblem as error:
+                headers = _signature_headers([], str(error))
+            else:
+                headers = _signature_headers(sigs, None)
+            # failures may have transient causes, like a missing key or
+            # gpg-agent, so only successful verifications are kept
+            if headers[0] == 'True':
+                signatures.get_cache().put(self.mid, self.digest, *headers)
+        self.headers = headers
+        return headers
+
+    def apply(self):
+        '''set the pseudo headers of :attr:`mails` to the result of
+        :meth:`verify`, which is called first if necessary. Readers of the
+        mails do not expect them to change under their hands, so this is
+        to be called from the thread that displays them.'''
+        headers = self.headers or self.verify()
+        for mail in self.mails:
+            _set_signature_headers(mail, *headers)
+
+
+def _handle_signatures(original_bytes, original, message, params,
+                       deferred_signatures=None):
     """Shared code for handling message signatures.
 
     RFC 3156 is quite strict:
@@ -115,6 +200,9 @@ def _handle_signatures(original_bytes, original, message, params):
     :type message: :class:`email.message.Message`
     :param params: the message parameters as returned by :func:`get_params`
     :type params: dict[str, str]
+    :param deferred_signatures: if given, signatures are not verified but
+        added to this list
+    :type deferred_signatures: list of :class:`PendingSignature`
     """
     try:
         nb_parts = len(message.get_payload()) if message.is_multipart() else 1
@@ -142,35 +230,48 @@ def _handle_signatures(original_bytes, original, message, params):
         # The transmitted content and therefore the signed content are using
         # CRLF as line delimiter, but our eml file has most likely been
         # converted to UNIX LF line ending in the local storage.
-        if b'\r\n' not in original_bytes:
-            original_bytes = original_bytes.replace(b'\n', b'\r\n')
+        newline = b'\r\n' if b'\r\n' in original_bytes else b'\n'
 
         # The sender's signed canonical form often differs from the one
         # produced by Python's standard lib (in the number of blank lines
         # between multipart segments...). We therefore need to extract the
-        # signed part directly from the original byte string.
-        signed_boundary = b'\r\n--' + message.get_boundary().encode()
-        original_chunks = original_bytes.split(signed_boundary)
-        nb_chunks = len(original_chunks)
+        # signed part directly from the original byte string. Only the signed
+        # part is copied out of it, and converted to CRLF line endings.
+        signed_boundary = newline + b'--' + message.get_boundary().encode()
+        nb_chunks = original_bytes.count(signed_boundary) + 1
         if nb_chunks != 4:
             raise MessageError(
                 f'unexpected number of multipart chunks, got {nb_chunks}')
 
-        signed_chunk = original_chunks[1]
+        start = original_bytes.find(signed_boundary) + len(signed_boundary)
+        end = original_bytes.find(signed_boundary, start)
+        signed_chunk = original_bytes[start:end]
+        if newline != b'\r\n':
+            signed_chunk = signed_chunk.replace(b'\n', b'\r\n')
         if len(signed_chunk) < len(b'\r\n'):
             raise MessageError('signed chunk has an invalid length')
-
-        sigs = crypto.verify_detached(
-            signed_chunk[len(b'\r\n'):],
-            signature_part.get_payload(decode=True))
-
-        add_signature_headers(original, sigs, None)
+        signed_chunk = signed_chunk[len(b'\r\n'):]
+        signature = signature_part.get_payload(decode=True)
+
+        # verifying and looking up the signing key is expensive, reuse the
+        # result of earlier parses of the same message, or leave it for later
+        pending = PendingSignature(str(original.get('Message-ID', '')),
+                                   signed_chunk, signature)
+        headers = pending.cached()
+        if headers is None and deferred_signatures is not None:
+            pending.mails.append(original)
+            deferred_signatures.append(pending)
+            headers = ('False', 'Pending')
+        elif headers is None:
+            headers = pending.verify()
+        _set_signature_headers(original, *headers)
 
     except (GPGProblem, MessageError) as error:
         add_signature_headers(original, [], str(error))
 
 
-def _handle_encrypted(original, message, session_keys=None):
+def _handle_encrypted(original, message, session_keys=None,
+                      new_session_keys=None, deferred_signatures=None):
     """Handle encrypted messages helper.
 
     RFC 3156 is quite strict:
@@ -187,6 +288,12 @@ def _handle_encrypted(original, message, session_keys=None):
     :type message: :class:`email.message.Message`
     :param session_keys: a list OpenPGP session keys
     :type session_keys: [str]
+    :param new_session_keys: session keys of data that had to be decrypted
+        with a private key are appended to this list
+    :type new_session_keys: [str]
+    :param deferred_signatures: if given, detached signatures in the
+        decrypted data are not verified but added to this list
+    :type deferred_signatures: list of :class:`PendingSignature`
     """
     malformed = False
 
@@ -204,14 +311,19 @@ def _handle_encrypted(original, message, session_keys=None):
         # This should be safe because PGP uses US-ASCII characters only
         payload = message.get_payload(1).get_payload().encode('ascii')
         try:
-            sigs, d = crypto.decrypt_verify(payload, session_keys)
+            sigs, d, session_key = crypto.decrypt_verify_session_key(
+                payload, session_keys)
         except GPGProblem as e:
             # signature verification failures end up here too if the combined
             # method is used, currently this prevents the interpretation of the
             # recovered plain text mail. maybe that's a feature.
             malformed = str(e)
         else:
-            n = decrypted_message_from_bytes(d, session_keys)
+            if session_key and new_session_keys is not None:
+                new_session_keys.append(session_key)
+            n = decrypted_message_from_bytes(d, session_keys,
+                                             new_session_keys,
+                                             deferred_signatures)
 
             # add the decrypted message to message. note that n contains all
             # the attachments, no need to walk over n here.
@@ -230,6 +342,9 @@ def _handle_encrypted(original, message, session_keys=None):
                     for k in (X_SIGNATURE_VALID_HEADER,
                               X_SIGNATURE_MESSAGE_HEADER):
                         original[k] = n[k]
+                    for pending in deferred_signatures or []:
+                        if any(mail is n for mail in pending.mails):
+                            pending.mails.append(original)
             else:
                 # 'Combined method', the signatures are returned by the
                 # decrypt_verify function.
@@ -248,7 +363,9 @@ def _handle_encrypted(original, message, session_keys=None):
         original.attach(content)
 
 
-def _decrypted_message_from_message(original_bytes, m, session_keys=None):
+def _decrypted_message_from_message(original_bytes, m, session_keys=None,
+                                    new_session_keys=None,
+                                    deferred_signatures=None):
     '''Detect and decrypt OpenPGP encrypted data in an email object. If this
     succeeds, any mime messages found in the recovered plaintext
     message are added to the returned message object.
@@ -260,6 +377,10 @@ def _decrypted_message_from_message(original_bytes, m, session_keys=None):
     :type original_bytes: bytes
     :param m: an email object
     :param session_keys: a list OpenPGP session keys
+    :param new_session_keys: a list the session keys of data that had to be
+        decrypted with a private key are appended to
+    :param deferred_signatures: a list detached signatures are added to as
+        :class:`PendingSignature`, instead of being verified right away
     :returns: :class:`email.message.Message` possibly augmented with
               decrypted data
     '''
@@ -273,13 +394,14 @@ def _decrypted_message_from_message(original_bytes, m, session_keys=None):
         # handle OpenPGP signed data
         if (m.get_content_subtype() == 'signed' and
                 p.get('protocol') == _APP_PGP_SIG):
-            _handle_signatures(original_bytes, m, m, p)
+            _handle_signatures(original_bytes, m, m, p, deferred_signatures)
 
         # handle OpenPGP encrypted data
         elif (m.get_content_subtype() == 'encrypted' and
               p.get('protocol') == _APP_PGP_ENC and
               'Version: 1' in m.get_payload(0).get_payload()):
-            _handle_encrypted(m, m, session_keys)
+            _handle_encrypted(m, m, session_keys, new_session_keys,
+                              deferred_signatures)
 
         # It is also possible to put either of the abov into a multipart/mixed
         # segment
@@ -291,26 +413,34 @@ def _decrypted_message_from_message(original_bytes, m, session_keys=None):
 
                 if (sub.get_content_subtype() == 'signed' and
                         p.get('protocol') == _APP_PGP_SIG):
-                    _handle_signatures(original_bytes, m, sub, p)
+                    _handle_signatures(original_bytes, m, sub, p,
+                                       deferred_signatures)
                 elif (sub.get_content_subtype() == 'encrypted' and
                       p.get('protocol') == _APP_PGP_ENC):
-                    _handle_encrypted(m, sub, session_keys)
+                    _handle_encrypted(m, sub, session_keys,
+                                      new_session_keys, deferred_signatures)
 
     return m
 
 
-def decrypted_message_from_bytes(bytestring, session_keys=None):
+def decrypted_message_from_bytes(bytestring, session_keys=None,
+                                 new_session_keys=None,
+                                 deferred_signatures=None):
     """Create a Message from bytes.
 
     :param bytes bytestring: an email message as raw bytes
     :param session_keys: a list OpenPGP session keys
+    :param new_session_keys: a list the session keys of data that had to be
+        decrypted with a private key are appended to
+    :param deferred_signatures: a list detached signatures are added to as
+        :class:`PendingSignature`, instead of being verified right away
     """
     return _decrypted_message_from_message(
         bytestring,
         email.message_from_bytes(bytestring,
                                  _class=email.message.EmailMessage,
                                  policy=email.policy.SMTP),
-        session_keys)
+        session_keys, new_session_keys, deferred_signatures)
 
 
 def extract_headers(mail, headers=None):
@@ -510,20 +640,39 @@ def decode_header(header, normalize=False):
     encoded in quoted printable using different encodings.
     This turns it into a single unicode string
 
+    Results for string values are cached, as the same headers are decoded
+    over and over again while displaying threads.
+
     :param header: the header value
     :type header: str
     :param normalize: replace trailing spaces after newlines
     :type normalize: bool
     :rtype: str
     """
-    logging.debug("unquoted header: |%s|", header)
-
-    valuelist = email.header.decode_header(header)
-    decoded_list = []
-    for v, enc in valuelist:
-        v = string_decode(v, enc)
-        decoded_list.append(string_sanitize(v))
-    value = ''.join(decoded_list)
+    if isinstance(header, str):
+        return _decode_header_string(header, normalize)
+    return _decode_header(header, normalize)
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_header_string(header, normalize):
+    return _decode_header(header, normalize)
+
+
+def _decode_header(header, normalize):
+    """uncached version of :func:`decode_header`"""
+    if isinstance(header, str) and '=?' not in header:
+        # without encoded-words there is nothing to decode
+        value = string_sanitize(header)
+    else:
+        logging.debug("unquoted header: |%s|", header)
+
+        valuelist = email.header.decode_header(header)
+        decoded_list = []
+        for v, enc in valuelist:
+            v = string_decode(v, enc)
+            decoded_list.append(string_sanitize(v))
+        value = ''.join(decoded_list)
     if normalize:
         value = re.sub(r'\n\s+', r' ', value)
     return value
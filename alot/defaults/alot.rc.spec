@@ -4,6 +4,12 @@ ask_subject = boolean(default=True) # ask for subject when compose
 # automatically remove 'unread' tag when focussing messages in thread mode
 auto_remove_unread = boolean(default=True)
 
+# number of seconds without newly focussed unread messages after which the
+# 'unread' tags collected by :ref:`auto_remove_unread <auto-remove-unread>` are
+# removed in the index, all at once. Pending removals are also written out
+# when the thread buffer is closed.
+auto_remove_unread_delay = float(min=0, default=1.0)
+
 # prompt for initial tags when compose
 compose_ask_tags = boolean(default=False)
 
@@ -197,6 +203,11 @@ search_threads_limit = integer(default=0)
 # when set to 0, no limit is set (can be very slow in searches that yield thousands of results)
 search_threads_rebuild_limit = integer(default=0)
 
+# number of seconds to wait after the last keystroke in a live refine prompt
+# (see :ref:`refineprompt <cmd.search.refineprompt>`) before the results are
+# updated
+search_live_delay = float(default=0.3)
+
 # Maximum number of results in a search buffer before 'move last' builds the
 # thread list in reversed order as a heuristic. The resulting order will be
 # different for threads with multiple matching messages.
@@ -272,6 +283,11 @@ auto_replyto_mailinglist = boolean(default=False)
 # prefer plaintext alternatives over html content in multipart/alternative
 prefer_plaintext = boolean(default=False)
 
+# keep the results of OpenPGP signature verifications on disk, so that signed
+# mails are not verified again in later sessions as long as the keyring is
+# unchanged.
+persistent_signature_cache = boolean(default=False)
+
 # always edit the given body text alternative when editing outgoing messages in envelope mode.
 # alternative, and not the html source, even if that is currently displayed.
 # If unset, html content will be edited unless the current envelope shows the plaintext alternative.
@@ -315,6 +331,25 @@ thread_focus_linewise = boolean(default=True)
 # Unfold messages matching the query. If not set, will unfold all messages matching search buffer query.
 thread_unfold_matching = string(default=None)
 
+# send mails in the background: mails are put in an outbox, a queue in
+# `$XDG_DATA_HOME/alot/outbox`, and the envelope buffer is closed right away.
+# Mails that could not be sent are retried, also in the next session.
+# The state of the outbox is shown in the statusbar.
+send_in_background = boolean(default=False)
+
+# how often sending a mail from the outbox is retried before giving up,
+# see :ref:`send_in_background <send-in-background>`
+outbox_retries = integer(min=0, default=5)
+
+# number of seconds to wait before retrying to send a mail from the outbox.
+# The delay is doubled for every further retry.
+outbox_retry_delay = float(min=0, default=30.0)
+
+# number of worker threads that read and decode the messages to be unfolded
+# when a thread is opened. Message summaries are shown right away and the
+# bodies are filled in as they become available.
+thread_parse_workers = integer(min=1, default=4)
+
 
 # Key bindings
 [bindings]
@@ -353,6 +388,10 @@ thread_unfold_matching = string(default=None)
         # sendmail command. This is the shell command used to send out mails via the sendmail protocol
         sendmail_command = string(default='sendmail -t')
 
+        # number of mails sent at the same time by this account, when they are
+        # sent in the background (see :ref:`send_in_background <send-in-background>`)
+        send_concurrency = integer(min=1, default=1)
+
         # where to store outgoing mails, e.g. `maildir:///home/you/mail/Sent`,
         # `maildir://$MAILDIR/Sent` or `maildir://~/mail/Sent`.
         # You can use mbox, maildir, mh, babyl and mmdf in the protocol part of the URL.
@@ -52,6 +52,29 @@ def unicode_printable(c):
     return unicodedata.category(c) not in ('Cc', 'Cn', 'Co')
 
 
+# Matches what string_sanitize removes, keeping SGR sequences in group 1:
+# ANSI escape sequences consist of "parameter bytes" and "intermediate bytes"
+# followed by a final byte, which is consumed even if the sequence is invalid.
+# A lone ESC is removed as well.
+_SANITIZE = r'(\x1b\[[0-9:;<=>?]*[ -/]*m)|\x1b\[[0-9:;<=>?]*[ -/]*.?|\x1b'
+
+
+def _charset(chars):
+    """
+    the contents of a regex character class matching the sorted `chars`,
+    where runs of consecutive characters are merged into ranges
+    """
+    ranges = []
+    for c in chars:
+        if ranges and ord(c) == ord(ranges[-1][1]) + 1:
+            ranges[-1][1] = c
+        else:
+            ranges.append([c, c])
+    return ''.join(re.escape(first) if first == last else
+                   '%s-%s' % (re.escape(first), re.escape(last))
+                   for first, last in ranges)
+
+
 def string_sanitize(string, tab_width=8):
     r"""
     strips, and replaces non-printable characters
@@ -66,52 +89,27 @@ def string_sanitize(string, tab_width=8):
     'foo     bar'
     >>> string_sanitize('foo\t\tbar', 8)
     'foo             bar'
+    >>> string_sanitize('\x1b[1;31mred\x1b[0m \x1b[2Jcleared', 8)
+    '\x1b[1;31mred\x1b[0m cleared'
     """
-
-    preprocessed_string = ''
-    i = 0
-    while i < len(string):
-        # Check if this is the start of an allowed ANSI escape sequence. For
-        # security reasons, we only allow SGR (Select Graphic Rendition)
-        # parameters; i.e., sequences used for basic formatting such as
-        # coloring and font variants.
-        if string[i:i + 2] == '\x1b[':
-            j = i + 2
-            # Skip over all "parameter bytes" and "intermediate bytes"
-            for skip_chars in ('0123456789:;<=>?', ' !"#$%&\'()*+,-./'):
-                while j < len(string) and string[j] in skip_chars:
-                    j += 1
-            # Keep only SGR sequences in the preprocessed string
-            if j < len(string) and string[j] == 'm':
-                preprocessed_string += string[i:j + 1]
-            i = j + 1
-            continue
-
-        # Not a valid ANSI escape sequence, only allow printable characters.
-        if unicode_printable(string[i]):
-            preprocessed_string += string[i]
-        i += 1
-
-    lines = list()
-    for line in preprocessed_string.split('\n'):
-        tab_count = line.count('\t')
-
-        if tab_count > 0:
-            line_length = 0
-            new_line = list()
-            for i, chunk in enumerate(line.split('\t')):
-                line_length += len(chunk)
-                new_line.append(chunk)
-
-                if i < tab_count:
-                    next_tab_stop_in = tab_width - (line_length % tab_width)
-                    new_line.append(' ' * next_tab_stop_in)
-                    line_length += next_tab_stop_in
-            lines.append(''.join(new_line))
-        else:
-            lines.append(line)
-
-    return '\n'.join(lines)
+    # For security reasons, we only keep ANSI escape sequences that set SGR
+    # (Select Graphic Rendition) parameters; i.e., sequences used for basic
+    # formatting such as coloring and font variants. Apart from that only
+    # printable characters are allowed.
+    # The characters to remove are collected among the distinct characters of
+    # the string, which are usually few even for long texts.
+    rejected = sorted(c for c in set(string)
+                      if c != '\x1b' and not unicode_printable(c))
+    if rejected or '\x1b' in string:
+        pattern = _SANITIZE
+        if rejected:
+            pattern += '|[%s]+' % _charset(rejected)
+        string = re.sub(pattern, r'\1', string, flags=re.DOTALL)
+
+    if '\t' in string:
+        # only '\n' is left to reset the column, '\r' has been removed above
+        string = string.expandtabs(tab_width)
+    return string
 
 
 def string_decode(string, enc='ascii'):
@@ -0,0 +1,150 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+"""
+Cached view of the GPG keyring
+"""
+import os
+import re
+import threading
+import time
+
+import gpg
+
+# files and directories of the gpg home directory whose modification marks a
+# change of the keys or of their validity
+_KEYRING_FILES = ('pubring.kbx', 'pubring.gpg', 'secring.gpg', 'trustdb.gpg',
+                  'private-keys-v1.d')
+
+_HEX = re.compile(
+    r'^(0x)?([0-9a-f]{8}|[0-9a-f]{16}|[0-9a-f]{40}|[0-9a-f]{64})$',
+    re.IGNORECASE)
+
+
+def is_key_id(term):
+    """
+    returns True if `term` is a fingerprint or a long key id. Those identify
+    keys in the same way for gpgme and :meth:`Keyring.lookup`, unlike other
+    terms, which gpgme also matches against parts of user ids.
+
+    :param term: search term for a key
+    :type term: str
+    :rtype: bool
+    """
+    match = _HEX.match(term.strip())
+    return match is not None and len(match.group(2)) > 8
+
+
+def homedir():
+    """returns the gpg home directory in use"""
+    return os.environ.get('GNUPGHOME') or os.path.expanduser('~/.gnupg')
+
+
+class Keyring:
+    """
+    Cached list of the keys in the GPG keyring, indexed by fingerprint and
+    key id.
+
+    The keys are listed once and listed again only after the files of the
+    keyring changed, which is checked by their modification times, or once
+    one of the keys expired.
+    It is safe to use a keyring from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # cached keys and indices, for public and secret keys
+        self._cache = {}
+
+    def context(self):
+        """
+        returns a gpg context to be reused by the current thread
+
+        :rtype: gpg.Context
+        """
+        home = homedir()
+        if getattr(self._local, 'home', None) != home:
+            self._local.context = gpg.core.Context()
+            self._local.home = home
+        return self._local.context
+
+    @staticmethod
+    def stamp():
+        """
+        returns a value that identifies the current state of the keyring
+        files, and changes whenever keys or their validity change
+        """
+        home = homedir()
+        mtimes = []
+        for name in _KEYRING_FILES:
+            try:
+                mtimes.append(os.stat(os.path.join(home, name)).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return home, tuple(mtimes)
+
+    def _get(self, private):
+        """returns the up to date cache entry for public or secret keys"""
+        stamp = self.stamp()
+        with self._lock:
+            entry = self._cache.get(private)
+            if entry is None or entry['stamp'] != stamp \
+                    or time.time() >= entry['expires']:
+                keys = list(self.context().keylist(None, private))
+                entry = self._cache[private] = self._index(keys)
+                entry['stamp'] = stamp
+            return entry
+
+    @staticmethod
+    def _index(keys):
+        by_fpr = {}
+        by_keyid = {}
+        # when the first of the keys that are still valid expires
+        expires = float('inf')
+        now = time.time()
+        for key in keys:
+            for subkey in key.subkeys:
+                by_fpr.setdefault(subkey.fpr.upper(), []).append(key)
+                by_keyid.setdefault(subkey.keyid.upper(), []).append(key)
+                if now < subkey.expires < expires:
+                    expires = subkey.expires
+        return {'keys': keys, 'fpr': by_fpr, 'keyid': by_keyid,
+                'expires': expires}
+
+    def keys(self, private=False):
+        """
+        returns all keys of the keyring
+
+        :param private: return secret keys instead of public ones
+        :type private: bool
+        :rtype: list of gpg.gpgme._gpgme_key
+        """
+        return self._get(private)['keys']
+
+    def lookup(self, term, private=False):
+        """
+        returns the keys that match `term`, which is a fingerprint or a key
+        id. Other terms, like user ids or parts of them, match no key: gpgme
+        matches them against substrings of user ids, so only it can tell
+        which keys they select.
+
+        :param term: what to look for
+        :type term: str
+        :param private: look for secret keys instead of public ones
+        :type private: bool
+        :rtype: list of gpg.gpgme._gpgme_key
+        """
+        term = term.strip()
+        match = _HEX.match(term)
+        if match:
+            hexid = match.group(2).upper()
+            entry = self._get(private)
+            if len(hexid) == 8:
+                found = []
+                for keyid, keys in entry['keyid'].items():
+                    if keyid.endswith(hexid):
+                        found.extend(k for k in keys if k not in found)
+                return found
+            index = entry['keyid'] if len(hexid) == 16 else entry['fpr']
+            return list(index.get(hexid, []))
+        return []
@@ -8,6 +8,7 @@ import mailcap
 import os
 import re
 import email
+from datetime import datetime, timedelta
 from configobj import ConfigObj, Section
 
 from ..account import SendmailAccount
@@ -27,6 +28,13 @@ DATA_DIRS = get_xdg_env('XDG_DATA_DIRS',
                         '/usr/local/share:/usr/share').split(':')
 
 
+def _attr_key(attr):
+    """hashable stand-in for an urwid.AttrSpec, as used by resolve_att"""
+    if attr is None:
+        return None
+    return (attr.foreground, attr.background)
+
+
 class SettingsManager:
     """Organizes user settings"""
     def __init__(self):
@@ -39,6 +47,12 @@ class SettingsManager:
         self._notmuchconfig_path = None
         self._config = ConfigObj()
         self._bindings = None
+        # compiled [tags] rules and memoised tagstring representations,
+        # both are reset whenever the config is (re)loaded
+        self._tag_rules = None
+        self._tagstring_representations = {}
+        # cached results of represent_datetime
+        self._reset_datetime_representations()
 
     def reload(self):
         """Reload notmuch and alot config files"""
@@ -135,6 +149,10 @@ class SettingsManager:
         self._accounts = self._parse_accounts(self._config)
         self._accountmap = self._account_table(self._accounts)
 
+        self._tag_rules = None
+        self._tagstring_representations = {}
+        self._reset_datetime_representations()
+
     @staticmethod
     def _expand_config_values(section, key):
         """
@@ -308,7 +326,7 @@ class SettingsManager:
         colours = int(self._config.get('colourmode'))
         return self._theme.get_attribute(colours, mode, name, part)
 
-    def get_threadline_theming(self, thread):
+    def get_threadline_theming(self, thread, matches=None):
         """
         looks up theming info a threadline displaying a given thread. This
         wraps around :meth:`~alot.settings.theme.Theme.get_threadline_theming`,
@@ -316,9 +334,18 @@ class SettingsManager:
 
         :param thread: thread to theme
         :type thread: alot.db.thread.Thread
+        :param matches: decides if a thread matches a query of the theme
+        :type matches: callable taking a thread and a query string
         """
         colours = int(self._config.get('colourmode'))
-        return self._theme.get_threadline_theming(thread, colours)
+        return self._theme.get_threadline_theming(thread, colours, matches)
+
+    def get_threadline_queries(self):
+        """
+        returns the queries used to theme threadlines.
+        See :meth:`~alot.settings.theme.Theme.get_threadline_queries`.
+        """
+        return self._theme.get_threadline_queries()
 
     def get_tagstring_representation(self, tag, onebelow_normal=None,
                                      onebelow_focus=None):
@@ -341,8 +368,30 @@ class SettingsManager:
             :translated: to an alternative string representation
         """
         colourmode = int(self._config.get('colourmode'))
+        key = (tag, colourmode, _attr_key(onebelow_normal),
+               _attr_key(onebelow_focus))
+        representation = self._tagstring_representations.get(key)
+        if representation is None:
+            representation = self._represent_tagstring(
+                tag, colourmode, onebelow_normal, onebelow_focus)
+            self._tagstring_representations[key] = representation
+        return representation
+
+    def _get_tag_rules(self):
+        """
+        return the sections of the [tags] config together with their names
+        compiled into patterns that match whole tagstrings
+        """
+        if self._tag_rules is None:
+            cfg = self._config['tags']
+            self._tag_rules = [(re.compile('^{}$'.format(sec)), cfg[sec])
+                               for sec in cfg.sections]
+        return self._tag_rules
+
+    def _represent_tagstring(self, tag, colourmode, onebelow_normal,
+                             onebelow_focus):
+        """uncached version of :meth:`get_tagstring_representation`"""
         theme = self._theme
-        cfg = self._config
         colours = [1, 16, 256]
 
         def colourpick(triple):
@@ -362,18 +411,18 @@ class SettingsManager:
         fallback_normal = resolve_att(onebelow_normal, default_normal)
         fallback_focus = resolve_att(onebelow_focus, default_focus)
 
-        for sec in cfg['tags'].sections:
-            if re.match('^{}$'.format(sec), tag):
-                normal = resolve_att(colourpick(cfg['tags'][sec]['normal']),
+        for pattern, rule in self._get_tag_rules():
+            if pattern.match(tag):
+                normal = resolve_att(colourpick(rule['normal']),
                                      fallback_normal)
-                focus = resolve_att(colourpick(cfg['tags'][sec]['focus']),
+                focus = resolve_att(colourpick(rule['focus']),
                                     fallback_focus)
 
-                translated = cfg['tags'][sec]['translated']
+                translated = rule['translated']
                 translated = string_decode(translated, 'UTF-8')
                 if translated is None:
                     translated = tag
-                translation = cfg['tags'][sec]['translation']
+                translation = rule['translation']
                 if translation:
                     translated = re.sub(translation[0], translation[1], tag)
                 break
@@ -529,9 +578,35 @@ class SettingsManager:
         1) look if a fixed 'timestamp_format' is given in the config
         2) check if a 'timestamp_format' hook is defined
         3) use :func:`~alot.helper.pretty_datetime` as fallback
+
+        As the latter two are relative to the current time, their results are
+        only reused until the minute (for dates of the last day) or the day
+        (for older dates) changes.
         """
+        now = datetime.now()
+        minute = now.replace(second=0, microsecond=0)
+        if minute != self._datetime_minute:
+            self._datetime_minute = minute
+            self._datetime_reps_minute = {}
+            if minute.date() != self._datetime_day:
+                self._datetime_day = minute.date()
+                self._datetime_reps_day = {}
 
         fixed_format = self.get('timestamp_format')
+        if fixed_format:
+            cache = self._datetime_reps_fixed
+        elif self.get_hook('timestamp_format') or d > now - timedelta(days=1):
+            cache = self._datetime_reps_minute
+        else:
+            cache = self._datetime_reps_day
+
+        rep = cache.get(d)
+        if rep is None:
+            rep = cache[d] = self._represent_datetime(d, fixed_format)
+        return rep
+
+    def _represent_datetime(self, d, fixed_format):
+        """uncached version of :meth:`represent_datetime`"""
         if fixed_format:
             rep = string_decode(d.strftime(fixed_format), 'UTF-8')
         else:
@@ -541,3 +616,10 @@ class SettingsManager:
             else:
                 rep = pretty_datetime(d)
         return rep
+
+    def _reset_datetime_representations(self):
+        self._datetime_minute = None
+        self._datetime_day = None
+        self._datetime_reps_fixed = {}
+        self._datetime_reps_minute = {}
+        self._datetime_reps_day = {}
@@ -40,6 +40,19 @@ class Theme:
                         msg = 'missing threadline parts: %s' % ', '.join(diff)
                         raise ConfigError(msg)
 
+        # compile the threadline rules: the conditions of every 'threadline*'
+        # section in the order they are to be tried
+        self._threadline_rules = []
+        for sec in self._config['search'].sections:
+            if sec.startswith('threadline') and sec != 'threadline':
+                tline = self._config['search'][sec]
+                tags = tline.get('tagged_with')
+                if tags is not None:
+                    tags = frozenset(tags)
+                self._threadline_rules.append((sec, tags, tline.get('query')))
+        # filled-in theming per (matching section, colourmode)
+        self._threadline_theming = {}
+
     def get_attribute(self, colourmode, mode, name, part=None):
         """
         returns requested attribute
@@ -58,7 +71,7 @@ class Theme:
         thmble = thmble or DUMMYDEFAULT
         return thmble[self._colours.index(colourmode)]
 
-    def get_threadline_theming(self, thread, colourmode):
+    def get_threadline_theming(self, thread, colourmode, matches=None):
         """
         look up how to display a Threadline widget in search mode
         for a given thread.
@@ -67,6 +80,9 @@ class Theme:
         :type thread: alot.db.thread.Thread
         :param colourmode: colourmode to use, one of 1,16,256.
         :type colourmode: int
+        :param matches: decides if a thread matches the query of a rule;
+                        defaults to :meth:`alot.db.thread.Thread.matches`
+        :type matches: callable taking a thread and a query string
 
         This will return a dict mapping
             :normal: to `urwid.AttrSpec`,
@@ -84,30 +100,48 @@ class Theme:
                     with other 'weight' parts.
             :alignment: where to place the content if shorter than the widget.
                         This is either 'right', 'left' or 'center'.
+
+        The returned dict is shared between all threads themed alike and must
+        not be modified.
+        """
+        if matches is None:
+            matches = _thread_matches
+
+        threadtags = thread.get_tags()
+        match = 'threadline'
+        for name, tags, query in self._threadline_rules:
+            if tags is not None and not tags.issubset(threadtags):
+                continue
+            if query is not None and not matches(thread, query):
+                continue
+            match = name
+            break
+
+        key = (match, colourmode)
+        if key not in self._threadline_theming:
+            self._threadline_theming[key] = self._fill_threadline_theming(
+                self._config['search'][match], colourmode)
+        return self._threadline_theming[key]
+
+    def get_threadline_queries(self):
+        """
+        returns the queries used by the threadline rules, in the order in
+        which they are checked.
+
+        :rtype: list of str
+        """
+        return [query for _, _, query in self._threadline_rules
+                if query is not None]
+
+    def _fill_threadline_theming(self, match, colourmode):
+        """
+        build the theming for threadlines matched by section `match`,
+        see :meth:`get_threadline_theming`
         """
         def pickcolour(triple):
             return triple[self._colours.index(colourmode)]
 
-        def matches(sec, thread):
-            if sec.get('tagged_with') is not None:
-                if not set(sec['tagged_with']).issubset(thread.get_tags()):
-                    return False
-            if sec.get('query') is not None:
-                if not thread.matches(sec['query']):
-                    return False
-            return True
-
         default = self._config['search']['threadline']
-        match = default
-
-        candidates = self._config['search'].sections
-        for candidatename in candidates:
-            candidate = self._config['search'][candidatename]
-            if (candidatename.startswith('threadline') and
-                    (not candidatename == 'threadline') and
-                    matches(candidate, thread)):
-                match = candidate
-                break
 
         # fill in values
         res = {}
@@ -128,3 +162,7 @@ class Theme:
             res[part]['normal'] = pickcolour(fill('normal'))
             res[part]['focus'] = pickcolour(fill('focus'))
         return res
+
+
+def _thread_matches(thread, query):
+    return thread.matches(query)
@@ -11,10 +11,13 @@ import traceback
 
 import urwid
 
+from .account import Outbox, StoreMailError
 from .settings.const import settings
+from .settings.errors import NoMatchingAccount
 from .buffers import BufferlistBuffer
 from .buffers import SearchBuffer
 from .commands import globals
+from .commands.envelope import store_sent_mails
 from .commands import commandfactory
 from .commands import CommandCanceled, SequenceCanceled
 from .commands import CommandParseError
@@ -72,6 +75,9 @@ class UI:
         """stores partial keyboard input"""
         self.last_commandline = None
         """saves the last executed commandline"""
+        self.outbox = None
+        """queue of mails sent in the background
+        (:class:`~alot.account.Outbox`), see :meth:`get_outbox`"""
 
         # define empty notification pile
         self._notificationbar = None
@@ -138,12 +144,62 @@ class UI:
         # clear the screen before the initial frame
         self.mainloop.screen.clear()
 
+        # send mails in the background, starting with those left over
+        if settings.get('send_in_background'):
+            self.get_outbox(loop)
+
         logging.debug('fire first command')
         loop.create_task(self.apply_commandline(initialcmdline))
 
         # start urwids mainloop
         self.mainloop.run()
 
+    def get_outbox(self, loop=None):
+        """
+        return the outbox, creating it on first use.
+
+        A new outbox resumes sending the mails left over from earlier
+        sessions, so that enabling `send_in_background` by reloading the
+        config works as well as enabling it at startup.
+
+        :param loop: event loop to resume sending on, the current one if None
+        :rtype: :class:`~alot.account.Outbox`
+        """
+        if self.outbox is None:
+            self.outbox = Outbox(
+                os.path.join(get_xdg_env('XDG_DATA_HOME',
+                                         os.path.expanduser('~/.local/share')),
+                             'alot', 'outbox'),
+                retries=settings.get('outbox_retries'),
+                retry_delay=settings.get('outbox_retry_delay'),
+                sent=self._store_sent_mail,
+                failed=self._sending_failed,
+                changed=self.update)
+            loop = loop or asyncio.get_event_loop()
+            loop.create_task(self.outbox.resume(self._account_for))
+        return self.outbox
+
+    async def _store_sent_mail(self, account, mail, tags):
+        """store and index a mail sent from the outbox"""
+        try:
+            await store_sent_mails(self, account, [mail], tags)
+        except StoreMailError as e:
+            logging.error(traceback.format_exc())
+            self.notify('could not store mail: {}'.format(e),
+                        priority='error')
+
+    def _sending_failed(self, account, error):
+        self.notify('failed to send mail from {}: {}'.format(
+            account.address, error), priority='error')
+
+    @staticmethod
+    def _account_for(address):
+        """the account to send queued mails from `address` with"""
+        try:
+            return settings.account_matching_address(address)
+        except NoMatchingAccount:
+            return None
+
     def _error_handler(self, exception):
         if isinstance(exception, CommandParseError):
             self.notify(str(exception), priority='error')
@@ -302,7 +358,8 @@ class UI:
         self._unlock_callback = afterwards
         self._locked = True
 
-    def prompt(self, prefix, text='', completer=None, tab=0, history=None):
+    def prompt(self, prefix, text='', completer=None, tab=0, history=None,
+               on_change=None):
         """
         prompt for text input.
         This returns a :class:`asyncio.Future`, which will have a string value
@@ -318,6 +375,9 @@ class UI:
         :type tab: int
         :param history: history to be used for up/down keys
         :type history: list of str
+        :param on_change: called with the current content of the input field
+                          whenever it is edited
+        :type on_change: callable
         :rtype: asyncio.Future
         """
         history = history or []
@@ -349,6 +409,10 @@ class UI:
         for _ in range(tab):  # hit some tabs
             editpart.keypress((0,), 'tab')
 
+        if on_change is not None:
+            urwid.connect_signal(editpart, 'postchange',
+                                 lambda w, _old: on_change(w.edit_text))
+
         # build promptwidget
         both = urwid.Columns(
             [
@@ -693,6 +757,8 @@ class UI:
         pending_writes = len(self.dbman.writequeue)
         if pending_writes > 0:
             righttxt = ('|' * pending_writes) + ' ' + righttxt
+        if self.outbox:
+            righttxt = '[%s] %s' % (self.outbox.status(), righttxt)
         footerright = urwid.Text(righttxt, align='right')
         columns = urwid.Columns([
             footerleft,
@@ -763,6 +829,7 @@ class UI:
                                    size=size)
         self._save_history_to_file(self.recipienthistory,
                                    self._recipients_hist_file, size=size)
+        self.dbman.cleanup()
 
     @staticmethod
     def _load_history_from_file(path, size=-1):
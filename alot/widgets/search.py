@@ -7,22 +7,48 @@ Widgets specific to search mode
 import urwid
 
 from ..settings.const import settings
+from ..db.snippets import SNIPPET_LENGTH, extract_snippet
 from ..helper import shorten_author_string
 from .utils import AttrFlipWidget
 from .globals import TagWidget
 
+SNIPPET_PLACEHOLDER = '...'
+"""shown in the content part for messages whose preview is not ready yet"""
+MARK = '*'
+"""shown in front of marked threads"""
+
 
 class ThreadlineWidget(urwid.AttrMap):
     """
     selectable line widget that represents a :class:`~alot.db.Thread`
     in the :class:`~alot.buffers.SearchBuffer`.
     """
-    def __init__(self, tid, dbman):
+    def __init__(self, tid, dbman, matches=None, redraw=None, is_marked=None):
+        """
+        :param tid: id of the thread to display
+        :type tid: str
+        :param dbman: database manager to look up the thread with
+        :type dbman: :class:`~alot.db.DBManager`
+        :param matches: decides if the thread matches a query of the theme,
+                        see :meth:`~alot.settings.theme.Theme.get_threadline_theming`
+        :type matches: callable
+        :param redraw: called when this line changed in the background, e.g.
+                       once the message previews for its content are ready
+        :type redraw: callable
+        :param is_marked: decides if a thread id is marked, in which case the
+                          line starts with :data:`MARK`
+        :type is_marked: callable
+        """
         self.dbman = dbman
         self.tid = tid
+        self.matches = matches
+        self.redraw = redraw
+        self.is_marked = is_marked
         self.thread = None  # will be set by refresh()
         self.tag_widgets = []
         self.structure = None
+        # the size and canvas rendered last, per focus state
+        self._canvases = {}
         self.rebuild()
         normal = self.structure['normal']
         focussed = self.structure['focus']
@@ -31,7 +57,8 @@ class ThreadlineWidget(urwid.AttrMap):
     def rebuild(self):
         self.thread = self.dbman.get_thread(self.tid)
         self.widgets = []
-        self.structure = settings.get_threadline_theming(self.thread)
+        self.structure = settings.get_threadline_theming(self.thread,
+                                                         self.matches)
 
         columns = []
 
@@ -44,6 +71,11 @@ class ThreadlineWidget(urwid.AttrMap):
                 columnentry = ('fixed', width, part)
             columns.append(columnentry)
 
+        if self.is_marked is not None and self.is_marked(self.tid):
+            mark = AttrFlipWidget(urwid.Text(MARK), self.structure)
+            columns.append(('fixed', len(MARK), mark))
+            self.widgets.append(mark)
+
         # create a column for every part of the threadline
         for partname in self.structure['parts']:
             # build widget(s) around this part's content and remember them so
@@ -56,6 +88,17 @@ class ThreadlineWidget(urwid.AttrMap):
                     add_column(width, part)
                     for w in part.widget_list:
                         self.widgets.append(w)
+            elif partname == 'content':
+                # only the ids are looked up, the messages themselves are
+                # read by the snippet index in the background
+                mids = self.dbman.get_message_ids('thread:' + self.tid,
+                                                  sort='newest_first')
+                width, part = build_text_part(partname, self.thread,
+                                              self.structure[partname],
+                                              self.dbman.snippets, mids)
+                add_column(width, part)
+                self.widgets.append(part)
+                self._request_snippets(mids)
             else:
                 width, part = build_text_part(partname, self.thread,
                                               self.structure[partname])
@@ -65,10 +108,39 @@ class ThreadlineWidget(urwid.AttrMap):
         self.columns = urwid.Columns(columns, dividechars=1)
         self.original_widget = self.columns
 
+    def _request_snippets(self, mids):
+        """extract missing message previews and rebuild once they are ready"""
+        snippets = self.dbman.snippets
+        missing = [mid for mid, snippet in iter_previews(mids, snippets)
+                   if snippet is None]
+        if missing:
+            snippets.request(missing).add_done_callback(self._snippets_ready)
+
+    def _snippets_ready(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.rebuild()
+        if self.redraw is not None:
+            self.redraw()
+
+    def _invalidate(self):
+        # called when the line changed, e.g. by rebuild() replacing its
+        # columns
+        self._canvases = {}
+        urwid.AttrMap._invalidate(self)
+
     def render(self, size, focus=False):
+        # a threadline only ever shows up focussed or unfocussed, so reuse
+        # the canvas rendered before rather than flipping the attributes of
+        # all parts and re-rendering the columns every time
+        cached = self._canvases.get(focus)
+        if cached is not None and cached[0] == size:
+            return cached[1]
         for w in self.widgets:
             w.set_map('focus' if focus else 'normal')
-        return urwid.AttrMap.render(self, size, focus)
+        canvas = urwid.AttrMap.render(self, size, focus)
+        self._canvases[focus] = (size, canvas)
+        return canvas
 
     def selectable(self):
         return True
@@ -113,7 +185,7 @@ def build_tags_part(tags, attr_normal, attr_focus):
     return width, part_w
 
 
-def build_text_part(name, thread, struct):
+def build_text_part(name, thread, struct, snippets=None, mids=None):
     """
     create an urwid.Text widget (wrapped in approproate Attributes)
     to display a plain text parts in a threadline.
@@ -127,6 +199,10 @@ def build_text_part(name, thread, struct):
     :param struct: theming attributes for this part, as provided by
                    :class:`alot.settings.theme.Theme.get_threadline_theming`
     :type struct: dict
+    :param snippets: index to look up message previews in
+    :type snippets: :class:`alot.db.snippets.SnippetIndex`
+    :param mids: ids of the messages to show previews of, the newest first
+    :type mids: list of str
     :return: overall width (in characters) and a widget.
     :rtype: tuple[int, AttrFliwWidget]
     """
@@ -142,7 +218,7 @@ def build_text_part(name, thread, struct):
         if width_tuple[0] == 'fit':
             minw, maxw = width_tuple[1:]
 
-    content = prepare_string(name, thread, maxw)
+    content = prepare_string(name, thread, maxw, snippets, mids)
 
     # pad content if not long enough
     if minw:
@@ -181,18 +257,39 @@ def prepare_subject_string(thread):
     return thread.get_subject() or ' '
 
 
-def prepare_content_string(thread):
-    msgs = sorted(thread.get_messages().keys(),
+def newest_messages(thread):
+    """returns the messages of `thread`, the newest first"""
+    return sorted(thread.get_messages().keys(),
                   key=lambda msg: msg.get_date(), reverse=True)
-    lastcontent = ' '.join(m.get_body_text() for m in msgs)
-    lastcontent = lastcontent.replace('^>.*$', '')
-    return lastcontent
 
 
-def prepare_string(partname, thread, maxw):
+def iter_previews(mids, snippets):
+    """
+    yield message ids together with their preview as found in `snippets`,
+    or None if that has not been extracted yet, until the content part of a
+    threadline is filled.
+    """
+    length = 0
+    for mid in mids:
+        if length >= SNIPPET_LENGTH:
+            break
+        snippet = snippets.get(mid)
+        yield mid, snippet
+        length += SNIPPET_LENGTH if snippet is None else len(snippet) + 1
+
+
+def prepare_content_string(thread, snippets=None, mids=None):
+    if snippets is None:
+        return ' '.join(extract_snippet(m) for m in newest_messages(thread))
+    return ' '.join(SNIPPET_PLACEHOLDER if snippet is None else snippet
+                    for _, snippet in iter_previews(mids, snippets))
+
+
+def prepare_string(partname, thread, maxw, snippets=None, mids=None):
     """
     extract a content string for part 'partname' from 'thread' of maximal
-    length 'maxw'.
+    length 'maxw'. Previews for the 'content' part are looked up in
+    'snippets', for the messages with ids 'mids'.
     """
     # map part names to function extracting content string and custom shortener
     prep = {
@@ -209,7 +306,10 @@ def prepare_string(partname, thread, maxw):
         content, shortener = prep[partname]
 
         # get string
-        s = content(thread)
+        if partname == 'content':
+            s = content(thread, snippets, mids)
+        else:
+            s = content(thread)
 
     # sanitize
     s = s.replace('\n', ' ')
@@ -4,8 +4,11 @@
 """
 Widgets specific to thread mode
 """
+import array
+import collections
 import email
 import logging
+import re
 import urwid
 
 from urwidtrees import Tree, SimpleTree, CollapsibleTree, ArrowTree
@@ -47,14 +50,8 @@ class MessageSummaryWidget(urwid.WidgetWrap):
         txt = urwid.Text(sumstr)
         cols.append(txt)
 
-        if settings.get('msg_summary_hides_threadwide_tags'):
-            thread_tags = message.get_thread().get_tags(intersection=True)
-            outstanding_tags = set(message.get_tags()).difference(thread_tags)
-            tag_widgets = sorted(TagWidget(t, attr, focus_att)
-                                 for t in outstanding_tags)
-        else:
-            tag_widgets = sorted(TagWidget(t, attr, focus_att)
-                                 for t in message.get_tags())
+        self.tags = self.displayed_tags(message)
+        tag_widgets = sorted(TagWidget(t, attr, focus_att) for t in self.tags)
         for tag_widget in tag_widgets:
             if not tag_widget.hidden:
                 cols.append(('fixed', tag_widget.width(), tag_widget))
@@ -75,6 +72,14 @@ class MessageSummaryWidget(urwid.WidgetWrap):
 
         urwid.WidgetWrap.__init__(self, line)
 
+    @staticmethod
+    def displayed_tags(message):
+        """returns the set of tags shown in the summary of `message`"""
+        if settings.get('msg_summary_hides_threadwide_tags'):
+            thread_tags = message.get_thread().get_tags(intersection=True)
+            return set(message.get_tags()).difference(thread_tags)
+        return set(message.get_tags())
+
     def __str__(self):
         author, address = self.message.get_author()
         date = self.message.get_datestring()
@@ -90,24 +95,106 @@ class MessageSummaryWidget(urwid.WidgetWrap):
         return key
 
 
-class TextlinesList(SimpleTree):
+# line boundaries, as recognized by str.splitlines
+_LINE_BREAK = re.compile('\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+class TextlinesList(Tree):
+    """
+    :class:`Tree` that contains a flat list of all-level-0 Text widgets, one
+    for each line in a (possibly huge) text.
+
+    Only the offsets of the lines are indexed upfront. Widgets are created
+    when their line is displayed and only a limited number of them is kept.
+    """
+    # number of line widgets to keep, enough for a few screens full of text
+    CACHE_SIZE = 512
+
     def __init__(self, content, attr=None, attr_focus=None):
         """
-        :class:`SimpleTree` that contains a list of all-level-0 Text widgets
-        for each line in content.
+        :param content: text to display
+        :type content: str
+        :param attr: theming attribute for the lines
+        :type attr: urwid.AttrSpec
+        :param attr_focus: theming attribute for the focussed line
+        :type attr_focus: urwid.AttrSpec
         """
-        structure = []
+        self._content = content
+        self._attr = attr
+        self._attr_focus = attr_focus
+        self._widgets = collections.OrderedDict()
 
         # depending on this config setting, we either add individual lines
         # or the complete context as focusable objects.
         if settings.get('thread_focus_linewise'):
-            for line in content.splitlines():
-                structure.append((ANSIText(line, attr, attr_focus,
-                                           ANSI_BACKGROUND), None))
+            # index start and end offsets of all lines in content, without
+            # creating a string for every line
+            self._starts = array.array('q', [0])
+            self._ends = array.array('q')
+            for match in _LINE_BREAK.finditer(content):
+                self._ends.append(match.start())
+                self._starts.append(match.end())
+            if self._starts[-1] < len(content):
+                self._ends.append(len(content))
+            else:
+                # like splitlines, there is no empty line after the last
+                # line break
+                self._starts.pop()
         else:
-            structure.append((ANSIText(content, attr, attr_focus,
-                                       ANSI_BACKGROUND), None))
-        SimpleTree.__init__(self, structure)
+            self._starts = array.array('q', [0])
+            self._ends = array.array('q', [len(content)])
+        self.root = (0,) if self._starts else None
+
+    def _index(self, pos):
+        """returns the line number at `pos`, or None for invalid positions"""
+        if pos is not None and len(pos) == 1 and \
+                0 <= pos[0] < len(self._starts):
+            return pos[0]
+        return None
+
+    # Tree API
+    def __getitem__(self, pos):
+        index = self._index(pos)
+        if index is None:
+            return None
+        widget = self._widgets.get(index)
+        if widget is None:
+            line = self._content[self._starts[index]:self._ends[index]]
+            widget = ANSIText(line, self._attr, self._attr_focus,
+                              ANSI_BACKGROUND)
+            self._widgets[index] = widget
+            if len(self._widgets) > self.CACHE_SIZE:
+                self._widgets.popitem(last=False)
+        else:
+            self._widgets.move_to_end(index)
+        return widget
+
+    @staticmethod
+    def parent_position(pos):
+        return None
+
+    def next_sibling_position(self, pos):
+        index = self._index(pos)
+        if index is not None and index + 1 < len(self._starts):
+            return (index + 1,)
+        return None
+
+    def prev_sibling_position(self, pos):
+        index = self._index(pos)
+        if index:
+            return (index - 1,)
+        return None
+
+    # optimizations
+    def first_sibling_position(self, pos):
+        return self.root
+
+    def last_sibling_position(self, pos):
+        return (len(self._starts) - 1,) if self._starts else None
+
+    @staticmethod
+    def depth(pos):
+        return 0
 
 
 class DictList(SimpleTree):
@@ -158,16 +245,22 @@ class MessageTree(CollapsibleTree):
 
     Collapsing this message corresponds to showing the summary only.
     """
-    def __init__(self, message, odd=True):
+    def __init__(self, message, odd=True, verified=None):
         """
         :param message: Message to display
         :type message: alot.db.Message
         :param odd: theme summary widget as if this is an odd line
                     (in the message-pile)
         :type odd: bool
+        :param verified: called with this tree once the signatures of the
+                         message have been verified in the background and the
+                         tree has been updated accordingly
+        :type verified: callable
         """
         self._message = message
         self._odd = odd
+        self._verified = verified
+        self._verifying = None
         self.display_source = False
         self._summaryw = None
         self._bodytree = None
@@ -192,6 +285,29 @@ class MessageTree(CollapsibleTree):
         self._summaryw = None
         self.reassemble()
 
+    def update(self, odd):
+        """
+        update this tree after the message has been refreshed from the index.
+        The summary (and headers) are only rebuilt if its tags changed or it
+        moved to a line of different parity.
+
+        :param odd: theme summary widget as if this is an odd line
+        :type odd: bool
+        """
+        if self._summaryw is not None and odd == self._odd and \
+                self._summaryw.tags == \
+                MessageSummaryWidget.displayed_tags(self._message):
+            return
+        self._odd = odd
+        self._summaryw = None
+        self._all_headers_tree = None
+        self._default_headers_tree = None
+        if self._maintree._treelist[0][1] is None:
+            # never unfolded, do not read the message now
+            self._maintree._treelist = self._assemble_structure(True)
+        else:
+            self.reassemble()
+
     def debug(self):
         logging.debug('collapsed %s', self.is_collapsed(self.root))
         logging.debug('display_source %s', self.display_source)
@@ -214,6 +330,29 @@ class MessageTree(CollapsibleTree):
         if not self._bodytree:
             self.reassemble()
         CollapsibleTree.expand(self, pos)
+        if self._message.signatures_pending():
+            self._verify_signatures()
+
+    def _verify_signatures(self):
+        """verify the signatures of the message on a worker thread"""
+        if self._verifying is not None:
+            return
+        self._verifying = self._message.check_signatures()
+        if self._verifying is not None:
+            self._verifying.add_done_callback(self._signatures_verified)
+
+    def _signatures_verified(self, future):
+        self._verifying = None
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.error('cannot verify signatures: %s', future.exception())
+        # show the results in the pseudo headers
+        self._all_headers_tree = None
+        self._default_headers_tree = None
+        self.reassemble()
+        if callable(self._verified):
+            self._verified(self)
 
     def _assemble_structure(self, summary_only=False):
         if summary_only:
@@ -371,48 +510,85 @@ class ThreadTree(Tree):
     :class:`MessageTrees <MessageTree>` that display this threads individual
     messages. As MessageTreess are *not* urwid widgets themself this is to be
     used in combination with :class:`NestedTree` only.
+
+    The tree structure is read from the message ids in the thread only.
+    Messages and their MessageTrees are created when a position is first
+    accessed, e.g. because it becomes visible.
     """
-    def __init__(self, thread):
+    def __init__(self, thread, messagetrees=None, verified=None):
+        """
+        :param thread: thread to display
+        :type thread: :class:`~alot.db.Thread`
+        :param messagetrees: message trees of a previous tree for the same
+                             thread, by message id. Those of messages still
+                             in the thread are reused.
+        :type messagetrees: dict of str to :class:`MessageTree`
+        :param verified: passed on to new :class:`MessageTrees <MessageTree>`
+        :type verified: callable
+        """
         self._thread = thread
-        self.root = thread.get_toplevel_messages()[0].get_message_id()
+        self._verified = verified
+        toplevel, replies = thread.get_structure()
+        self.root = toplevel[0]
         self._parent_of = {}
         self._first_child_of = {}
         self._last_child_of = {}
         self._next_sibling_of = {}
         self._prev_sibling_of = {}
+        self._odd = {}
         self._message = {}
 
-        def accumulate(msg, odd=True):
-            """recursively read msg and its replies"""
-            mid = msg.get_message_id()
-            self._message[mid] = MessageTree(msg, odd)
+        def accumulate(mid, odd=True):
+            """recursively read the structure below mid"""
+            self._odd[mid] = odd
             odd = not odd
             last = None
             self._first_child_of[mid] = None
-            for reply in thread.get_replies_to(msg):
-                rid = reply.get_message_id()
+            for rid in replies[mid]:
                 if self._first_child_of[mid] is None:
                     self._first_child_of[mid] = rid
                 self._parent_of[rid] = mid
                 self._prev_sibling_of[rid] = last
                 self._next_sibling_of[last] = rid
                 last = rid
-                odd = accumulate(reply, odd)
+                odd = accumulate(rid, odd)
             self._last_child_of[mid] = last
             return odd
 
         last = None
-        for msg in thread.get_toplevel_messages():
-            mid = msg.get_message_id()
+        for mid in toplevel:
             self._prev_sibling_of[mid] = last
             self._next_sibling_of[last] = mid
-            accumulate(msg)
+            accumulate(mid)
             last = mid
         self._next_sibling_of[last] = None
 
+        for mid, mt in (messagetrees or {}).items():
+            if mid in self._odd:
+                mt.update(self._odd[mid])
+                self._message[mid] = mt
+
+    def loaded_messagetrees(self):
+        """
+        returns the :class:`MessageTrees <MessageTree>` created so far, by
+        message id
+        """
+        return dict(self._message)
+
+    def is_loaded(self, pos):
+        """
+        returns True if the :class:`MessageTree` at `pos` has been created
+        """
+        return pos in self._message
+
     # Tree API
     def __getitem__(self, pos):
-        return self._message.get(pos)
+        mt = self._message.get(pos)
+        if mt is None and pos in self._odd:
+            mt = MessageTree(self._thread.get_message(pos), self._odd[pos],
+                             self._verified)
+            self._message[pos] = mt
+        return mt
 
     def parent_position(self, pos):
         return self._parent_of.get(pos)
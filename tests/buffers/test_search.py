@@ -0,0 +1,139 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.buffers.search module."""
+
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from alot.buffers import search
+
+from .. import utilities
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.ui.dbman.get_thread_match_counts.side_effect = \
+            lambda query, *args: {'thread of ' + query: 1}
+        self.ui.dbman.count_messages.return_value = 1
+        self.buffer = search.SearchBuffer(self.ui, 'original')
+        self.addCleanup(self.buffer.cleanup)
+
+    @utilities.async_test
+    async def test_preview(self):
+        self.assertTrue(await self.buffer.preview('new', 10))
+        self.assertEqual(self.buffer.querystring, 'new')
+        self.assertEqual(list(self.buffer._matched), ['thread of new'])
+        self.ui.dbman.get_thread_match_counts.assert_called_with(
+            'new', self.buffer.sort_order, 10)
+
+    @utilities.async_test
+    async def test_superseded(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def counts(query, *args):
+            if query == 'first':
+                started.set()
+                release.wait(5)
+            return {'thread of ' + query: 1}
+        self.ui.dbman.get_thread_match_counts.side_effect = counts
+
+        loop = asyncio.get_running_loop()
+        first = asyncio.ensure_future(self.buffer.preview('first', 10))
+        await loop.run_in_executor(None, started.wait, 5)
+        second = asyncio.ensure_future(self.buffer.preview('second', 10))
+        release.set()
+        self.assertFalse(await first)
+        self.assertTrue(await second)
+        self.assertEqual(self.buffer.querystring, 'second')
+        self.assertEqual(list(self.buffer._matched), ['thread of second'])
+
+    @utilities.async_test
+    async def test_late_result_is_dropped(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def counts(query, *args):
+            started.set()
+            release.wait(5)
+            return {'thread of ' + query: 1}
+        self.ui.dbman.get_thread_match_counts.side_effect = counts
+
+        loop = asyncio.get_running_loop()
+        preview = asyncio.ensure_future(self.buffer.preview('new', 10))
+        await loop.run_in_executor(None, started.wait, 5)
+        self.buffer.cancel_preview()
+        release.set()
+        self.assertFalse(await preview)
+        self.assertEqual(self.buffer.querystring, 'original')
+        self.assertEqual(list(self.buffer._matched), ['thread of original'])
+
+
+class TestMarks(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.ui.dbman.get_thread_match_counts.return_value = \
+            {'a': 1, 'b': 2, 'c': 1}
+        self.buffer = search.SearchBuffer(self.ui, 'tag:inbox')
+        self.buffer.marked = {'a', 'c'}
+
+    def test_reconcile_removes_unlisted_thread(self):
+        self.ui.dbman.get_thread_match_counts.return_value = {}
+        self.buffer.reconcile(['c'])
+        self.assertEqual(self.buffer.marked, {'a'})
+        self.assertEqual(self.buffer.result_count, 3)
+        self.assertEqual(list(self.buffer.threadlist.iterable), ['a', 'b'])
+
+    def test_removed_thread_is_not_marked_by_query(self):
+        self.ui.dbman.get_thread_match_counts.return_value = {}
+        self.buffer.reconcile(['c'])
+        self.ui.dbman.get_thread_match_counts.return_value = \
+            {'b': 2, 'c': 1}
+        self.assertEqual(self.buffer.mark_matching('tag:todo'), 1)
+        self.assertEqual(self.buffer.marked, {'a', 'b'})
+
+    @utilities.async_test
+    async def test_preview_keeps_marks(self):
+        self.ui.dbman.get_thread_match_counts.return_value = {'b': 2}
+        self.ui.dbman.count_messages.return_value = 2
+        self.assertTrue(await self.buffer.preview('tag:todo', 10))
+        self.buffer.cleanup()
+        self.assertEqual(self.buffer.marked, {'a', 'c'})
+
+
+class TestThemingMatches(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.ui.mainloop.screen.get_cols_rows.return_value = (80, 2)
+        self.ui.dbman.get_thread_match_counts.return_value = \
+            {'a': 1, 'b': 1, 'c': 1, 'd': 1}
+        self.buffer = search.SearchBuffer(self.ui, 'tag:inbox')
+        self.ui.dbman.get_thread_match_counts.reset_mock()
+        self.ui.dbman.get_thread_match_counts.return_value = {'c': 1}
+
+    def _thread(self, tid):
+        thread = mock.Mock()
+        thread.get_thread_id.return_value = tid
+        return thread
+
+    def test_pages_follow_the_thread(self):
+        with mock.patch('alot.buffers.search.settings.get_threadline_queries',
+                        mock.Mock(return_value=['tag:todo'])):
+            self.assertTrue(
+                self.buffer._thread_matches(self._thread('c'), 'tag:todo'))
+            self.assertFalse(
+                self.buffer._thread_matches(self._thread('d'), 'tag:todo'))
+            self.assertFalse(
+                self.buffer._thread_matches(self._thread('a'), 'tag:todo'))
+        self.assertEqual(
+            [c.args[0] for c in
+             self.ui.dbman.get_thread_match_counts.call_args_list],
+            ['(tag:todo) AND (thread:c OR thread:d)',
+             '(tag:todo) AND (thread:a OR thread:b)'])
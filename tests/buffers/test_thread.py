@@ -0,0 +1,38 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.buffers.thread module."""
+
+import functools
+import unittest
+from unittest import mock
+
+from alot.buffers import thread
+
+from .. import utilities
+
+
+class TestGetMatchingMids(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.ui.dbman.writes = 0
+        self.buffer = mock.Mock(ui=self.ui, _matching_mids={},
+                                _matching_writes=None)
+        self.buffer.thread.get_matching_message_ids.return_value = {'a'}
+        self.get_matching_mids = functools.partial(
+            thread.ThreadBuffer.get_matching_mids, self.buffer)
+
+    def test_cached(self):
+        self.assertEqual(self.get_matching_mids('tag:foo'), {'a'})
+        self.assertEqual(self.get_matching_mids('tag:foo'), {'a'})
+        self.buffer.thread.get_matching_message_ids.assert_called_once_with(
+            'tag:foo')
+
+    def test_writes_invalidate_cache(self):
+        self.get_matching_mids('tag:foo')
+        # tags were written, e.g. from another buffer
+        self.ui.dbman.writes += 1
+        self.get_matching_mids('tag:foo')
+        self.assertEqual(
+            self.buffer.thread.get_matching_message_ids.call_count, 2)
@@ -28,6 +28,7 @@ from alot.db.envelope import Envelope
 from alot.errors import GPGProblem
 from alot.settings.errors import NoMatchingAccount
 from alot.settings.manager import SettingsManager
+from alot.ui import UI
 from alot.account import Account
 
 from .. import utilities
@@ -383,3 +384,39 @@ class TestSendCommand(unittest.TestCase):
                                                          return_default=True)
         # check that the apply did run through till the end.
         account.send_mail.assert_called_once_with(mail)
+
+    @utilities.async_test
+    async def test_send_in_background(self):
+        cmd = envelope.SendCommand(mail=self.mail)
+        account = mock.Mock(wraps=self.MockedAccount())
+        ui = mock.Mock()
+        with mock.patch(
+                'alot.commands.envelope.settings.account_matching_address',
+                mock.Mock(return_value=account)), \
+                mock.patch('alot.commands.envelope.settings.get',
+                           lambda key, *_: key == 'send_in_background'):
+            await cmd.apply(ui)
+        ui.get_outbox().enqueue.assert_called_once_with(
+            account, self.mail, [], afterwards=mock.ANY)
+        account.send_mail.assert_not_called()
+
+    @utilities.async_test
+    async def test_outbox_created_on_first_use(self):
+        # send_in_background may be enabled by reloading the config, after
+        # the ui started without an outbox
+        cmd = envelope.SendCommand(mail=self.mail)
+        account = mock.Mock(wraps=self.MockedAccount())
+        ui = mock.Mock(outbox=None)
+        ui.get_outbox = UI.get_outbox.__get__(ui)
+        with mock.patch(
+                'alot.commands.envelope.settings.account_matching_address',
+                mock.Mock(return_value=account)), \
+                mock.patch('alot.commands.envelope.settings.get',
+                           lambda key, *_: key == 'send_in_background'), \
+                mock.patch('alot.ui.Outbox') as outbox:
+            outbox.return_value.resume = mock.AsyncMock()
+            await cmd.apply(ui)
+        self.assertIs(ui.outbox, outbox.return_value)
+        ui.outbox.resume.assert_called_once_with(ui._account_for)
+        ui.outbox.enqueue.assert_called_once_with(
+            account, self.mail, [], afterwards=mock.ANY)
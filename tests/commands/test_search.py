@@ -0,0 +1,244 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Test suite for alot.commands.search module."""
+import asyncio
+import mailbox
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from notmuch2 import NotmuchError
+
+from alot.commands import search
+from alot.errors import GPGProblem
+from alot.ui import UI
+
+from .. import utilities
+
+
+class TestBulkCommands(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.messages = []
+        for i in range(3):
+            path = os.path.join(self.tmp, str(i))
+            with open(path, 'wb') as f:
+                f.write(b'Subject: %d\n\nFrom here\n' % i)
+            self.messages.append(('id%d' % i, path))
+        self.ui = utilities.make_ui()
+        self.ui.current_buffer.querystring = 'tag:inbox'
+        self.ui.current_buffer.marked = set()
+        self.ui.dbman.count_messages.return_value = len(self.messages)
+        self.ui.dbman.get_message_files.side_effect = \
+            lambda _: iter(self.messages)
+
+    @utilities.async_test
+    async def test_export_mbox(self):
+        path = os.path.join(self.tmp, 'out.mbox')
+        await search.ExportCommand(path).apply(self.ui)
+        box = mailbox.mbox(path)
+        self.assertEqual([m['Subject'] for m in box], ['0', '1', '2'])
+        self.assertEqual(box[0].get_payload(), '>From here\n')
+        self.ui.notify.assert_called_with(
+            'exported 3 messages to %s' % path)
+
+    @utilities.async_test
+    async def test_export_maildir(self):
+        path = os.path.join(self.tmp, 'out')
+        await search.ExportCommand(path, format='maildir').apply(self.ui)
+        box = mailbox.Maildir(path)
+        self.assertEqual(sorted(m['Subject'] for m in box), ['0', '1', '2'])
+
+    @utilities.async_test
+    async def test_pipe_ids(self):
+        cmd = search.PipeCommand(['cat'], format='id', notify_stdout=True)
+        await cmd.apply(self.ui)
+        self.ui.notify.assert_called_with('id0\nid1\nid2')
+
+    @utilities.async_test
+    async def test_pipe_error(self):
+        cmd = search.PipeCommand(['cat > /dev/null; echo oops >&2'])
+        await cmd.apply(self.ui)
+        self.ui.notify.assert_called_with('oops\n', priority='error')
+
+    @utilities.async_test
+    async def test_pipe_empty_stdout(self):
+        cmd = search.PipeCommand(['cat > /dev/null'], notify_stdout=True)
+        await cmd.apply(self.ui)
+        self.assertNotIn(mock.call(''), self.ui.notify.call_args_list)
+
+    @utilities.async_test
+    async def test_index_error(self):
+        def fail(_):
+            raise NotmuchError('index gone')
+            yield
+        self.ui.dbman.get_message_files.side_effect = fail
+        await search.PipeCommand(['cat'], format='id').apply(self.ui)
+        self.ui.notify.assert_called_with('index gone', priority='error')
+
+    @utilities.async_test
+    async def test_decryption_error(self):
+        cmd = search.PipeCommand(['cat'], format='decoded')
+        with mock.patch('alot.commands.search.decrypted_message_from_bytes',
+                        side_effect=GPGProblem('no key', code=1)):
+            await cmd.apply(self.ui)
+        self.ui.notify.assert_called_with('no key', priority='error')
+
+    @utilities.async_test
+    async def test_no_messages(self):
+        self.ui.dbman.count_messages.return_value = 0
+        await search.ExportCommand('unused').apply(self.ui)
+        self.ui.dbman.get_message_files.assert_not_called()
+
+    @utilities.async_test
+    async def test_marked_threads(self):
+        self.ui.current_buffer.marked = {'t1', 't2'}
+        self.ui.current_buffer.marked_query.return_value = \
+            'thread:t1 OR thread:t2'
+        await search.PipeCommand(['cat'], format='id').apply(self.ui)
+        self.ui.dbman.count_messages.assert_called_once_with(
+            '(tag:inbox) AND (thread:t1 OR thread:t2)')
+
+    @utilities.async_test
+    async def test_progress_is_cleared(self):
+        self.ui._notificationbar = None
+        self.ui.notify = UI.notify.__get__(self.ui)
+        self.ui.clear_notify = UI.clear_notify.__get__(self.ui)
+        clock = iter(range(0, 100, 1))
+        with mock.patch('alot.ui.settings'), \
+                mock.patch('alot.commands.search.time.monotonic',
+                           lambda: next(clock)):
+            await search.PipeCommand(['cat'], format='id').apply(self.ui)
+        self.assertEqual(len(self.ui._notificationbar.widget_list), 1)
+
+    def test_process_is_abstract(self):
+        with self.assertRaises(TypeError):
+            search.BulkCommand()
+
+
+class TestRefinePromptCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.buffer = self.ui.current_buffer
+        self.buffer.querystring = 'original'
+        self.buffer.preview = mock.AsyncMock(return_value=True)
+        self.ui.mainloop.screen.get_cols_rows.return_value = (80, 24)
+        self.alarms = []
+
+        def set_alarm_in(delay, callback):
+            self.alarms.append(callback)
+            return len(self.alarms)
+        self.ui.mainloop.set_alarm_in.side_effect = set_alarm_in
+        patcher = mock.patch('alot.commands.search.QueryCompleter')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _prompt(self, *typed, result=None):
+        async def prompt(*args, on_change, **kwargs):
+            for text in typed:
+                on_change(text)
+            # the last alarm fires once the user stopped typing
+            self.alarms[-1]()
+            await asyncio.sleep(0)
+            return result
+        self.ui.prompt = prompt
+
+    @utilities.async_test
+    async def test_debounced(self):
+        self._prompt('t', 'ta', 'tag', result='tag')
+        await search.RefinePromptCommand(live=True).apply(self.ui)
+        self.assertEqual(self.ui.mainloop.remove_alarm.call_args_list,
+                         [mock.call(1), mock.call(2)])
+        self.buffer.preview.assert_awaited_once_with('tag', 24)
+        self.assertEqual(self.buffer.querystring, 'tag')
+        self.buffer.rebuild.assert_called_once_with(restore_focus=False)
+
+    @utilities.async_test
+    async def test_cancel_restores_results(self):
+        self._prompt('tag', result=None)
+        await search.RefinePromptCommand(live=True).apply(self.ui)
+        self.buffer.cancel_preview.assert_called_once_with()
+        self.assertEqual(self.buffer.querystring, 'original')
+        self.buffer.rebuild.assert_called_once_with(restore_focus=False)
+        self.buffer.focus_thread.assert_called_once_with(
+            self.buffer.get_selected_thread.return_value)
+
+    @utilities.async_test
+    async def test_cancel_without_preview(self):
+        self.buffer.preview.return_value = False
+        self._prompt('tag', result=None)
+        await search.RefinePromptCommand(live=True).apply(self.ui)
+        self.buffer.rebuild.assert_not_called()
+        self.buffer.focus_thread.assert_not_called()
+
+    @utilities.async_test
+    async def test_unchanged_query(self):
+        self._prompt('original', result='original')
+        await search.RefinePromptCommand(live=True).apply(self.ui)
+        self.assertEqual(self.buffer.querystring, 'original')
+        self.buffer.rebuild.assert_called_once_with(restore_focus=False)
+        self.buffer.focus_thread.assert_called_once_with(
+            self.buffer.get_selected_thread.return_value)
+
+
+class TestTagCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.ui.current_buffer.querystring = 'tag:inbox'
+        threadline = self.ui.current_buffer.get_selected_threadline()
+        threadline.get_thread().get_thread_id.return_value = 'selected'
+
+    @utilities.async_test
+    async def test_selected_thread(self):
+        self.ui.current_buffer.marked = set()
+        await search.TagCommand('foo', flush=False).apply(self.ui)
+        self.ui.dbman.tag.assert_called_once_with(
+            'thread:selected', ['foo'], remove_rest=False,
+            afterwards=mock.ANY)
+
+    @utilities.async_test
+    async def test_marked_threads(self):
+        self.ui.current_buffer.marked = {'t2', 't1'}
+        await search.TagCommand('foo', action='remove',
+                                flush=False).apply(self.ui)
+        self.ui.dbman.untag.assert_called_once_with(
+            'thread:t1 OR thread:t2', ['foo'], afterwards=mock.ANY)
+        afterwards = self.ui.dbman.untag.call_args[1]['afterwards']
+        afterwards()
+        self.ui.current_buffer.schedule_reconcile.assert_called_once_with(
+            {'t1', 't2'})
+
+
+class TestMarkCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = utilities.make_ui()
+        self.buffer = self.ui.current_buffer
+        self.buffer.get_selected_threadline().tid = 'selected'
+
+    def test_toggle(self):
+        search.MarkCommand().apply(self.ui)
+        self.buffer.toggle_mark.assert_called_once_with('selected')
+
+    def test_mark_marked(self):
+        self.buffer.is_marked.return_value = True
+        search.MarkCommand(action='mark').apply(self.ui)
+        self.buffer.toggle_mark.assert_not_called()
+
+    def test_query(self):
+        self.buffer.mark_matching.return_value = 2
+        search.MarkCommand(action='mark', query=['tag:foo']).apply(self.ui)
+        self.buffer.mark_matching.assert_called_once_with('tag:foo', True)
+        self.ui.notify.assert_called_once_with('marked 2 threads')
+
+    def test_unmark_all(self):
+        self.buffer.marked = {'t1'}
+        search.MarkCommand(action='unmark', allthreads=True).apply(self.ui)
+        self.buffer.set_marks.assert_called_once_with(['t1'], False)
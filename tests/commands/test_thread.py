@@ -5,12 +5,18 @@
 
 """Test suite for alot.commands.thread module."""
 import email
+import functools
+import os
+import tempfile
 import unittest
 from unittest import mock
 
+from alot.buffers.thread import ThreadBuffer
 from alot.commands import thread
 from alot.account import Account
 
+from .. import utilities
+
 # Good descriptive test names often don't fit PEP8, which is meant to cover
 # functions meant to be called by humans.
 # pylint: disable=invalid-name
@@ -151,3 +157,120 @@ class TestDetermineSender(unittest.TestCase):
         expected = ('to+some_tag@example.com', account2)
         self._test(accounts=[account1, account2, account3], expected=expected,
                    mail=mail)
+
+
+class TestPipeCommand(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.out = os.path.join(self.tmp, 'out')
+        self.messages = []
+        for i in range(3):
+            path = os.path.join(self.tmp, str(i))
+            with open(path, 'wb') as f:
+                f.write(b'Subject: %d\n\nbody \xff\n' % i)
+            msg = mock.Mock()
+            msg.get_message_id.return_value = 'id%d' % i
+            msg.get_filename.return_value = path
+            msg.get_tags.return_value = []
+            self.messages.append(msg)
+        thread_ = mock.Mock()
+        thread_.get_messages.return_value = dict.fromkeys(self.messages)
+        self.ui = utilities.make_ui()
+        self.ui.current_buffer.get_selected_thread.return_value = thread_
+
+    def _output(self):
+        with open(self.out, 'rb') as f:
+            return f.read()
+
+    @utilities.async_test
+    async def test_raw_from_disk(self):
+        cmd = thread.PipeCommand(['cat > ' + self.out], all=True)
+        await cmd.apply(self.ui)
+        self.assertEqual(self._output(), b'\n\n'.join(
+            b'Subject: %d\n\nbody \xff\n' % i for i in range(3)))
+        for msg in self.messages:
+            msg.get_email.assert_not_called()
+        self.ui.notify.assert_not_called()
+
+    @utilities.async_test
+    async def test_background_ids(self):
+        cmd = thread.PipeCommand(['cat > ' + self.out], all=True,
+                                 background=True, format='id')
+        await cmd.apply(self.ui)
+        self.assertEqual(self._output(), b'id0\nid1\nid2')
+
+    @utilities.async_test
+    async def test_background_stdout(self):
+        cmd = thread.PipeCommand(['wc -l'], all=True, background=True,
+                                 notify_stdout=True, format='filepath')
+        await cmd.apply(self.ui)
+        self.ui.notify.assert_called_once_with(b'2\n')
+
+    @utilities.async_test
+    async def test_separately(self):
+        cmd = thread.PipeCommand(['cat >> ' + self.out], all=True,
+                                 separately=True, background=True,
+                                 format='id')
+        await cmd.apply(self.ui)
+        self.assertEqual(self._output(), b'id0id1id2')
+
+    @utilities.async_test
+    async def test_command_stops_reading(self):
+        cmd = thread.PipeCommand(['true'], all=True, background=True)
+        await cmd.apply(self.ui)
+        self.ui.notify.assert_not_called()
+
+    @utilities.async_test
+    async def test_stderr(self):
+        cmd = thread.PipeCommand(['echo oops >&2'], all=True)
+        await cmd.apply(self.ui)
+        self.ui.notify.assert_called_once_with(b'oops\n', priority='error')
+
+
+class _TagDB:
+    """Applies queued (un)tag operations of a single message on flush."""
+
+    def __init__(self, tags):
+        self.tags = set(tags)
+        self.queue = []
+
+    def tag(self, query, tags, remove_rest=False, afterwards=None):
+        self.queue.append((self.tags.update, tags, afterwards))
+
+    def untag(self, query, tags, afterwards=None):
+        self.queue.append((self.tags.difference_update, tags, afterwards))
+
+    def flush(self):
+        for apply, tags, afterwards in self.queue:
+            apply(tags)
+            if afterwards is not None:
+                afterwards()
+        self.queue = []
+
+
+class TestTagCommand(unittest.TestCase):
+
+    @utilities.async_test
+    async def test_tag_unread_survives_auto_removal(self):
+        ui = utilities.make_ui()
+        ui.dbman = _TagDB(['inbox', 'unread'])
+        ui.apply_command = mock.AsyncMock()
+        msg = mock.Mock(_dbman=ui.dbman, _tags=frozenset(ui.dbman.tags))
+        msg.get_message_id.return_value = 'mid'
+        tbuffer = ui.current_buffer
+        tbuffer.ui = ui
+        tbuffer.get_selected_mid.return_value = 'mid'
+        tbuffer._auto_unread_dont_touch_mids = set()
+        tbuffer._auto_unread_alarm = None
+        tbuffer.flush_unread = functools.partial(ThreadBuffer.flush_unread,
+                                                 tbuffer)
+        # the message was focussed, its unread tag is to be removed
+        tbuffer._auto_unread_batch = [msg]
+        await thread.TagCommand('unread', flush=False).apply(ui)
+        # the delay expires
+        tbuffer.flush_unread()
+        ui.dbman.flush()
+        self.assertIn('unread', ui.dbman.tags)
@@ -18,6 +18,7 @@ import email.parser
 import email.policy
 import os
 import tempfile
+import threading
 import unittest
 from unittest import mock
 import sys
@@ -25,6 +26,8 @@ import sys
 from alot.db import envelope
 from alot.account import Account
 
+from .. import utilities
+
 SETTINGS = {
     'user_agent': 'agent',
 }
@@ -128,3 +131,69 @@ class TestEnvelope(unittest.TestCase):
         raw = mail.as_string(policy=email.policy.SMTP, maxheaderlen=sys.maxsize)
         actual = email.parser.Parser().parsestr(raw)
         self.assertEqual('Test email =?utf-8?b?aMOpaMOp?=', actual['Subject'])
+
+    @mock.patch('alot.db.envelope.settings', SETTINGS)
+    @utilities.async_test
+    async def test_construct_mail_async(self):
+        e = envelope.Envelope(account=test_account,
+                              headers={'To': ['bar@example.com']},
+                              bodytext='Test')
+        mail = await e.construct_mail_async()
+        self.assertEqual(mail['To'], 'bar@example.com')
+        self.assertEqual(mail.get_payload(decode=True), b'Test')
+
+    @mock.patch('alot.db.envelope.settings', SETTINGS)
+    @utilities.async_test
+    async def test_construct_mail_async_signed(self):
+        # a pinentry must not run while urwid reads the terminal
+        e = envelope.Envelope(account=test_account,
+                              headers={'To': ['bar@example.com']},
+                              bodytext='Test')
+        e.sign = True
+        e.sign_key = mock.sentinel.key
+        signature = mock.Mock(hash_algo=8)
+        threads = []
+
+        def sign(*args):
+            threads.append(threading.current_thread())
+            return [signature], b'sig'
+        with mock.patch('alot.db.envelope.crypto') as crypto:
+            crypto.detached_signature_for.side_effect = sign
+            crypto.RFC3156_micalg_from_algo.return_value = 'pgp-sha256'
+            mail = await e.construct_mail_async()
+        self.assertEqual(threads, [threading.main_thread()])
+        self.assertEqual(mail.get_content_type(), 'multipart/signed')
+
+    @mock.patch('alot.db.envelope.settings', SETTINGS)
+    def test_sign_and_encrypt_reuses_signed_part(self):
+        e = envelope.Envelope(account=test_account,
+                              headers={'To': ['bar@example.com']},
+                              bodytext='Test')
+        e.sign = True
+        e.encrypt = True
+        e.encrypt_keys = {'fpr': mock.sentinel.key}
+        signature = mock.Mock(hash_algo=8)
+        with mock.patch('alot.db.envelope.crypto') as crypto:
+            crypto.detached_signature_for.return_value = ([signature], b'sig')
+            crypto.RFC3156_micalg_from_algo.return_value = 'pgp-sha256'
+            crypto.encrypt.return_value = b'encrypted'
+            e.construct_mail()
+        signed = crypto.detached_signature_for.call_args[0][0]
+        plaintext = crypto.encrypt.call_args[0][0]
+        self.assertIn(b'\r\n' + signed + b'\r\n', plaintext)
+        parsed = email.message_from_bytes(plaintext)
+        self.assertEqual(parsed.get_content_type(), 'multipart/signed')
+        self.assertEqual(parsed.get_payload(1).get_payload(), 'sig')
+
+
+class TestSerialisedParts(unittest.TestCase):
+
+    def test_known_part_is_not_generated_again(self):
+        outer = envelope.MIMEMultipart('mixed')
+        part = envelope.MIMEText('original')
+        outer.attach(part)
+        serialised = {id(part): b'Content-Type: text/plain\r\n\r\nknown'}
+        data = envelope._as_bytes(outer, serialised)
+        self.assertIn(b'\r\nContent-Type: text/plain\r\n\r\nknown\r\n',
+                      data)
+        self.assertNotIn(b'original', data)
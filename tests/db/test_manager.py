@@ -8,8 +8,10 @@ import os
 import shutil
 import tempfile
 import textwrap
+import unittest
 from unittest import mock
 
+from alot.db.errors import DatabaseError, DatabaseROError
 from alot.db.manager import DBManager
 from alot.settings.const import settings
 from notmuch2 import Database
@@ -59,3 +61,46 @@ class TestDBManager(utilities.TestCaseClassCleanup):
 
             named_queries_dict = self.manager.get_named_queries()
             self.assertDictEqual(named_queries_dict, {alias: querystring})
+
+    def test_writes_are_counted(self):
+        writes = self.manager.writes
+        self.manager.tag('*', ['foo'])
+        self.manager.flush()
+        self.assertEqual(self.manager.writes, writes + 1)
+
+
+class TestAddMessage(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = DBManager('/path/to/db')
+
+    def test_single_path(self):
+        self.manager.add_message('/path/to/db/new/a', ['sent'])
+        self.assertEqual(list(self.manager.writequeue),
+                         [('add', None, ['/path/to/db/new/a'], ['sent'])])
+
+    def test_paths_are_added_in_one_transaction(self):
+        paths = ['/path/to/db/new/a', '/path/to/db/new/b']
+        self.manager.add_message(paths, ['sent'])
+        self.assertEqual(list(self.manager.writequeue),
+                         [('add', None, paths, ['sent'])])
+
+    def test_path_outside_of_db(self):
+        with self.assertRaises(DatabaseError):
+            self.manager.add_message(['/path/to/db/new/a', '/elsewhere/b'])
+        self.assertFalse(self.manager.writequeue)
+
+
+class TestAddProperties(unittest.TestCase):
+
+    def test_queued(self):
+        manager = DBManager('/path/to/db')
+        manager.add_properties('mid', 'session-key', ('9:AB',))
+        self.assertEqual(list(manager.writequeue),
+                         [('properties', None, 'mid', 'session-key',
+                           ['9:AB'])])
+
+    def test_read_only(self):
+        manager = DBManager('/path/to/db', ro=True)
+        with self.assertRaises(DatabaseROError):
+            manager.add_properties('mid', 'session-key', ['9:AB'])
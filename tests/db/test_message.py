@@ -14,12 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import threading
 import unittest
 from unittest import mock
 
 from alot import account
 from alot.db import message
 
+from .. import utilities
+
 
 class MockNotmuchMessage(object):
     """An object that looks very much like a notmuch message.
@@ -120,3 +123,161 @@ class TestMessage(unittest.TestCase):
                         mock.Mock(return_value=[acc])):
             msg = message.Message(mock.Mock(), MockNotmuchMessage())
         self.assertEqual(msg.get_author(), ('Unknown', ''))
+
+    def test_parse(self):
+        msg = message.Message(mock.Mock(), MockNotmuchMessage())
+        self.assertFalse(msg.is_parsed())
+        with mock.patch('alot.db.message.utils.decrypted_message_from_bytes'), \
+                mock.patch('builtins.open', mock.mock_open(read_data=b'')), \
+                mock.patch('alot.db.message.get_body_part'), \
+                mock.patch('alot.db.message.extract_body_part',
+                           mock.Mock(return_value='body')) as extract:
+            msg.parse()
+            self.assertTrue(msg.is_parsed())
+            self.assertEqual(msg.get_body_text(), 'body')
+        extract.assert_called_once()
+
+    def _get_email(self, decrypt):
+        """parse a message that is decrypted with a new session key"""
+        dbman = mock.Mock(ro=False)
+        msg = message.Message(dbman, MockNotmuchMessage())
+
+        def decrypt_message(data, session_keys, new_session_keys, deferred):
+            new_session_keys.append('9:AB')
+
+        with mock.patch('alot.db.message.utils.decrypted_message_from_bytes',
+                        decrypt_message), \
+                mock.patch('builtins.open', mock.mock_open(read_data=b'')), \
+                mock.patch('alot.db.message.settings.get_notmuch_setting',
+                           mock.Mock(return_value=decrypt)):
+            msg.get_email()
+        return msg, dbman
+
+    def test_session_keys_are_stashed(self):
+        msg, dbman = self._get_email('true')
+        dbman.add_properties.assert_called_once_with(
+            'message id', 'session-key', ['9:AB'])
+        self.assertEqual(msg._session_keys, ['9:AB'])
+
+    def test_session_keys_are_not_stashed_by_default(self):
+        for decrypt in ['auto', 'nostash', 'false']:
+            with self.subTest(decrypt=decrypt):
+                msg, dbman = self._get_email(decrypt)
+                dbman.add_properties.assert_not_called()
+                self.assertEqual(msg._session_keys, ['9:AB'])
+
+    def _signed(self):
+        """read a message with a signature whose verification is pending"""
+        msg = message.Message(mock.Mock(), MockNotmuchMessage())
+        pending = mock.Mock()
+
+        def decrypt_message(data, session_keys, new_session_keys, deferred):
+            deferred.append(pending)
+            return mock.Mock()
+
+        with mock.patch('alot.db.message.utils.decrypted_message_from_bytes',
+                        decrypt_message), \
+                mock.patch('builtins.open', mock.mock_open(read_data=b'')):
+            msg.get_email()
+        return msg, pending
+
+    def test_verify_signatures(self):
+        msg, pending = self._signed()
+        self.assertTrue(msg.signatures_pending())
+        pending.verify.assert_not_called()
+        self.assertEqual(msg.verify_signatures(), [pending])
+        pending.verify.assert_called_once_with()
+        # the results are only shown once applied
+        pending.apply.assert_not_called()
+        self.assertTrue(msg.signatures_pending())
+        msg.apply_signatures([pending])
+        pending.apply.assert_called_once_with()
+        self.assertFalse(msg.signatures_pending())
+
+    @utilities.async_test
+    async def test_body_text_checks_signatures(self):
+        msg, pending = self._signed()
+        with mock.patch('alot.db.message.get_body_part'), \
+                mock.patch('alot.db.message.extract_body_part',
+                           mock.Mock(return_value='body')):
+            self.assertEqual(msg.get_body_text(), 'body')
+        await msg.check_signatures()
+        pending.verify.assert_called_once_with()
+        pending.apply.assert_called_once_with()
+        self.assertFalse(msg.signatures_pending())
+        self.assertIsNone(msg.check_signatures())
+
+    def test_body_text_in_worker_leaves_signatures_pending(self):
+        msg, pending = self._signed()
+        with mock.patch('alot.db.message.get_body_part'), \
+                mock.patch('alot.db.message.extract_body_part'):
+            msg.get_body_text()
+        pending.verify.assert_not_called()
+        self.assertTrue(msg.signatures_pending())
+
+    def test_email_is_read_once(self):
+        msg = message.Message(mock.Mock(), MockNotmuchMessage())
+        started = threading.Event()
+        release = threading.Event()
+
+        def decrypt_message(*args):
+            started.set()
+            release.wait(5)
+            return mock.Mock()
+        decrypt = mock.Mock(side_effect=decrypt_message)
+
+        with mock.patch('alot.db.message.utils.decrypted_message_from_bytes',
+                        decrypt), \
+                mock.patch('builtins.open', mock.mock_open(read_data=b'')):
+            worker = threading.Thread(target=msg.get_email)
+            worker.start()
+            started.wait(5)
+            other = threading.Thread(target=msg.get_email)
+            other.start()
+            release.set()
+            worker.join(5)
+            other.join(5)
+        decrypt.assert_called_once()
+
+    def test_attachments_are_found_once(self):
+        msg = message.Message(mock.Mock(), MockNotmuchMessage())
+        started = threading.Event()
+        release = threading.Event()
+
+        def find_attachments():
+            started.set()
+            release.wait(5)
+            return []
+        results = []
+        with mock.patch.object(msg, '_find_attachments',
+                               mock.Mock(side_effect=find_attachments)) \
+                as find:
+            worker = threading.Thread(
+                target=lambda: results.append(msg.get_attachments()))
+            worker.start()
+            started.wait(5)
+            other = threading.Thread(
+                target=lambda: results.append(msg.get_attachments()))
+            other.start()
+            release.set()
+            worker.join(5)
+            other.join(5)
+        find.assert_called_once_with()
+        self.assertIs(results[0], results[1])
+
+    def test_remove_tags_from_all(self):
+        dbman = mock.Mock()
+        msgs = []
+        for mid in ['a', 'b"c']:
+            nmmsg = MockNotmuchMessage(tags={'unread', 'inbox'})
+            nmmsg.mock_message_id = mid
+            msgs.append(message.Message(dbman, nmmsg))
+        callback = mock.Mock()
+        message.Message.remove_tags_from_all(msgs, ['unread'], callback)
+        query, tags, afterwards = dbman.untag.call_args[0]
+        self.assertEqual(query, 'id:"a" OR id:"b""c"')
+        self.assertEqual(tags, ['unread'])
+        afterwards()
+        for msg in msgs:
+            self.assertEqual(msg.get_tags(), ['inbox'])
+        callback.assert_called_once_with()
@@ -0,0 +1,61 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.db.signatures module."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from alot.db import signatures
+
+
+class TestDigest(unittest.TestCase):
+
+    def test_signature_is_part_of_digest(self):
+        self.assertNotEqual(signatures.digest(b'data', b'sig1'),
+                            signatures.digest(b'data', b'sig2'))
+
+    def test_data_and_signature_are_separated(self):
+        self.assertNotEqual(signatures.digest(b'data', b'sig'),
+                            signatures.digest(b'datas', b'ig'))
+
+
+class TestSignatureCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'alot', 'signatures.sqlite')
+        stamp = mock.patch('alot.db.signatures.crypto.keyring.stamp',
+                           mock.Mock(return_value='keyring'))
+        self.stamp = stamp.start()
+        self.addCleanup(stamp.stop)
+
+    def test_unknown(self):
+        cache = signatures.SignatureCache()
+        self.assertIsNone(cache.get('mid', 'digest'))
+
+    def test_put(self):
+        cache = signatures.SignatureCache()
+        cache.put('mid', 'digest', 'True', 'Valid: me')
+        self.assertEqual(cache.get('mid', 'digest'), ('True', 'Valid: me'))
+        self.assertIsNone(cache.get('other', 'digest'))
+
+    def test_keyring_changes(self):
+        cache = signatures.SignatureCache()
+        cache.put('mid', 'digest', 'True', 'Valid: me')
+        self.stamp.return_value = 'changed keyring'
+        self.assertIsNone(cache.get('mid', 'digest'))
+
+    def test_persistent(self):
+        signatures.SignatureCache(self.path).put('mid', 'digest', 'False',
+                                                 'Invalid: bad')
+        cache = signatures.SignatureCache(self.path)
+        self.assertEqual(cache.get('mid', 'digest'), ('False', 'Invalid: bad'))
+
+    def test_not_persistent(self):
+        signatures.SignatureCache().put('mid', 'digest', 'True', 'Valid: me')
+        self.assertIsNone(signatures.SignatureCache().get('mid', 'digest'))
+        self.assertFalse(os.path.exists(self.path))
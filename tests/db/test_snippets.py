@@ -0,0 +1,143 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.db.snippets module."""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from alot.db import snippets
+
+
+def _message(mid, body, tags=()):
+    msg = mock.Mock()
+    msg.get_message_id.return_value = mid
+    msg.get_body_text.return_value = body
+    msg.get_tags.return_value = list(tags)
+    return msg
+
+
+class TestExtractSnippet(unittest.TestCase):
+
+    def test_quotes_are_dropped(self):
+        msg = _message('a', 'On Monday, you wrote:\n> quoted\n  > nested\nreply')
+        self.assertEqual(snippets.extract_snippet(msg),
+                         'On Monday, you wrote: reply')
+
+    def test_whitespace_is_collapsed(self):
+        msg = _message('a', 'some\t\ttext\n\n  more   text')
+        self.assertEqual(snippets.extract_snippet(msg), 'some text more text')
+
+    def test_truncated(self):
+        msg = _message('a', 'x' * 1000)
+        self.assertEqual(snippets.extract_snippet(msg, 10), 'x' * 10)
+
+
+class TestSnippetIndex(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'alot', 'snippets.sqlite')
+        self.messages = {}
+
+    def _get_message(self, mid):
+        return self.messages[mid]
+
+    def _index(self, path=True, **kwargs):
+        index = snippets.SnippetIndex(self.path if path else None,
+                                      self._get_message, **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    def _request(self, index, *messages):
+        for msg in messages:
+            self.messages[msg.get_message_id()] = msg
+
+        async def request():
+            await index.request([m.get_message_id() for m in messages])
+        asyncio.run(request())
+
+    def test_unknown_message(self):
+        self.assertIsNone(self._index().get('a'))
+
+    def test_request(self):
+        index = self._index()
+        self._request(index, _message('a', 'first'), _message('b', 'second'))
+        self.assertEqual(index.get('a'), 'first')
+        self.assertEqual(index.get('b'), 'second')
+
+    def test_persisted(self):
+        self._request(self._index(), _message('a', 'first'))
+        self.assertEqual(self._index().get('a'), 'first')
+
+    def test_extracted_once(self):
+        index = self._index()
+        msg = _message('a', 'first')
+        self._request(index, msg)
+        self._request(index, msg)
+        msg.get_body_text.assert_called_once_with()
+
+    def test_unreadable_message(self):
+        index = self._index()
+        broken = _message('a', '')
+        broken.get_body_text.side_effect = OSError
+        self._request(index, broken, _message('b', 'second'))
+        self.assertEqual(index.get('a'), '')
+        self.assertEqual(index.get('b'), 'second')
+
+    def test_memory_only(self):
+        index = self._index(path=False)
+        self._request(index, _message('a', 'first'))
+        self.assertEqual(index.get('a'), 'first')
+
+    def test_encrypted_not_persisted(self):
+        index = self._index()
+        encrypted = _message('a', 'secret', ['encrypted'])
+        threads = []
+        encrypted.get_body_text.side_effect = lambda: (
+            threads.append(threading.current_thread()) or 'secret')
+        self._request(index, encrypted, _message('b', 'public'))
+        self.assertEqual(index.get('a'), 'secret')
+        # decrypting may ask for a passphrase, which the worker must not do
+        self.assertEqual(threads, [threading.main_thread()])
+        other = self._index()
+        self.assertIsNone(other.get('a'))
+        self.assertEqual(other.get('b'), 'public')
+
+    def test_limit(self):
+        index = self._index(limit=2)
+        self._request(index, _message('a', '1'), _message('b', '2'),
+                      _message('c', '3'))
+        self.assertIsNone(index.get('a'))
+        self.assertEqual(index.get('c'), '3')
+        other = self._index(limit=2)
+        self.assertIsNone(other.get('a'))
+        self.assertEqual(other.get('b'), '2')
+
+    def test_invalidate(self):
+        index = self._index()
+        self._request(index, _message('a', 'first'), _message('b', 'second'))
+        index.invalidate(['a'])
+        self.assertIsNone(index.get('a'))
+        self.assertIsNone(self._index().get('a'))
+        self.assertEqual(index.get('b'), 'second')
+        index.invalidate()
+        self.assertIsNone(index.get('b'))
+
+    def test_close(self):
+        index = snippets.SnippetIndex(self.path, self._get_message)
+        self._request(index, _message('a', 'first'))
+        index.get('a')
+        index.close()
+        index._executor.shutdown(wait=True)
+        self.assertIsNone(index._local.db)
+
+    def test_old_format_is_dropped(self):
+        self._request(self._index(), _message('a', 'first'))
+        with mock.patch.object(snippets.SnippetIndex, 'VERSION', 2):
+            self.assertIsNone(self._index().get('a'))
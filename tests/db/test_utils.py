@@ -23,7 +23,7 @@ from unittest import mock
 import gpg
 
 from alot import crypto
-from alot.db import utils
+from alot.db import signatures, utils
 from alot.errors import GPGProblem
 from alot.account import Account
 from ..utilities import make_key, make_uid, TestCaseClassCleanup
@@ -295,6 +295,22 @@ class TestDecodeHeader(unittest.TestCase):
         text = self._quote(expected, 'utf-8')
         self._test(text, expected)
 
+    def test_plain_headers_are_not_parsed_for_encoded_words(self):
+        text = 'plain\tsubject\x07 without encoded words'
+        with mock.patch('email.header.decode_header',
+                        wraps=email.header.decode_header) as decode:
+            actual = utils.decode_header(text + ' (plain)')
+        decode.assert_not_called()
+        self.assertEqual(actual, 'plain   subject without encoded words '
+                                 '(plain)')
+
+    def test_decoded_values_are_cached(self):
+        text = self._quote('cached ÄÖÜäöü', 'utf-8')
+        utils.decode_header(text)
+        with mock.patch('email.header.decode_header') as decode:
+            self.assertEqual(utils.decode_header(text), 'cached ÄÖÜäöü')
+        decode.assert_not_called()
+
 
 class TestAddSignatureHeaders(unittest.TestCase):
 
@@ -370,6 +386,109 @@ class TestAddSignatureHeaders(unittest.TestCase):
             mail.headers)
 
 
+class TestHandleSignatures(unittest.TestCase):
+
+    mail = (b'Message-ID: <signed@example.com>\n'
+            b'Content-Type: multipart/signed; boundary="b";\n'
+            b' micalg=pgp-sha256; protocol="application/pgp-signature"\n'
+            b'\n'
+            b'--b\n'
+            b'Content-Type: text/plain\n'
+            b'\n'
+            b'signed\n'
+            b'text\n'
+            b'--b\n'
+            b'Content-Type: application/pgp-signature\n'
+            b'\n'
+            b'signature\n'
+            b'--b--\n')
+
+    def setUp(self):
+        cache = mock.patch('alot.db.signatures._cache',
+                           signatures.SignatureCache())
+        cache.start()
+        self.addCleanup(cache.stop)
+        verify = mock.patch('alot.db.utils.crypto.verify_detached',
+                            side_effect=GPGProblem('bad signature', 1))
+        self.verify = verify.start()
+        self.addCleanup(verify.stop)
+
+    def test_signed_chunk_is_canonical(self):
+        utils.decrypted_message_from_bytes(self.mail)
+        self.verify.assert_called_once_with(
+            b'Content-Type: text/plain\r\n\r\nsigned\r\ntext',
+            b'signature')
+
+    def test_crlf(self):
+        utils.decrypted_message_from_bytes(self.mail.replace(b'\n', b'\r\n'))
+        self.verify.assert_called_once_with(
+            b'Content-Type: text/plain\r\n\r\nsigned\r\ntext',
+            b'signature')
+
+    def _good_signature(self):
+        self.verify.side_effect = None
+        self.verify.return_value = [mock.Mock(fpr='F00')]
+        uid = mock.Mock(uid='Alice <alice@example.com>',
+                        email='alice@example.com')
+        for name, value in (('get_key', mock.Mock(uids=[uid])),
+                            ('check_uid_validity', True)):
+            patcher = mock.patch('alot.db.utils.crypto.' + name,
+                                 return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_result_is_cached(self):
+        self._good_signature()
+        for _ in range(2):
+            m = utils.decrypted_message_from_bytes(self.mail)
+            self.assertEqual(m[utils.X_SIGNATURE_VALID_HEADER], 'True')
+            self.assertEqual(m[utils.X_SIGNATURE_MESSAGE_HEADER],
+                             'Valid: Alice <alice@example.com>')
+        self.verify.assert_called_once()
+
+    def test_failure_is_not_cached(self):
+        # the cause, like a missing key, may be gone next time
+        for _ in range(2):
+            m = utils.decrypted_message_from_bytes(self.mail)
+            self.assertEqual(m[utils.X_SIGNATURE_VALID_HEADER], 'False')
+            self.assertEqual(m[utils.X_SIGNATURE_MESSAGE_HEADER],
+                             'Invalid: bad signature')
+        self.assertEqual(self.verify.call_count, 2)
+
+    def test_deferred(self):
+        deferred = []
+        m = utils.decrypted_message_from_bytes(self.mail, None, None, deferred)
+        self.verify.assert_not_called()
+        self.assertEqual(m[utils.X_SIGNATURE_MESSAGE_HEADER], 'Pending')
+        self.assertEqual(len(deferred), 1)
+        deferred[0].verify()
+        self.verify.assert_called_once()
+        self.assertEqual(m[utils.X_SIGNATURE_MESSAGE_HEADER], 'Pending')
+        deferred[0].apply()
+        self.verify.assert_called_once()
+        self.assertEqual(m.get_all(utils.X_SIGNATURE_VALID_HEADER), ['False'])
+        self.assertEqual(m.get_all(utils.X_SIGNATURE_MESSAGE_HEADER),
+                         ['Invalid: bad signature'])
+
+    def test_deferred_cached(self):
+        self._good_signature()
+        utils.decrypted_message_from_bytes(self.mail)
+        deferred = []
+        m = utils.decrypted_message_from_bytes(self.mail, None, None, deferred)
+        self.assertEqual(deferred, [])
+        self.assertEqual(m[utils.X_SIGNATURE_MESSAGE_HEADER],
+                         'Valid: Alice <alice@example.com>')
+        self.verify.assert_called_once()
+
+    def test_unexpected_number_of_chunks(self):
+        # not a delimiter for the parser, but it does contain the boundary
+        mail = self.mail.replace(b'text\n', b'text\n--bx\n')
+        m = utils.decrypted_message_from_bytes(mail)
+        self.assertIn('unexpected number of multipart chunks',
+                      m[utils.X_SIGNATURE_MESSAGE_HEADER])
+        self.verify.assert_not_called()
+
+
 class TestMessageFromFile(TestCaseClassCleanup):
 
     @classmethod
@@ -561,6 +680,22 @@ class TestMessageFromFile(TestCaseClassCleanup):
         self.assertIn(
             'ambig <ambig@example.com>', m[utils.X_SIGNATURE_MESSAGE_HEADER])
 
+    def test_encrypted_session_key_is_returned(self):
+        m = self._make_encrypted()
+        session_keys = []
+        utils.decrypted_message_from_bytes(m.as_bytes(), None, session_keys)
+        self.assertEqual(len(session_keys), 1)
+
+    def test_encrypted_with_session_key(self):
+        m = self._make_encrypted().as_bytes()
+        session_keys = []
+        utils.decrypted_message_from_bytes(m, None, session_keys)
+        new_session_keys = []
+        m = utils.decrypted_message_from_bytes(m, session_keys,
+                                               new_session_keys)
+        self.assertIn('This is some text', [n.get_payload() for n in m.walk()])
+        self.assertEqual(new_session_keys, [])
+
     # TODO: tests for the RFC 2440 style combined signed/encrypted blob
 
     def test_encrypted_wrong_mimetype_first_payload(self):
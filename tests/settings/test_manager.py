@@ -4,6 +4,7 @@
 
 """Test suite for alot.settings.manager module."""
 
+import datetime
 import os
 import re
 import tempfile
@@ -197,6 +198,86 @@ class TestSettingsManager(unittest.TestCase):
         manager.read_config(f.name)
         self.assertEqual(manager.get_tagstring_representation(tag)['translated'], translated_goal)
 
+    def test_tagstring_representation_is_memoised(self):
+        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+            f.write(textwrap.dedent("""\
+                [tags]
+                    [[foo.*]]
+                        translated = matched
+                """))
+        self.addCleanup(os.unlink, f.name)
+        manager = SettingsManager()
+        manager.read_config(f.name)
+        first = manager.get_tagstring_representation('foobar')
+        with mock.patch('alot.settings.manager.resolve_att') as resolve:
+            second = manager.get_tagstring_representation('foobar')
+        resolve.assert_not_called()
+        self.assertIs(first, second)
+        self.assertEqual(second['translated'], 'matched')
+
+    def test_tagstring_representations_are_reset_on_reload(self):
+        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as f:
+            f.write(textwrap.dedent("""\
+                [tags]
+                    [[foo]]
+                        translated = first
+                """))
+        self.addCleanup(os.unlink, f.name)
+        manager = SettingsManager()
+        manager.read_config(f.name)
+        manager.get_tagstring_representation('foo')
+        with open(f.name, 'w') as f:
+            f.write(textwrap.dedent("""\
+                [tags]
+                    [[foo]]
+                        translated = second
+                """))
+        manager.read_config(f.name)
+        self.assertEqual(
+            manager.get_tagstring_representation('foo')['translated'],
+            'second')
+
+
+class TestSettingsManagerRepresentDatetime(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = SettingsManager()
+        self.hook = mock.Mock(side_effect=lambda d: d.isoformat())
+        self.manager.hooks = mock.Mock(timestamp_format=self.hook)
+        self.now = datetime.datetime(2020, 5, 4, 12, 30, 10)
+        patcher = mock.patch('alot.settings.manager.datetime')
+        self.datetime = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.datetime.now.side_effect = lambda: self.now
+
+    def test_representation_is_reused(self):
+        d = datetime.datetime(2020, 5, 4, 12, 0)
+        first = self.manager.represent_datetime(d)
+        self.now += datetime.timedelta(seconds=20)
+        self.assertEqual(self.manager.represent_datetime(d), first)
+        self.hook.assert_called_once_with(d)
+
+    def test_representation_expires_with_the_minute(self):
+        d = datetime.datetime(2020, 5, 4, 12, 0)
+        self.manager.represent_datetime(d)
+        self.now += datetime.timedelta(minutes=1)
+        self.manager.represent_datetime(d)
+        self.assertEqual(self.hook.call_count, 2)
+
+    def test_old_dates_expire_with_the_day(self):
+        self.manager.hooks = None
+        d = datetime.datetime(2020, 3, 1, 12, 0)
+        with mock.patch('alot.settings.manager.pretty_datetime',
+                        return_value='Mar 01') as pretty:
+            self.manager.represent_datetime(d)
+            self.now += datetime.timedelta(minutes=10)
+            self.manager.represent_datetime(d)
+            pretty.assert_called_once_with(d)
+            self.now += datetime.timedelta(days=1)
+            self.manager.represent_datetime(d)
+            self.assertEqual(pretty.call_count, 2)
+
+
 class TestSettingsManagerExpandEnvironment(unittest.TestCase):
     """ Tests SettingsManager._expand_config_values """
     setting_name = 'template_dir'
@@ -3,6 +3,7 @@
 # For further details see the COPYING file
 
 import unittest
+from unittest import mock
 
 from alot.settings import theme
 
@@ -86,3 +87,61 @@ class TestThemeGetAttribute(unittest.TestCase):
     def test_invalid_colorindex_raises_value_error(self):
         with self.assertRaises(ValueError):
             self.theme.get_attribute(0, 'global', 'body')
+
+
+class TestThemeGetThreadlineTheming(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rules = """\
+        parts = subject,
+        [[[subject]]]
+            focus = '', '', '', '', '', ''
+            normal = '', '', '', '', '', ''
+    [[threadline_query]]
+        query = 'tag:flagged'
+        normal = 'default', 'default', 'default', 'default', 'dark red', ''
+    [[threadline_unread]]
+        tagged_with = unread
+        normal = 'default', 'default', 'default', 'default', 'white', ''
+"""
+        threadline = "        normal = '', '', '', '', '', ''\n"
+        config = DUMMY_THEME.replace(threadline, threadline + rules, 1)
+        cls.theme = theme.Theme(config.splitlines())
+
+    def _thread(self, tags):
+        thread = mock.Mock()
+        thread.get_tags.return_value = set(tags)
+        return thread
+
+    def test_tag_rules_use_thread_tags(self):
+        thread = self._thread(['unread'])
+        matches = mock.Mock(return_value=False)
+        res = self.theme.get_threadline_theming(thread, 256, matches)
+        self.assertEqual(res['normal'].foreground, 'white')
+        matches.assert_called_once_with(thread, 'tag:flagged')
+        thread.matches.assert_not_called()
+
+    def test_query_rules_use_matches_callback(self):
+        thread = self._thread(['unread'])
+        res = self.theme.get_threadline_theming(
+            thread, 256, lambda t, q: q == 'tag:flagged')
+        self.assertEqual(res['normal'].foreground, 'dark red')
+
+    def test_query_rules_default_to_thread_matches(self):
+        thread = self._thread([])
+        thread.matches.return_value = True
+        res = self.theme.get_threadline_theming(thread, 256)
+        thread.matches.assert_called_once_with('tag:flagged')
+        self.assertEqual(res['normal'].foreground, 'dark red')
+
+    def test_theming_is_shared_between_threads(self):
+        first = self.theme.get_threadline_theming(
+            self._thread(['unread']), 256, lambda t, q: False)
+        second = self.theme.get_threadline_theming(
+            self._thread(['unread', 'inbox']), 256, lambda t, q: False)
+        self.assertIs(first, second)
+
+    def test_get_threadline_queries(self):
+        self.assertListEqual(self.theme.get_threadline_queries(),
+                             ['tag:flagged'])
@@ -15,8 +15,15 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import asyncio
+import fcntl
+import json
 import logging
+import mailbox
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 from alot import account
 
@@ -185,3 +192,159 @@ class TestSend(unittest.TestCase):
         with self.assertRaises(account.SendingMailFailed):
             with self.assertLogs(level=logging.ERROR):
                 await a.send_mail("some text")
+
+
+class _OutboxAccount(account.Account):
+    """Records the mails sent and fails as often as told to."""
+
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(address='test@alot.dev', **kwargs)
+        self.failures = failures
+        self.sent = []
+        self.active = 0
+        self.max_active = 0
+
+    async def send_mail(self, mail):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0)
+        self.active -= 1
+        if self.failures:
+            self.failures -= 1
+            raise account.SendingMailFailed('try again')
+        self.sent.append(mail)
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+        self.sent = mock.AsyncMock()
+        self.failed = mock.Mock()
+        self.outbox = account.Outbox(self.path, retries=2, retry_delay=0,
+                                     sent=self.sent, failed=self.failed)
+
+    @utilities.async_test
+    async def test_send(self):
+        acct = _OutboxAccount()
+        task = self.outbox.enqueue(acct, 'mail', ['foo'])
+        self.assertEqual(self.outbox.status(), 'outbox: 1 queued')
+        await task
+        self.assertEqual(acct.sent, ['mail'])
+        self.sent.assert_awaited_once_with(acct, 'mail', ['foo'])
+        self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual(self.outbox.status(), '')
+
+    @utilities.async_test
+    async def test_retry(self):
+        acct = _OutboxAccount(failures=2)
+        await self.outbox.enqueue(acct, 'mail')
+        self.assertEqual(acct.sent, ['mail'])
+        self.failed.assert_not_called()
+
+    @utilities.async_test
+    async def test_give_up(self):
+        acct = _OutboxAccount(failures=3)
+        afterwards = mock.Mock()
+        with self.assertLogs(level=logging.WARNING):
+            await self.outbox.enqueue(acct, 'mail', afterwards=afterwards)
+        self.failed.assert_called_once_with(acct, mock.ANY)
+        afterwards.assert_not_called()
+        self.assertEqual(len(os.listdir(self.path)), 1)
+        self.assertEqual(self.outbox.status(), 'outbox: 0 queued, 1 failed')
+
+    @utilities.async_test
+    async def test_concurrency(self):
+        acct = _OutboxAccount(send_concurrency=2)
+        await asyncio.gather(*(self.outbox.enqueue(acct, str(i))
+                               for i in range(5)))
+        self.assertEqual(sorted(acct.sent), ['0', '1', '2', '3', '4'])
+        self.assertEqual(acct.max_active, 2)
+
+    @utilities.async_test
+    async def test_resume(self):
+        with open(os.path.join(self.path, 'left.json'), 'w') as f:
+            json.dump({'account': 'test@alot.dev', 'mail': 'mail',
+                       'tags': ['foo']}, f)
+        acct = _OutboxAccount()
+        lookup = mock.Mock(return_value=acct)
+        await self.outbox.resume(lookup)
+        await asyncio.gather(*self.outbox._tasks.values())
+        lookup.assert_called_once_with('test@alot.dev')
+        self.assertEqual(acct.sent, ['mail'])
+        self.sent.assert_awaited_once_with(acct, 'mail', ['foo'])
+
+    @utilities.async_test
+    async def test_resume_skips_claimed(self):
+        path = os.path.join(self.path, 'left.json')
+        with open(path, 'w') as f:
+            json.dump({'account': 'test@alot.dev', 'mail': 'mail',
+                       'tags': []}, f)
+        lookup = mock.Mock(return_value=_OutboxAccount())
+        with open(path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            await self.outbox.resume(lookup)
+        lookup.assert_not_called()
+        self.assertEqual(self.outbox.status(), '')
+
+    @utilities.async_test
+    async def test_unexpected_error(self):
+        acct = _OutboxAccount()
+        acct.send_mail = mock.AsyncMock(side_effect=RuntimeError('oops'))
+        with self.assertLogs(level=logging.ERROR):
+            await self.outbox.enqueue(acct, 'mail')
+        acct.send_mail.assert_awaited_once_with('mail')
+        self.failed.assert_called_once_with(acct, mock.ANY)
+        self.assertEqual(self.outbox.status(), 'outbox: 0 queued, 1 failed')
+        # the mail can be claimed again to be retried
+        name = os.path.splitext(os.listdir(self.path)[0])[0]
+        claim = self.outbox._claim(name)
+        self.assertIsNotNone(claim)
+        claim.close()
+
+
+class TestStoreMails(unittest.TestCase):
+
+    mails = ['Subject: one\n\nfirst\n', 'Subject: two\n\nsecond\n']
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_maildir(self):
+        mbx = mailbox.Maildir(os.path.join(self.tmp, 'sent'))
+        paths = account.Account.store_mails(mbx, self.mails)
+        self.assertEqual(len(set(paths)), 2)
+        for path, mail in zip(paths, self.mails):
+            self.assertEqual(os.path.dirname(path),
+                             os.path.join(self.tmp, 'sent', 'new'))
+            self.assertTrue(path.endswith(':2,S'))
+            with open(path) as f:
+                self.assertEqual(f.read(), mail)
+        self.assertEqual(os.listdir(os.path.join(self.tmp, 'sent', 'tmp')),
+                         [])
+        self.assertEqual(sorted(m['Subject'] for m in mbx), ['one', 'two'])
+        self.assertTrue(all(m.get_flags() == 'S' for m in mbx))
+
+    def test_store_mail(self):
+        mbx = mailbox.Maildir(os.path.join(self.tmp, 'sent'))
+        path = account.Account.store_mail(mbx, self.mails[0])
+        self.assertTrue(os.path.isfile(path))
+
+    def test_mbox(self):
+        mbx = mailbox.mbox(os.path.join(self.tmp, 'sent.mbox'))
+        self.assertEqual(account.Account.store_mails(mbx, self.mails),
+                         [None, None])
+        self.assertEqual([m['Subject'] for m in mailbox.mbox(mbx._path)],
+                         ['one', 'two'])
+
+    def test_error(self):
+        mbx = mailbox.Maildir(os.path.join(self.tmp, 'sent'))
+        os.rmdir(os.path.join(self.tmp, 'sent', 'new'))
+        with self.assertRaises(account.StoreMailError):
+            account.Account.store_mails(mbx, self.mails)
+        self.assertEqual(os.listdir(os.path.join(self.tmp, 'sent', 'tmp')),
+                         [])
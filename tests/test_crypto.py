@@ -336,7 +336,7 @@ class TestGetKey(unittest.TestCase):
         invalid_key = utilities.make_key(invalid=True)
         valid_key = utilities.make_key()
 
-        with mock.patch('alot.crypto.gpg.core.Context',
+        with mock.patch('alot.crypto.keyring.context',
                         mock.Mock(return_value=self._context_mock())), \
                 mock.patch('alot.crypto.list_keys',
                            mock.Mock(return_value=[valid_key, invalid_key])):
@@ -344,7 +344,7 @@ class TestGetKey(unittest.TestCase):
         self.assertIs(key, valid_key)
 
     def test_ambiguous_two_valid(self):
-        with mock.patch('alot.crypto.gpg.core.Context',
+        with mock.patch('alot.crypto.keyring.context',
                         mock.Mock(return_value=self._context_mock())), \
                 mock.patch('alot.crypto.list_keys',
                            mock.Mock(return_value=[utilities.make_key(),
@@ -354,7 +354,7 @@ class TestGetKey(unittest.TestCase):
         self.assertEqual(cm.exception.code, GPGCode.AMBIGUOUS_NAME)
 
     def test_ambiguous_no_valid(self):
-        with mock.patch('alot.crypto.gpg.core.Context',
+        with mock.patch('alot.crypto.keyring.context',
                         mock.Mock(return_value=self._context_mock())), \
                 mock.patch('alot.crypto.list_keys',
                            mock.Mock(return_value=[
@@ -364,6 +364,19 @@ class TestGetKey(unittest.TestCase):
                 crypto.get_key('placeholder')
         self.assertEqual(cm.exception.code, GPGCode.NOT_FOUND)
 
+    def test_ambiguous_address_is_left_to_gpgme(self):
+        cached = utilities.make_key()
+        with mock.patch('alot.crypto.keyring.lookup',
+                        mock.Mock(return_value=[cached])), \
+                mock.patch('alot.crypto.keyring.context',
+                           mock.Mock(return_value=self._context_mock())), \
+                mock.patch('alot.crypto.list_keys',
+                           mock.Mock(return_value=[utilities.make_key(),
+                                                   cached])):
+            with self.assertRaises(crypto.GPGProblem) as cm:
+                crypto.get_key('alice@example.com')
+        self.assertEqual(cm.exception.code, GPGCode.AMBIGUOUS_NAME)
+
 
 class TestEncrypt(unittest.TestCase):
 
@@ -18,6 +18,7 @@
 """Test suite for alot.helper module."""
 
 import datetime
+import doctest
 import errno
 import os
 import random
@@ -185,6 +186,74 @@ class TestStringSanitize(unittest.TestCase):
         actual = helper.string_sanitize(base)
         self.assertEqual(actual, expected)
 
+    def test_lone_escape_character(self):
+        base = 'foo\x7f\x1b\x1b[31mbar\x1b'
+        expected = 'foo\x1b[31mbar'
+        actual = helper.string_sanitize(base)
+        self.assertEqual(actual, expected)
+
+    def test_doctests(self):
+        finder = doctest.DocTestFinder()
+        runner = doctest.DocTestRunner()
+        for test in finder.find(helper.string_sanitize, 'string_sanitize',
+                                globs={'string_sanitize':
+                                       helper.string_sanitize}):
+            runner.run(test)
+        results = runner.summarize(verbose=False)
+        self.assertGreater(results.attempted, 0)
+        self.assertEqual(results.failed, 0)
+
+    def test_fuzz_corpus(self):
+        # compare against the straightforward character by character
+        # implementation on random strings made of the interesting characters
+        alphabet = list('ab \t\n\r\x1b[m0;:?/ !-A\x07\x00\x7f\x85\xa0é€') + [
+            '\u0378', '\ue000', '\U0010fffd', '\U0001f600', '\u2028']
+        rand = random.Random(42)
+        for _ in range(5000):
+            base = ''.join(rand.choice(alphabet)
+                           for _ in range(rand.randint(0, 40)))
+            tab_width = rand.choice([1, 4, 8])
+            self.assertEqual(helper.string_sanitize(base, tab_width),
+                             _reference_string_sanitize(base, tab_width),
+                             repr(base))
+
+
+def _reference_string_sanitize(string, tab_width):
+    """the original, slow implementation of helper.string_sanitize"""
+    preprocessed_string = ''
+    i = 0
+    while i < len(string):
+        if string[i:i + 2] == '\x1b[':
+            j = i + 2
+            for skip_chars in ('0123456789:;<=>?', ' !"#$%&\'()*+,-./'):
+                while j < len(string) and string[j] in skip_chars:
+                    j += 1
+            if j < len(string) and string[j] == 'm':
+                preprocessed_string += string[i:j + 1]
+            i = j + 1
+            continue
+        if helper.unicode_printable(string[i]):
+            preprocessed_string += string[i]
+        i += 1
+
+    lines = list()
+    for line in preprocessed_string.split('\n'):
+        tab_count = line.count('\t')
+        if tab_count > 0:
+            line_length = 0
+            new_line = list()
+            for i, chunk in enumerate(line.split('\t')):
+                line_length += len(chunk)
+                new_line.append(chunk)
+                if i < tab_count:
+                    next_tab_stop_in = tab_width - (line_length % tab_width)
+                    new_line.append(' ' * next_tab_stop_in)
+                    line_length += next_tab_stop_in
+            lines.append(''.join(new_line))
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
 
 class TestStringDecode(unittest.TestCase):
 
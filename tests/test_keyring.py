@@ -0,0 +1,116 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from alot import keyring
+
+
+def _key(fpr, *uids, expires=0):
+    """a mock of a gpg key with one subkey"""
+    subkey = mock.Mock(fpr=fpr, keyid=fpr[-16:], expires=expires)
+    key = mock.Mock(fpr=fpr, subkeys=[subkey])
+    key.uids = [mock.Mock(uid='{} <{}>'.format(name, email), email=email)
+                for name, email in uids]
+    return key
+
+
+FPR = '9C8A4B5E0E2C25D2F4E2C0A7A39C6A2C3E5A1B7D'
+ALICE = _key(FPR, ('Alice', 'alice@example.com'),
+             ('Alice Work', 'alice@example.com'))
+BOB = _key('0123456789ABCDEF0123456789ABCDEF01234567',
+           ('Bob', 'Bob@Example.org'))
+
+
+class TestIsKeyId(unittest.TestCase):
+
+    def test_fingerprints_and_long_key_ids(self):
+        self.assertTrue(keyring.is_key_id(FPR))
+        self.assertTrue(keyring.is_key_id('0x' + FPR[-16:].lower()))
+
+    def test_other_terms(self):
+        self.assertFalse(keyring.is_key_id(FPR[-8:]))
+        self.assertFalse(keyring.is_key_id('alice@example.com'))
+        self.assertFalse(keyring.is_key_id('Alice'))
+
+
+class TestKeyring(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.addCleanup(self.home.cleanup)
+        self.pubring = os.path.join(self.home.name, 'pubring.kbx')
+        with open(self.pubring, 'w'):
+            pass
+        env = mock.patch.dict(os.environ, {'GNUPGHOME': self.home.name})
+        env.start()
+        self.addCleanup(env.stop)
+        context = mock.patch('alot.keyring.gpg.core.Context')
+        self.context = context.start()
+        self.addCleanup(context.stop)
+        self.keylist = self.context.return_value.keylist
+        self.keylist.side_effect = lambda *a: iter([ALICE, BOB])
+        self.keyring = keyring.Keyring()
+
+    def test_keys(self):
+        self.assertEqual(self.keyring.keys(), [ALICE, BOB])
+
+    def test_lookup_fingerprint(self):
+        self.assertEqual(self.keyring.lookup(FPR.lower()), [ALICE])
+
+    def test_lookup_keyid(self):
+        self.assertEqual(self.keyring.lookup('0x' + FPR[-16:]), [ALICE])
+        self.assertEqual(self.keyring.lookup(FPR[-8:]), [ALICE])
+
+    def test_lookup_other_terms(self):
+        # gpgme matches these against parts of user ids
+        self.assertEqual(self.keyring.lookup('alice'), [])
+        self.assertEqual(self.keyring.lookup('bob@example.org'), [])
+        self.assertEqual(self.keyring.lookup('Alice <alice@example.com>'), [])
+        self.keylist.assert_not_called()
+
+    def test_context_is_reused_by_thread(self):
+        self.assertIs(self.keyring.context(), self.keyring.context())
+        self.assertEqual(self.context.call_count, 1)
+        thread = threading.Thread(target=self.keyring.context)
+        thread.start()
+        thread.join()
+        self.assertEqual(self.context.call_count, 2)
+
+    def test_keys_are_cached(self):
+        self.keyring.keys()
+        self.keyring.lookup(FPR)
+        self.keyring.lookup(FPR[-8:])
+        self.assertEqual(self.keylist.call_count, 1)
+
+    def test_cache_is_invalidated_by_keyring_changes(self):
+        self.keyring.keys()
+        stat = os.stat(self.pubring)
+        os.utime(self.pubring, ns=(stat.st_atime_ns,
+                                   stat.st_mtime_ns + 10 ** 9))
+        self.keyring.keys()
+        self.assertEqual(self.keylist.call_count, 2)
+
+    def test_cache_is_invalidated_by_expiry(self):
+        expiring = _key('FEDCBA9876543210FEDCBA9876543210FEDCBA98',
+                        ('Carol', 'carol@example.net'),
+                        expires=int(time.time()) + 60)
+        self.keylist.side_effect = lambda *a: iter([ALICE, expiring])
+        self.keyring.keys()
+        self.keyring.keys()
+        self.assertEqual(self.keylist.call_count, 1)
+        with mock.patch('alot.keyring.time.time',
+                        mock.Mock(return_value=expiring.subkeys[0].expires)):
+            self.keyring.keys()
+        self.assertEqual(self.keylist.call_count, 2)
+
+    def test_private_keys_are_cached_separately(self):
+        self.keyring.keys()
+        self.keyring.keys(private=True)
+        self.assertEqual([c.args for c in self.keylist.call_args_list],
+                         [(None, False), (None, True)])
@@ -0,0 +1,116 @@
+# Copyright (C) 2011-2018  Patrick Totzke <patricktotzke@gmail.com>
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.widgets.search module."""
+
+import unittest
+from unittest import mock
+
+from alot.widgets import search
+
+
+def _structure():
+    part = {'width': ('fit', 0, 0), 'alignment': 'left',
+            'normal': None, 'focus': None}
+    return {'normal': None, 'focus': None, 'parts': ['subject'],
+            'subject': part}
+
+
+class TestThreadlineWidget(unittest.TestCase):
+
+    def setUp(self):
+        thread = mock.Mock()
+        thread.get_subject.return_value = 'a subject'
+        dbman = mock.Mock()
+        dbman.get_thread.return_value = thread
+        patcher = mock.patch(
+            'alot.widgets.search.settings.get_threadline_theming',
+            lambda *_: _structure())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dbman = dbman
+        self.widget = search.ThreadlineWidget('tid', dbman)
+
+    def test_render_reuses_canvas(self):
+        first = self.widget.render((20,), False)
+        with mock.patch.object(self.widget.widgets[0], 'set_map') as set_map:
+            second = self.widget.render((20,), False)
+        set_map.assert_not_called()
+        self.assertIs(first, second)
+
+    def test_render_is_cached_per_focus_and_size(self):
+        normal = self.widget.render((20,), False)
+        self.assertIsNot(normal, self.widget.render((20,), True))
+        self.assertIsNot(normal, self.widget.render((30,), False))
+
+    def test_only_last_size_is_cached(self):
+        self.widget.render((20,), False)
+        self.widget.render((30,), False)
+        self.widget.render((20,), True)
+        self.assertEqual(len(self.widget._canvases), 2)
+        self.assertEqual(self.widget._canvases[False][0], (30,))
+
+    def test_invalidate_drops_cache(self):
+        before = self.widget.render((20,), False)
+        self.widget._invalidate()
+        self.assertIsNot(before, self.widget.render((20,), False))
+
+    def test_rebuild_invalidates_cache(self):
+        before = self.widget.render((20,), False)
+        self.widget.rebuild()
+        self.assertIsNot(before, self.widget.render((20,), False))
+
+    def test_content_from_message_ids(self):
+        structure = _structure()
+        structure['parts'] = ['content']
+        structure['content'] = structure['subject']
+        self.dbman.get_message_ids.return_value = ['new', 'old']
+        self.dbman.snippets.get.side_effect = {'new': 'hello'}.get
+        with mock.patch(
+                'alot.widgets.search.settings.get_threadline_theming',
+                lambda *_: structure):
+            search.ThreadlineWidget('tid', self.dbman)
+        self.dbman.get_message_ids.assert_called_with(
+            'thread:tid', sort='newest_first')
+        self.dbman.snippets.request.assert_called_with(['old'])
+        self.dbman.get_thread.return_value.get_messages.assert_not_called()
+
+    def test_marked(self):
+        marked = {'tid'}
+        widget = search.ThreadlineWidget('tid', self.dbman,
+                                         is_marked=marked.__contains__)
+        mark = search.MARK.encode()
+        self.assertTrue(widget.render((20,), False).text[0].startswith(mark))
+        marked.clear()
+        widget.rebuild()
+        self.assertFalse(widget.render((20,), False).text[0].startswith(mark))
+
+
+class TestPrepareContentString(unittest.TestCase):
+
+    @staticmethod
+    def _thread(*bodies):
+        messages = {}
+        for i, body in enumerate(bodies):
+            msg = mock.Mock()
+            msg.get_message_id.return_value = str(i)
+            msg.get_date.return_value = i
+            msg.get_body_text.return_value = body
+            messages[msg] = []
+        thread = mock.Mock()
+        thread.get_messages.return_value = messages
+        return thread
+
+    def test_newest_first(self):
+        thread = self._thread('older', 'newer')
+        self.assertEqual(search.prepare_content_string(thread), 'newer older')
+
+    def test_placeholder(self):
+        thread = self._thread('older', 'newer')
+        index = mock.Mock()
+        index.get.side_effect = {'1': 'newer'}.get
+        self.assertEqual(
+            search.prepare_content_string(thread, index, ['1', '0']),
+            'newer ' + search.SNIPPET_PLACEHOLDER)
+        thread.get_messages.assert_not_called()
@@ -0,0 +1,133 @@
+# This file is released under the GNU GPL, version 3 or a later revision.
+# For further details see the COPYING file
+
+"""Tests for the alot.widgets.thread module."""
+
+import unittest
+from unittest import mock
+
+import urwid
+
+from alot.widgets import thread
+
+
+class TestThreadTree(unittest.TestCase):
+
+    def setUp(self):
+        # a
+        # ├─ b
+        # │  └─ c
+        # └─ d
+        # e
+        self.thread = mock.Mock()
+        self.thread.get_structure.return_value = (
+            ['a', 'e'], {'a': ['b', 'd'], 'b': ['c'], 'c': [], 'd': [],
+                         'e': []})
+        patcher = mock.patch('alot.widgets.thread.MessageTree')
+        self.MessageTree = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tree = thread.ThreadTree(self.thread)
+
+    def test_structure(self):
+        self.assertEqual(self.tree.root, 'a')
+        self.assertEqual(list(self.tree.positions()),
+                         ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(self.tree.parent_position('c'), 'b')
+        self.assertEqual(self.tree.next_sibling_position('b'), 'd')
+        self.assertEqual(self.tree.prev_sibling_position('e'), 'a')
+        self.assertEqual(self.tree.last_child_position('a'), 'd')
+
+    def test_no_messages_loaded_upfront(self):
+        self.thread.get_message.assert_not_called()
+        self.MessageTree.assert_not_called()
+        self.assertFalse(self.tree.is_loaded('a'))
+
+    def test_load_on_access(self):
+        mt = self.tree['c']
+        self.thread.get_message.assert_called_once_with('c')
+        self.MessageTree.assert_called_once_with(
+            self.thread.get_message.return_value, True, None)
+        self.assertTrue(self.tree.is_loaded('c'))
+        self.assertFalse(self.tree.is_loaded('b'))
+        self.assertIs(self.tree['c'], mt)
+        self.assertEqual(self.MessageTree.call_count, 1)
+
+    def test_alternating_lines(self):
+        self.tree['d']
+        self.MessageTree.assert_called_once_with(mock.ANY, False, None)
+
+    def test_verified_callback(self):
+        verified = mock.Mock()
+        thread.ThreadTree(self.thread, verified=verified)['a']
+        self.MessageTree.assert_called_once_with(mock.ANY, True, verified)
+
+    def test_unknown_position(self):
+        self.assertIsNone(self.tree['x'])
+        self.assertIsNone(self.tree[None])
+        self.thread.get_message.assert_not_called()
+
+    def test_reuse_messagetrees(self):
+        kept, removed = mock.Mock(), mock.Mock()
+        tree = thread.ThreadTree(self.thread, {'d': kept, 'x': removed})
+        kept.update.assert_called_once_with(False)
+        removed.update.assert_not_called()
+        self.assertIs(tree['d'], kept)
+        self.assertEqual(tree.loaded_messagetrees(), {'d': kept})
+        self.MessageTree.assert_not_called()
+
+
+class TestTextlinesList(unittest.TestCase):
+
+    attr = urwid.AttrSpec('default', 'default')
+
+    def setUp(self):
+        patcher = mock.patch('alot.widgets.thread.settings.get',
+                             mock.Mock(return_value=True))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _lines(tree):
+        return [tree[pos]._w.base_widget.text for pos in tree.positions()]
+
+    def test_lines(self):
+        for content in ['', 'one line', 'trailing\n', '\n', 'a\n\nb',
+                        'crlf\r\nand\rcr', 'form\x0cfeed separator',
+                        'cr at end\r', '\r\n\r\n', 'next\x85line']:
+            with self.subTest(content=content):
+                tree = thread.TextlinesList(content, self.attr, self.attr)
+                self.assertEqual(self._lines(tree), content.splitlines())
+
+    def test_not_linewise(self):
+        with mock.patch('alot.widgets.thread.settings.get',
+                        mock.Mock(return_value=False)):
+            tree = thread.TextlinesList('a\nb', self.attr, self.attr)
+        self.assertEqual(self._lines(tree), ['a\nb'])
+
+    def test_positions(self):
+        tree = thread.TextlinesList('a\nb\nc', self.attr, self.attr)
+        self.assertEqual(tree.root, (0,))
+        self.assertEqual(tree.next_sibling_position((2,)), None)
+        self.assertEqual(tree.prev_sibling_position((0,)), None)
+        self.assertEqual(tree.last_sibling_position((0,)), (2,))
+        self.assertEqual(list(tree.positions(reverse=True)),
+                         [(2,), (1,), (0,)])
+        self.assertIsNone(tree[(3,)])
+
+    def test_widgets_created_on_demand(self):
+        content = '\n'.join(str(i) for i in range(100000))
+        with mock.patch('alot.widgets.thread.ANSIText') as ANSIText:
+            tree = thread.TextlinesList(content)
+            ANSIText.assert_not_called()
+            tree[(4711,)]
+            ANSIText.assert_called_once_with('4711', None, None, mock.ANY)
+
+    def test_widgets_cached(self):
+        tree = thread.TextlinesList('\n'.join('x' * 1000), self.attr,
+                                    self.attr)
+        widget = tree[(0,)]
+        self.assertIs(tree[(0,)], widget)
+        for i in range(1, 1000):
+            tree[(i,)]
+        self.assertLessEqual(len(tree._widgets), tree.CACHE_SIZE)
+        self.assertEqual(tree[(0,)]._w.base_widget.text, 'x')